@@ -0,0 +1,229 @@
+"""
+Partitioned, resumable historical backfill of the Access checkinout table.
+Uploads checktime ranges in parallel, each with its own checkpoint in a JSON state file.
+"""
+
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+from access_paging import iter_checkinout, DEFAULT_PAGE_SIZE
+
+DEFAULT_STATE_FILE = "backfill_state.json"
+DEFAULT_PARTITION_MONTHS = 1
+DEFAULT_WORKERS = 4
+DEFAULT_BATCH_SIZE = 1000
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def _to_text(value):
+    return value.strftime(TIMESTAMP_FORMAT) if isinstance(value, datetime) else value
+
+
+def _to_datetime(value):
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+def add_months(moment, months):
+    month_index = moment.year * 12 + moment.month - 1 + months
+    return moment.replace(year=month_index // 12, month=month_index % 12 + 1, day=1)
+
+
+def plan_partitions(first, last, months=DEFAULT_PARTITION_MONTHS):
+    """Half-open [start, end) ranges of `months` calendar months covering first..last"""
+    start = datetime(first.year, first.month, 1)
+    partitions = []
+    while start <= last:
+        end = add_months(start, months)
+        partitions.append({
+            "start": _to_text(start),
+            "end": _to_text(end),
+            "last_timestamp": None,
+            "last_sn": None,
+            "uploaded": 0,
+            "done": False,
+        })
+        start = end
+    return partitions
+
+
+class BackfillState(object):
+    """Partition plan and per-partition checkpoints, saved atomically to JSON"""
+
+    def __init__(self, path=DEFAULT_STATE_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self.data = None
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.data = json.load(f)
+        except FileNotFoundError:
+            self.data = None
+        return self.data
+
+    def create(self, partitions):
+        self.data = {"created": _to_text(datetime.now()), "completed": False, "partitions": partitions}
+        self.save()
+
+    def save(self):
+        with self._lock:
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.data, f, indent=2)
+            os.replace(tmp_path, self.path)
+
+    def checkpoint(self, partition, last_record, uploaded):
+        with self._lock:
+            partition["last_timestamp"] = _to_text(last_record[1])
+            partition["last_sn"] = None if last_record[6] is None else str(last_record[6])
+            partition["uploaded"] += uploaded
+        self.save()
+
+    def finish(self, partition):
+        with self._lock:
+            partition["done"] = True
+        self.save()
+
+    def pending(self):
+        return [p for p in self.data["partitions"] if not p["done"]]
+
+    def final_watermark(self):
+        """Newest checkpoint across all partitions, or None if nothing was uploaded"""
+        keys = [(_to_datetime(p["last_timestamp"]), p["last_sn"])
+                for p in self.data["partitions"] if p["last_timestamp"]]
+        if not keys:
+            return None
+        return max(keys, key=lambda key: (key[0], key[1] is not None, key[1] or ""))
+
+
+class Backfill(object):
+    """
+    Runs the backfill.
+
+    connect_fn()        - opens a new Access (pyodbc) connection; one per worker
+    upload_fn(records)  - uploads and commits a batch, raising on failure
+    """
+
+    def __init__(self, connect_fn, upload_fn, state_file=DEFAULT_STATE_FILE, partition_months=DEFAULT_PARTITION_MONTHS,
+                 workers=DEFAULT_WORKERS, batch_size=DEFAULT_BATCH_SIZE, page_size=DEFAULT_PAGE_SIZE, logger=None):
+        self.connect_fn = connect_fn
+        self.upload_fn = upload_fn
+        self.state = BackfillState(state_file)
+        self.partition_months = max(1, int(partition_months))
+        self.workers = max(1, int(workers))
+        self.batch_size = max(1, int(batch_size))
+        self.page_size = page_size
+        self.logger = logger or print
+        self._stop = threading.Event()
+
+    def log(self, message):
+        self.logger(message)
+
+    def stop(self):
+        self._stop.set()
+
+    def _plan(self):
+        if self.state.load():
+            done = len(self.state.data["partitions"]) - len(self.state.pending())
+            self.log(f"Resuming backfill from {self.state.path}: {done}/{len(self.state.data['partitions'])} partitions done")
+            return True
+
+        conn = self.connect_fn()
+        if not conn:
+            return False
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT MIN(checktime), MAX(checktime) FROM checkinout")
+            first, last = cursor.fetchone()
+        finally:
+            conn.close()
+
+        if first is None:
+            self.log("checkinout is empty; nothing to backfill")
+            self.state.create([])
+            return True
+
+        partitions = plan_partitions(_to_datetime(first), _to_datetime(last), self.partition_months)
+        self.state.create(partitions)
+        self.log(f"Planned {len(partitions)} partitions from {first} to {last}")
+        return True
+
+    def _run_partition(self, partition):
+        conn = self.connect_fn()
+        if not conn:
+            raise ConnectionError("Could not connect to Access database")
+
+        label = f"{partition['start'][:10]}..{partition['end'][:10]}"
+        try:
+            resume = partition["last_timestamp"] is not None
+            rows = iter_checkinout(
+                conn,
+                last_timestamp=_to_datetime(partition["last_timestamp"]),
+                last_sn=partition["last_sn"],
+                sn_known=resume,
+                page_size=self.page_size,
+                since=_to_datetime(partition["start"]),
+                until=_to_datetime(partition["end"]),
+            )
+            batch = []
+            for row in rows:
+                batch.append(row)
+                if len(batch) >= self.batch_size:
+                    self._upload(partition, batch)
+                    batch = []
+                    if self._stop.is_set():
+                        self.log(f"Partition {label} interrupted; will resume from its checkpoint")
+                        return False
+            if batch:
+                self._upload(partition, batch)
+        finally:
+            conn.close()
+
+        self.state.finish(partition)
+        self.log(f"Partition {label} done ({partition['uploaded']} records)")
+        return True
+
+    def _upload(self, partition, batch):
+        uploaded = self.upload_fn(batch)
+        self.state.checkpoint(partition, batch[-1], uploaded)
+
+    def run(self):
+        """
+        Backfill every pending partition. Returns the consolidated
+        (timestamp, sn) watermark once all partitions are done, else None.
+        """
+        if not self._plan():
+            return None
+
+        pending = self.state.pending()
+        if pending:
+            self.log(f"Backfilling {len(pending)} partitions with {self.workers} workers...")
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                futures = {executor.submit(self._run_partition, p): p for p in pending}
+                try:
+                    for future in as_completed(futures):
+                        partition = futures[future]
+                        try:
+                            future.result()
+                        except Exception as e:
+                            self.log(f"Partition {partition['start'][:10]} failed: {e}")
+                except KeyboardInterrupt:
+                    self.log("Backfill interrupted; waiting for in-flight batches to commit...")
+                    self.stop()
+                    for future in futures:
+                        future.cancel()
+                    raise
+
+        remaining = self.state.pending()
+        if remaining:
+            self.log(f"{len(remaining)} partitions incomplete; run --backfill again to resume")
+            return None
+
+        self.state.data["completed"] = True
+        self.state.save()
+        return self.state.final_watermark()
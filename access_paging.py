@@ -0,0 +1,79 @@
+"""
+Keyset-paginated reads of the Access checkinout table over pyodbc.
+Each SELECT TOP page starts after the (checktime, sn) of the previous page's last row.
+"""
+
+# Rows requested per page
+DEFAULT_PAGE_SIZE = 1000
+
+CHECKINOUT_COLUMNS = "Badgenumber, checktime, checktype, verifycode, sensorid, workcode, sn"
+
+
+def _page_query(page_size, last_timestamp, last_sn, sn_known, since=None, until=None):
+    """Build the SQL and parameters for the page after (last_timestamp, last_sn)"""
+    select = f"SELECT TOP {int(page_size)} {CHECKINOUT_COLUMNS} FROM checkinout"
+    order = "ORDER BY checktime, sn"
+    clauses, params = [], []
+
+    if last_timestamp is None:
+        # Start of the range (or of the table on a first sync)
+        if since is not None:
+            clauses.append("checktime >= ?")
+            params.append(since)
+    elif not sn_known:
+        # Watermark without an SN: everything after the timestamp
+        clauses.append("checktime > ?")
+        params.append(last_timestamp)
+    elif last_sn is None:
+        # Jet sorts NULL first, so every non-NULL sn at this checktime is still ahead
+        clauses.append("((checktime > ?) OR (checktime = ? AND sn IS NOT NULL))")
+        params.extend((last_timestamp, last_timestamp))
+    else:
+        clauses.append("((checktime > ?) OR (checktime = ? AND sn > ?))")
+        params.extend((last_timestamp, last_timestamp, last_sn))
+
+    if until is not None:
+        clauses.append("checktime < ?")
+        params.append(until)
+
+    where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+    return f"{select}{where} {order}", tuple(params)
+
+
+def iter_checkinout(conn, last_timestamp=None, last_sn=None, page_size=DEFAULT_PAGE_SIZE,
+                    since=None, until=None, sn_known=None):
+    """
+    Yield checkinout rows after the (last_timestamp, last_sn) watermark in
+    (checktime, sn) order, one page of at most page_size rows (plus ties) at a
+    time. since/until optionally restrict the scan to since <= checktime < until.
+
+    last_sn=None means the watermark only has a timestamp, unless sn_known
+    is True, in which case it is a real NULL sn.
+    """
+    page_size = max(1, int(page_size))
+    cursor = conn.cursor()
+    if sn_known is None:
+        sn_known = last_sn is not None
+
+    try:
+        while True:
+            query, params = _page_query(page_size, last_timestamp, last_sn, sn_known, since, until)
+            cursor.execute(query, params)
+            rows = cursor.fetchall()
+            if not rows:
+                return
+
+            for row in rows:
+                yield row
+
+            if len(rows) < page_size:
+                return
+
+            # Next page starts after the last row's key
+            last_timestamp, last_sn = rows[-1][1], rows[-1][6]
+            sn_known = True
+    finally:
+        try:
+            cursor.close()
+        except Exception:
+            pass
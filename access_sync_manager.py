@@ -1,11 +1,17 @@
 import os
-import json
 import time
 import sys
 from datetime import datetime
+from itertools import islice
 import pyodbc
 import pymysql
-from cryptography.fernet import Fernet
+import mysql_pool
+from config_service import get_config_service
+from credential_provider import get_credential_provider
+from schema_manager import SchemaManager, DEFAULT_TTL as DEFAULT_SCHEMA_TTL
+from cloud_bulk_writer import bulk_insert, ACCESS_DEVICE_LOG_COLUMNS
+from access_paging import iter_checkinout, DEFAULT_PAGE_SIZE
+from adaptive_batch import BatchSizeController
 
 class AccessSyncManager:
     """
@@ -20,8 +26,17 @@ class AccessSyncManager:
         self.config_file = config_file
         self.cred_file = cred_file
         self.logger_callback = logger_callback if logger_callback else self._default_logger
+        # Parsed once and re-read only when the file changes (see config_service)
+        self.config = get_config_service(config_file, defaults=self._get_default_config(), logger=self.log)
+        # Decrypted once and kept in memory (see credential_provider)
+        self.credentials = get_credential_provider(cred_file, key=self.ENCRYPTION_KEY, logger=self.log)
+        self.config.subscribe(self._on_config_changed)
         self.paused = False
         self.running = False
+        # Cached table verification (see get_schema)
+        self._schema = None
+        # Upload batch size learned from latency (see get_batch_controller)
+        self._batch_controller = None
 
     def _default_logger(self, message):
         """Default logger prints to stdout"""
@@ -33,16 +48,8 @@ class AccessSyncManager:
         self.logger_callback(message)
 
     def load_config(self):
-        """Load public configuration from JSON file"""
-        try:
-            with open(self.config_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except FileNotFoundError:
-            self.log(f"Config file {self.config_file} not found. Using defaults.")
-            return self._get_default_config()
-        except Exception as e:
-            self.log(f"Error loading config: {e}")
-            return self._get_default_config()
+        """Current configuration as an editable dict (served from the shared cache, no disk read)"""
+        return self.config.as_dict()
 
     def _get_default_config(self):
         return {
@@ -55,34 +62,19 @@ class AccessSyncManager:
 
     def save_config(self, config):
         """Save public configuration to JSON file"""
-        try:
-            with open(self.config_file, 'w', encoding='utf-8') as f:
-                json.dump(config, f, indent=4, ensure_ascii=False)
-            return True
-        except Exception as e:
-            self.log(f"Error saving config: {e}")
-            return False
+        return self.config.save(config)
 
     def load_encrypted_credentials(self):
-        """Load and decrypt credentials"""
-        try:
-            with open(self.cred_file, 'rb') as f:
-                encrypted_data = f.read()
-            
-            fernet = Fernet(self.ENCRYPTION_KEY)
-            decrypted_data = fernet.decrypt(encrypted_data)
-            credentials = json.loads(decrypted_data.decode())
-            return credentials.get("DB_CONFIG", {})
-        except FileNotFoundError:
-            self.log(f"Encrypted credentials file {self.cred_file} not found!")
-            return {}
-        except Exception as e:
-            self.log(f"Error decrypting credentials: {e}")
-            return {}
+        """Decrypted credentials (cached in memory until the file changes)"""
+        return self.credentials.get()
+
+    def refresh_credentials(self):
+        """Decrypt the credentials file again (e.g. after replacing it); returns True if usable"""
+        return self.credentials.refresh()
 
     def get_last_sync_position(self):
         """Get the last sync position (timestamp and SN) from file"""
-        config = self.load_config()
+        config = self.config.get()
         last_sync_file = config.get("LAST_SYNC_FILE", "last_sync_access.txt")
         try:
             with open(last_sync_file, 'r') as f:
@@ -97,7 +89,7 @@ class AccessSyncManager:
 
     def set_last_sync_position(self, timestamp, sn):
         """Save the last sync position (timestamp and SN) to file"""
-        config = self.load_config()
+        config = self.config.get()
         last_sync_file = config.get("LAST_SYNC_FILE", "last_sync_access.txt")
         try:
             with open(last_sync_file, 'w') as f:
@@ -107,7 +99,7 @@ class AccessSyncManager:
 
     def connect_to_access_db(self):
         """Connect to the MS Access database"""
-        config = self.load_config()
+        config = self.config.get()
         db_path = config.get("ACCESS_DB_PATH", self._get_default_config()["ACCESS_DB_PATH"])
         password = config.get("ACCESS_PASSWORD", "hippmforyou")
 
@@ -143,13 +135,8 @@ class AccessSyncManager:
         """Connect to the MySQL cloud database"""
         credentials = self.load_encrypted_credentials()
         try:
-            conn = pymysql.connect(
-                host=credentials.get('host', 'localhost'),
-                user=credentials.get('user', ''),
-                password=credentials.get('password', ''),
-                database=credentials.get('database', ''),
-                port=credentials.get('port', 3306),
-                charset='utf8mb4',
+            conn = mysql_pool.connect(
+                credentials,
                 cursorclass=pymysql.cursors.DictCursor,
                 connect_timeout=60,
                 read_timeout=60,
@@ -160,24 +147,28 @@ class AccessSyncManager:
             self.log(f"Error connecting to MySQL database: {e}")
             return None
 
+    def get_schema(self):
+        """Schema manager shared by every cycle of this manager (created on first use)"""
+        if self._schema is None:
+            ttl = self.config.get().get("SCHEMA_CACHE_TTL", DEFAULT_SCHEMA_TTL)
+            self._schema = SchemaManager(self.connect_to_mysql_db, ["access_device_logs"], ttl=ttl, logger=self.log)
+        return self._schema
+
+    def _on_config_changed(self, new, old):
+        """Apply edited settings to state kept across cycles"""
+        self.log(f"Configuration {self.config_file} reloaded")
+        if self._batch_controller is not None:
+            self._batch_controller.apply_config(new)
+
+    def get_batch_controller(self):
+        """Adaptive batch size controller, kept across sync cycles"""
+        if self._batch_controller is None:
+            self._batch_controller = BatchSizeController.from_config(self.config.get(), logger=self.log)
+        return self._batch_controller
+
     def check_table_exists(self):
-        """Check if the target table exists in MySQL database"""
-        mysql_conn = self.connect_to_mysql_db()
-        if not mysql_conn:
-            return False
-        
-        try:
-            cursor = mysql_conn.cursor()
-            cursor.execute("SELECT 1 FROM access_device_logs LIMIT 1")
-            cursor.fetchone()
-            mysql_conn.close()
-            return True
-        except:
-            try:
-                mysql_conn.close()
-            except:
-                pass
-            return False
+        """Check (cached) that access_device_logs exists with its unique constraint"""
+        return self.get_schema().ensure("access_device_logs")
 
     def get_new_records_from_access(self, last_timestamp=None, last_sn=None, limit=None):
         """Get new records from the checkinout table since last sync position"""
@@ -186,40 +177,11 @@ class AccessSyncManager:
             return []
 
         try:
-            cursor = conn.cursor()
-            if last_timestamp:
-                if last_sn:
-                    query = """
-                    SELECT Badgenumber, checktime, checktype, verifycode, sensorid, workcode, sn
-                    FROM checkinout
-                    WHERE (checktime > ?) OR (checktime = ? AND sn > ?)
-                    ORDER BY checktime, sn
-                    """
-                    cursor.execute(query, (last_timestamp, last_timestamp, last_sn))
-                else:
-                    query = """
-                    SELECT Badgenumber, checktime, checktype, verifycode, sensorid, workcode, sn
-                    FROM checkinout
-                    WHERE checktime > ?
-                    ORDER BY checktime, sn
-                    """
-                    cursor.execute(query, (last_timestamp,))
-            else:
-                query = """
-                SELECT Badgenumber, checktime, checktype, verifycode, sensorid, workcode, sn
-                FROM checkinout
-                ORDER BY checktime, sn
-                """
-                cursor.execute(query)
-
             if limit:
-                records = []
-                for i, row in enumerate(cursor.fetchall()):
-                    if i >= limit:
-                        break
-                    records.append(row)
+                records = list(islice(iter_checkinout(conn, last_timestamp, last_sn, page_size=limit), limit))
             else:
-                records = cursor.fetchall()
+                page_size = self.config.get().get("ACCESS_PAGE_SIZE", DEFAULT_PAGE_SIZE)
+                records = list(iter_checkinout(conn, last_timestamp, last_sn, page_size=page_size))
 
             conn.close()
             return records
@@ -232,6 +194,22 @@ class AccessSyncManager:
                     pass
             return []
 
+    def iter_new_records_from_access(self, last_timestamp=None, last_sn=None):
+        """Yield new records page by page (SELECT TOP keyset pagination); errors propagate"""
+        conn = self.connect_to_access_db()
+        if not conn:
+            raise ConnectionError("Could not connect to Access database")
+
+        try:
+            page_size = self.config.get().get("ACCESS_PAGE_SIZE", DEFAULT_PAGE_SIZE)
+            for row in iter_checkinout(conn, last_timestamp, last_sn, page_size=page_size):
+                yield row
+        finally:
+            try:
+                conn.close()
+            except:
+                pass
+
     def sync_records_to_cloud(self, access_records):
         """Sync records from Access to MySQL cloud database"""
         if not access_records:
@@ -242,14 +220,7 @@ class AccessSyncManager:
             return 0
 
         try:
-            cursor = mysql_conn.cursor()
-            insert_query = """
-            INSERT IGNORE INTO access_device_logs
-            (badge_number, check_time, check_type, verify_code, sensor_id, work_code, device_sn, raw_data)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-            """
-
-            count = 0
+            rows = []
             for record in access_records:
                 badgenumber = record[0]
                 checktime = record[1]
@@ -261,7 +232,7 @@ class AccessSyncManager:
 
                 raw_data = f"Badge:{badgenumber}|CheckTime:{checktime}|Type:{checktype}|Verify:{verifycode}|Sensor:{sensorid}|WorkCode:{workcode}|SN:{sn}"
 
-                values = (
+                rows.append((
                     str(badgenumber) if badgenumber else '',
                     str(checktime) if checktime else None,
                     str(checktype) if checktype else '',
@@ -270,22 +241,22 @@ class AccessSyncManager:
                     str(workcode) if workcode else '',
                     str(sn) if sn else 'HIP_ACCESS_DB',
                     raw_data
-                )
-                cursor.execute(insert_query, values)
-                count += 1
+                ))
+
+            try:
+                result = bulk_insert(mysql_conn, "access_device_logs", ACCESS_DEVICE_LOG_COLUMNS, rows)
+            except Exception as e:
+                self.get_schema().handle_error("access_device_logs", e)
+                raise
 
             mysql_conn.commit()
-            return count
+            self.log(f"Batch insert: {result.inserted} new, {result.ignored} already present")
+            return result.submitted
 
         except Exception as e:
             self.log(f"Error syncing to MySQL: {e}")
             return 0
         finally:
-            try:
-                if 'cursor' in locals():
-                    cursor.close()
-            except:
-                pass
             try:
                 if mysql_conn:
                     mysql_conn.close()
@@ -300,39 +271,49 @@ class AccessSyncManager:
             return 0
 
         last_timestamp, last_sn = self.get_last_sync_position()
-        
-        # Get all new records
-        all_records = self.get_new_records_from_access(last_timestamp, last_sn)
-        total_records = len(all_records)
 
-        if total_records == 0:
-            self.log("No new records found in Access database")
-            return 0
+        controller = self.get_batch_controller()
 
-        config = self.load_config()
-        batch_size = config.get("BATCH_SIZE", 100)
-        self.log(f"Found {total_records} new records. Processing in batches of {batch_size}...")
+        # Stream new records page by page instead of loading the whole delta
+        records = self.iter_new_records_from_access(last_timestamp, last_sn)
 
         total_uploaded = 0
-        for i in range(0, total_records, batch_size):
-            if self.paused:
-                self.log("Sync paused by user.")
-                break
-                
-            batch = all_records[i:i + batch_size]
-            batch_uploaded = self.sync_records_to_cloud(batch)
-            total_uploaded += batch_uploaded
-            
-            self.log(f"Batch {i//batch_size + 1}: {batch_uploaded} records uploaded")
+        batch_number = 0
+        try:
+            while True:
+                if self.paused:
+                    self.log("Sync paused by user.")
+                    break
+
+                batch = list(islice(records, controller.batch_size))
+                if not batch:
+                    break
+                batch_number += 1
+                if batch_number == 1:
+                    self.log(f"Found new records. Processing in batches of {len(batch)}...")
+
+                started = time.monotonic()
+                batch_uploaded = self.sync_records_to_cloud(batch)
+                controller.record(len(batch), time.monotonic() - started, batch_uploaded > 0)
+                total_uploaded += batch_uploaded
+
+                self.log(f"Batch {batch_number}: {batch_uploaded} records uploaded")
 
-            if batch:
                 last_record = batch[-1]
                 batch_last_timestamp = str(last_record[1])
                 batch_last_sn = str(last_record[6]) if last_record[6] else 'UNKNOWN'
                 self.set_last_sync_position(batch_last_timestamp, batch_last_sn)
                 self.log(f"Updated sync position: {batch_last_timestamp}|{batch_last_sn}")
 
-            time.sleep(0.1) # Breathe
+                time.sleep(controller.delay)  # Backs off when uploads are slow or failing
+        except Exception as e:
+            self.log(f"Error querying Access database: {e}")
+        finally:
+            records.close()
+
+        if batch_number == 0:
+            self.log("No new records found in Access database")
+            return 0
 
         self.log(f"Sync cycle completed. Total: {total_uploaded}")
         return total_uploaded
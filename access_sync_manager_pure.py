@@ -1,21 +1,26 @@
 import os
-import json
-import time
 import sys
+import importlib.util
 from datetime import datetime
 import pymysql
 import traceback
-from cryptography.fernet import Fernet
-
-# Global flag to track if import succeeded
-ACCESS_PARSER_AVAILABLE = False
+import mysql_pool
+from config_service import get_config_service
+from credential_provider import get_credential_provider
+from schema_manager import SchemaManager, DEFAULT_TTL as DEFAULT_SCHEMA_TTL
+from cloud_bulk_writer import bulk_insert, ACCESS_DEVICE_LOG_COLUMNS
+from sync_pipeline import SyncPipeline, DEFAULT_WORKERS, DEFAULT_QUEUE_BATCHES
+from adaptive_batch import BatchSizeController
+from mdb_incremental import IncrementalTableReader
+from checkinout_filter import filter_new_records
+from staging_store import StagingStore, DEFAULT_STAGING_DB
+
+# Global flag to track if access-parser is installed (IncrementalTableReader imports it)
+ACCESS_PARSER_AVAILABLE = importlib.util.find_spec("access_parser") is not None
 IMPORT_ERROR_MSG = ""
 
-try:
-    from access_parser import AccessParser
-    ACCESS_PARSER_AVAILABLE = True
-except ImportError as e:
-    IMPORT_ERROR_MSG = f"{e}\n{traceback.format_exc()}"
+if not ACCESS_PARSER_AVAILABLE:
+    IMPORT_ERROR_MSG = "No module named 'access_parser'"
     print(f"CRITICAL: access-parser import failed: {IMPORT_ERROR_MSG}")
 
 class PureAccessSyncManager:
@@ -30,8 +35,21 @@ class PureAccessSyncManager:
         self.config_file = config_file
         self.cred_file = cred_file
         self.logger_callback = logger_callback if logger_callback else self._default_logger
+        # Parsed once and re-read only when the file changes (see config_service)
+        self.config = get_config_service(config_file, defaults=self._get_default_config(), logger=self.log)
+        # Decrypted once and kept in memory (see credential_provider)
+        self.credentials = get_credential_provider(cred_file, key=self.ENCRYPTION_KEY, logger=self.log)
+        self.config.subscribe(self._on_config_changed)
         self.paused = False
         self.running = False
+        # Cached table verification (see get_schema)
+        self._schema = None
+        # Upload batch size learned from latency (see get_batch_controller)
+        self._batch_controller = None
+        # Remembers decoded checkinout pages between cycles
+        self._incremental_reader = None
+        # Local SQLite mirror the uploader drains (opened on first use)
+        self._staging = None
 
     def _default_logger(self, message):
         print(f"[{datetime.now()}] {message}")
@@ -41,14 +59,8 @@ class PureAccessSyncManager:
         self.logger_callback(message)
 
     def load_config(self):
-        try:
-            with open(self.config_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except FileNotFoundError:
-            return self._get_default_config()
-        except Exception as e:
-            self.log(f"Error loading config: {e}")
-            return self._get_default_config()
+        """Current configuration as an editable dict (served from the shared cache, no disk read)"""
+        return self.config.as_dict()
 
     def _get_default_config(self):
         return {
@@ -59,32 +71,17 @@ class PureAccessSyncManager:
         }
 
     def save_config(self, config):
-        try:
-            with open(self.config_file, 'w', encoding='utf-8') as f:
-                json.dump(config, f, indent=4, ensure_ascii=False)
-            return True
-        except Exception as e:
-            self.log(f"Error saving config: {e}")
-            return False
+        return self.config.save(config)
 
     def load_encrypted_credentials(self):
-        try:
-            with open(self.cred_file, 'rb') as f:
-                encrypted_data = f.read()
-            
-            fernet = Fernet(self.ENCRYPTION_KEY)
-            decrypted_data = fernet.decrypt(encrypted_data)
-            credentials = json.loads(decrypted_data.decode())
-            return credentials.get("DB_CONFIG", {})
-        except FileNotFoundError:
-            self.log(f"Encrypted credentials file {self.cred_file} not found!")
-            return {}
-        except Exception as e:
-            self.log(f"Error decrypting credentials: {e}")
-            return {}
+        return self.credentials.get()
+
+    def refresh_credentials(self):
+        """Decrypt the credentials file again (e.g. after replacing it); returns True if usable"""
+        return self.credentials.refresh()
 
     def get_last_sync_position(self):
-        config = self.load_config()
+        config = self.config.get()
         last_sync_file = config.get("LAST_SYNC_FILE", "last_sync_access_pure.txt")
         try:
             with open(last_sync_file, 'r') as f:
@@ -98,7 +95,7 @@ class PureAccessSyncManager:
             return None, None
 
     def set_last_sync_position(self, timestamp, sn):
-        config = self.load_config()
+        config = self.config.get()
         last_sync_file = config.get("LAST_SYNC_FILE", "last_sync_access_pure.txt")
         try:
             with open(last_sync_file, 'w') as f:
@@ -109,13 +106,8 @@ class PureAccessSyncManager:
     def connect_to_mysql_db(self):
         credentials = self.load_encrypted_credentials()
         try:
-            conn = pymysql.connect(
-                host=credentials.get('host', 'localhost'),
-                user=credentials.get('user', ''),
-                password=credentials.get('password', ''),
-                database=credentials.get('database', ''),
-                port=credentials.get('port', 3306),
-                charset='utf8mb4',
+            conn = mysql_pool.connect(
+                credentials,
                 cursorclass=pymysql.cursors.DictCursor,
                 connect_timeout=60
             )
@@ -124,30 +116,35 @@ class PureAccessSyncManager:
             self.log(f"Error connecting to MySQL database: {e}")
             return None
 
+    def get_schema(self):
+        """Schema manager shared by every cycle of this manager (created on first use)"""
+        if self._schema is None:
+            ttl = self.config.get().get("SCHEMA_CACHE_TTL", DEFAULT_SCHEMA_TTL)
+            self._schema = SchemaManager(self.connect_to_mysql_db, ["access_device_logs"], ttl=ttl, logger=self.log)
+        return self._schema
+
+    def _on_config_changed(self, new, old):
+        """Apply edited settings to state kept across cycles"""
+        self.log(f"Configuration {self.config_file} reloaded")
+        if self._batch_controller is not None:
+            self._batch_controller.apply_config(new)
+
+    def get_batch_controller(self):
+        """Adaptive batch size controller, kept across sync cycles"""
+        if self._batch_controller is None:
+            self._batch_controller = BatchSizeController.from_config(self.config.get(), logger=self.log)
+        return self._batch_controller
+
     def check_table_exists(self):
-        mysql_conn = self.connect_to_mysql_db()
-        if not mysql_conn:
-            return False
-        
-        try:
-            cursor = mysql_conn.cursor()
-            cursor.execute("SELECT 1 FROM access_device_logs LIMIT 1")
-            cursor.fetchone()
-            mysql_conn.close()
-            return True
-        except:
-            try:
-                mysql_conn.close()
-            except:
-                pass
-            return False
+        """Check (cached) that access_device_logs exists with its unique constraint"""
+        return self.get_schema().ensure("access_device_logs")
 
     def get_new_records_from_access(self, last_timestamp=None, last_sn=None):
         """
         Reads records using access-parser and filters for new ones.
         Returns a list of tuples.
         """
-        config = self.load_config()
+        config = self.config.get()
         db_path = config.get("ACCESS_DB_PATH", self._get_default_config()["ACCESS_DB_PATH"])
 
         if not os.path.exists(db_path):
@@ -160,214 +157,38 @@ class PureAccessSyncManager:
             return []
 
         try:
-            self.log("Reading Access database (Pure Python)...")
-            db = AccessParser(db_path)
-            found_tables = db.catalog.keys()
-            
-            # Case-insensitive lookup for table name
-            target_table = "checkinout"
-            actual_table_name = None
-            for tbl in found_tables:
-                if tbl.lower() == target_table.lower():
-                    actual_table_name = tbl
-                    break
-            
-            if not actual_table_name:
-                self.log(f"ERROR: Table '{target_table}' not found in database!")
-                return []
-                
-            self.log(f"Parsing table: {actual_table_name}")
-            table = db.parse_table(actual_table_name)
-            
-            # Map expected fields to actual column names in the defaultdict
-            # Structure is table[column_name] = {row_index: value} or [values] ? 
-            # access-parser usually returns dict of dicts {col: {row_idx: val}} or dict of lists.
-            # Let's check the type of values in the first column to be safe, or just assume dict-like behavior based on keys.
-            
-            # We need to find the specific keys for our columns
-            expected_cols = {
-                'badgenumber': None,
-                'checktime': None, 
-                'checktype': None, 
-                'verifycode': None, 
-                'sensorid': None, 
-                'workcode': None, 
-                'sn': None
-            }
-            
-            for col_name in table.keys():
-                lower_name = col_name.lower()
-                if lower_name in expected_cols:
-                    expected_cols[lower_name] = col_name
-            
-            # Determine number of rows based on the first found column
-            num_rows = 0
-            first_col = next((c for c in expected_cols.values() if c is not None), None)
-            
-            if first_col and isinstance(table[first_col], dict):
-                # If it's a dict {row_idx: val}, get max key
-                if table[first_col]:
-                    num_rows = max(table[first_col].keys()) + 1
-            elif first_col and isinstance(table[first_col], list):
-                num_rows = len(table[first_col])
-            
-            self.log(f"Detected {num_rows} rows in table.")
+            if self._incremental_reader is None or self._incremental_reader.db_path != db_path:
+                self._incremental_reader = IncrementalTableReader(db_path, "checkinout", logger=self.log)
+            reader = self._incremental_reader
 
-            records = []
-            
-            for i in range(num_rows):
-                # Helper to get value for current row i
-                def get_col_val(col_key):
-                    actual_key = expected_cols.get(col_key)
-                    if not actual_key: 
-                        return None
-                    
-                    # Access data structure
-                    col_data = table[actual_key]
-                    if isinstance(col_data, dict):
-                        return col_data.get(i)
-                    elif isinstance(col_data, list):
-                        return col_data[i] if i < len(col_data) else None
-                    return None
-
-                checktime_str = get_col_val('checktime')
-                sn = get_col_val('sn')
-                
-                checktime_dt = None
-                if checktime_str:
-                    if isinstance(checktime_str, datetime):
-                        checktime_dt = checktime_str
-                    else:
-                        try:
-                            # access-parser sometimes returns strings like '2023-01-01 12:00:00'
-                            checktime_dt = datetime.strptime(str(checktime_str), "%Y-%m-%d %H:%M:%S")
-                        except:
-                            pass
-
-                if not checktime_dt:
-                    continue
-
-                is_new = False
-                
-                if last_timestamp is None:
-                    is_new = True
-                else:
-                    try:
-                        last_dt = datetime.strptime(str(last_timestamp), "%Y-%m-%d %H:%M:%S")
-                    except:
-                        last_dt = datetime.min
-
-                    if checktime_dt > last_dt:
-                        is_new = True
-                    elif checktime_dt == last_dt:
-                        try:
-                            # Handle SN comparison safely
-                            curr_sn_val = sn or 0
-                            last_sn_val = last_sn or 0
-                            
-                            # Try integer comparison first
-                            if str(curr_sn_val).isdigit() and str(last_sn_val).isdigit():
-                                if int(curr_sn_val) > int(last_sn_val):
-                                    is_new = True
-                            else:
-                                # Fallback to string comparison
-                                if str(curr_sn_val) > str(last_sn_val):
-                                    is_new = True
-                        except:
-                            pass
-                
-                if is_new:
-                    records.append((
-                        get_col_val('badgenumber'),
-                        checktime_dt,
-                        get_col_val('checktype'),
-                        get_col_val('verifycode'),
-                        get_col_val('sensorid'),
-                        get_col_val('workcode'),
-                        sn
-                    ))
-
-            # Sort records by time then SN
-            records.sort(key=lambda x: (x[1], int(x[6]) if x[6] and str(x[6]).isdigit() else 0))
-            
-            return records
-
-            for row in table:
-                checktime_str = get_val(row, 'checktime')
-                sn = get_val(row, 'sn')
-                
-                checktime_dt = None
-                if checktime_str:
-                    if isinstance(checktime_str, datetime):
-                        checktime_dt = checktime_str
-                    else:
-                        try:
-                            checktime_dt = datetime.strptime(str(checktime_str), "%Y-%m-%d %H:%M:%S")
-                        except:
-                            pass
-
-                if not checktime_dt:
-                    continue
-
-                is_new = False
-                
-                if last_timestamp is None:
-                    is_new = True
-                else:
-                    try:
-                        last_dt = datetime.strptime(str(last_timestamp), "%Y-%m-%d %H:%M:%S")
-                    except:
-                        last_dt = datetime.min
-
-                    if checktime_dt > last_dt:
-                        is_new = True
-                    elif checktime_dt == last_dt:
-                        try:
-                            curr_sn_int = int(sn) if sn else 0
-                            last_sn_int = int(last_sn) if last_sn else 0
-                            if curr_sn_int > last_sn_int:
-                                is_new = True
-                        except:
-                            pass
-                
-                if is_new:
-                    records.append((
-                        get_val(row, 'Badgenumber'),
-                        checktime_dt,
-                        get_val(row, 'checktype'),
-                        get_val(row, 'verifycode'),
-                        get_val(row, 'sensorid'),
-                        get_val(row, 'workcode'),
-                        sn
-                    ))
-
-            # Sort records by time then SN
-            records.sort(key=lambda x: (x[1], int(x[6]) if x[6] and str(x[6]).isdigit() else 0))
+            try:
+                rescan_from = datetime.strptime(str(last_timestamp), "%Y-%m-%d %H:%M:%S") if last_timestamp else None
+            except ValueError:
+                rescan_from = None
+
+            # Only pages that changed (or still hold unsynced rows) are decoded
+            table = reader.read(rescan_from=rescan_from)
+            if table is None:
+                self.log("ERROR: Table 'checkinout' not found in database!")
+                return []
+            self.log(f"Read checkinout (Pure Python): decoded {reader.pages_decoded} of {reader.pages_total} data pages")
             
-            return records
+            # Column-wise watermark filter (vectorized when NumPy is available)
+            return filter_new_records(table, last_timestamp, last_sn)
 
         except Exception as e:
             self.log(f"Error parsing Access database: {e}")
             self.log(f"Traceback: {traceback.format_exc()}")
             return []
 
-    def sync_records_to_cloud(self, access_records):
-        if not access_records:
-            return 0
-
+    def upload_records_to_cloud(self, access_records):
+        """Upload and commit one batch. Returns the record count; raises on failure."""
         mysql_conn = self.connect_to_mysql_db()
         if not mysql_conn:
-            return 0
+            raise ConnectionError("Could not connect to MySQL database")
 
         try:
-            cursor = mysql_conn.cursor()
-            insert_query = """
-            INSERT IGNORE INTO access_device_logs
-            (badge_number, check_time, check_type, verify_code, sensor_id, work_code, device_sn, raw_data)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-            """
-
-            count = 0
+            rows = []
             for record in access_records:
                 badgenumber = record[0]
                 checktime = record[1]
@@ -380,7 +201,7 @@ class PureAccessSyncManager:
                 checktime_str = checktime.strftime("%Y-%m-%d %H:%M:%S") if isinstance(checktime, datetime) else str(checktime)
                 raw_data = f"Badge:{badgenumber}|CheckTime:{checktime_str}|Type:{checktype}|Verify:{verifycode}|Sensor:{sensorid}|WorkCode:{workcode}|SN:{sn}"
 
-                values = (
+                rows.append((
                     str(badgenumber) if badgenumber else '',
                     checktime_str,
                     str(checktype) if checktype else '',
@@ -389,64 +210,110 @@ class PureAccessSyncManager:
                     str(workcode) if workcode else '',
                     str(sn) if sn else 'HIP_ACCESS_DB',
                     raw_data
-                )
-                cursor.execute(insert_query, values)
-                count += 1
+                ))
 
-            mysql_conn.commit()
-            return count
+            try:
+                result = bulk_insert(mysql_conn, "access_device_logs", ACCESS_DEVICE_LOG_COLUMNS, rows)
+            except Exception as e:
+                self.get_schema().handle_error("access_device_logs", e)
+                raise
 
-        except Exception as e:
-            self.log(f"Error syncing to MySQL: {e}")
-            return 0
+            mysql_conn.commit()
+            self.log(f"Batch insert: {result.inserted} new, {result.ignored} already present")
+            return result.submitted
         finally:
             try:
-                if mysql_conn:
-                    mysql_conn.close()
+                mysql_conn.close()
             except:
                 pass
 
-    def run_sync_cycle(self):
-        """Runs a complete sync cycle. Returns total uploaded records."""
-        if not self.check_table_exists():
-            self.log("ERROR: access_device_logs table does not exist in MySQL!")
+    def sync_records_to_cloud(self, access_records):
+        if not access_records:
             return 0
 
-        last_timestamp, last_sn = self.get_last_sync_position()
-        
-        # Get all new records
-        all_records = self.get_new_records_from_access(last_timestamp, last_sn)
-        total_records = len(all_records)
+        try:
+            return self.upload_records_to_cloud(access_records)
+        except Exception as e:
+            self.log(f"Error syncing to MySQL: {e}")
+            return 0
 
-        if total_records == 0:
+    def checkpoint_sync_position(self, last_record):
+        """Save the sync position of the last record in a committed batch"""
+        # Checktime is at index 1 (datetime object)
+        batch_last_timestamp = last_record[1].strftime("%Y-%m-%d %H:%M:%S") if isinstance(last_record[1], datetime) else str(last_record[1])
+        batch_last_sn = str(last_record[6]) if last_record[6] else 'UNKNOWN'
+        self.set_last_sync_position(batch_last_timestamp, batch_last_sn)
+        self.log(f"Updated sync position: {batch_last_timestamp}|{batch_last_sn}")
+
+    def get_staging_store(self):
+        if self._staging is None:
+            config = self.config.get()
+            self._staging = StagingStore(config.get("STAGING_DB", DEFAULT_STAGING_DB))
+        return self._staging
+
+    def stage_new_records(self):
+        """
+        Copy new Access rows into the local staging store. The sync position
+        now tracks what has been read from Access, since staged rows are
+        durable locally. Returns the number of newly staged rows.
+        """
+        last_timestamp, last_sn = self.get_last_sync_position()
+        records = self.get_new_records_from_access(last_timestamp, last_sn)
+        if not records:
             self.log("No new records found.")
             return 0
 
-        config = self.load_config()
-        batch_size = config.get("BATCH_SIZE", 100)
-        self.log(f"Found {total_records} new records. Processing in batches of {batch_size}...")
-
-        total_uploaded = 0
-        for i in range(0, total_records, batch_size):
-            if self.paused:
-                self.log("Sync paused by user.")
-                break
-                
-            batch = all_records[i:i + batch_size]
-            batch_uploaded = self.sync_records_to_cloud(batch)
-            total_uploaded += batch_uploaded
-            
-            self.log(f"Batch {i//batch_size + 1}: {batch_uploaded} records uploaded")
+        staged = self.get_staging_store().stage(records)
+        self.checkpoint_sync_position(records[-1])
+        self.log(f"Staged {staged} new records ({len(records) - staged} already staged).")
+        return staged
+
+    def _upload_staged_batch(self, batch):
+        # Staged rows are (id, Badgenumber, checktime, ...); flag them once MySQL committed
+        count = self.upload_records_to_cloud([row[1:] for row in batch])
+        self.get_staging_store().mark_uploaded(row[0] for row in batch)
+        return count
+
+    def upload_pending_records(self):
+        """Drain staged rows that are not yet in the cloud. Returns total uploaded."""
+        store = self.get_staging_store()
+        _, pending = store.counts()
+        if pending == 0:
+            return 0
 
-            if batch:
-                last_record = batch[-1]
-                # Checktime is at index 1 (datetime object)
-                batch_last_timestamp = last_record[1].strftime("%Y-%m-%d %H:%M:%S") if isinstance(last_record[1], datetime) else str(last_record[1])
-                batch_last_sn = str(last_record[6]) if last_record[6] else 'UNKNOWN'
-                self.set_last_sync_position(batch_last_timestamp, batch_last_sn)
-                self.log(f"Updated sync position: {batch_last_timestamp}|{batch_last_sn}")
+        config = self.config.get()
+        controller = self.get_batch_controller()
+        batch_size = controller.batch_size
+        self.log(f"Uploading {pending} pending records in batches of {batch_size}...")
+
+        # Progress lives in the per-row uploaded flag, so no ordered checkpoint is needed
+        pipeline = SyncPipeline(
+            self._upload_staged_batch,
+            lambda last_record: None,
+            batch_size=batch_size,
+            workers=config.get("PIPELINE_WORKERS", DEFAULT_WORKERS),
+            queue_batches=config.get("PIPELINE_QUEUE_BATCHES", DEFAULT_QUEUE_BATCHES),
+            should_stop=lambda: self.paused,
+            controller=controller,
+            logger=self.log
+        )
+        rows = (row for batch in store.iter_pending(batch_size) for row in batch)
+        total_uploaded = pipeline.run(rows)
+
+        if pipeline.stopped:
+            self.log("Sync paused by user.")
+        return total_uploaded
+
+    def run_sync_cycle(self):
+        """Runs a complete sync cycle. Returns total uploaded records."""
+        # Staging is local, so new punches are captured even while the cloud is unreachable
+        self.stage_new_records()
+
+        if not self.check_table_exists():
+            self.log("ERROR: access_device_logs table does not exist in MySQL!")
+            return 0
 
-            time.sleep(0.1)
+        total_uploaded = self.upload_pending_records()
 
         self.log(f"Sync cycle completed. Total: {total_uploaded}")
         return total_uploaded
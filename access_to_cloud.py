@@ -3,9 +3,20 @@ import pyodbc
 import pymysql
 import time
 import sys
+from itertools import islice
 from datetime import datetime, timedelta
 import json
 from cryptography.fernet import Fernet
+import mysql_pool
+from config_service import get_config_service
+from cloud_bulk_writer import bulk_insert, ACCESS_DEVICE_LOG_COLUMNS, ACCESS_DEVICE_LOG_UPDATE_COLUMNS
+from sync_pipeline import SyncPipeline, DEFAULT_WORKERS, DEFAULT_QUEUE_BATCHES
+from adaptive_batch import BatchSizeController
+from access_paging import iter_checkinout, DEFAULT_PAGE_SIZE
+import access_backfill
+import reconcile
+from schema_manager import SchemaManager, TABLES, DEFAULT_TTL as DEFAULT_SCHEMA_TTL
+import cloud_dedup
 
 # Platform-specific file locking
 try:
@@ -19,32 +30,20 @@ except ImportError:
 CONFIG_FILE = "config.json"
 ENCRYPTED_CREDENTIALS_FILE = "encrypted_credentials.bin"
 
+DEFAULT_CONFIG = {
+    "ACCESS_DB_PATH": "D:\\\\Program Files (x86)\\\\HIPPremiumTime-2.0.4\\\\db\\\\Pm2014.mdb",
+    "ACCESS_PASSWORD": "hippmforyou",
+    "UPLOAD_TIMES": ["09:00", "12:00", "17:00", "22:00"],  # Scheduled sync times
+    "LAST_SYNC_FILE": "last_sync_access.txt",  # File to store last sync timestamp
+    "BATCH_SIZE": 100  # Number of records to process in each batch
+}
+
+# Parsed once; re-read only when the file changes on disk
+config_service = get_config_service(CONFIG_FILE, defaults=DEFAULT_CONFIG, create_missing=True)
+
 def load_config():
-    """Load public configuration from JSON file"""
-    try:
-        with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        # Create default config if file doesn't exist
-        default_config = {
-            "ACCESS_DB_PATH": "D:\\\\Program Files (x86)\\\\HIPPremiumTime-2.0.4\\\\db\\\\Pm2014.mdb",
-            "ACCESS_PASSWORD": "hippmforyou",
-            "UPLOAD_TIMES": ["09:00", "12:00", "17:00", "22:00"],  # Scheduled sync times
-            "LAST_SYNC_FILE": "last_sync_access.txt",  # File to store last sync timestamp
-            "BATCH_SIZE": 100  # Number of records to process in each batch
-        }
-        save_config(default_config)
-        return default_config
-    except Exception as e:
-        print(f"Error loading config: {e}")
-        # Return default config if there's an error
-        return {
-            "ACCESS_DB_PATH": "D:\\\\Program Files (x86)\\\\HIPPremiumTime-2.0.4\\\\db\\\\Pm2014.mdb",
-            "ACCESS_PASSWORD": "hippmforyou",
-            "UPLOAD_TIMES": ["09:00", "12:00", "17:00", "22:00"],
-            "LAST_SYNC_FILE": "last_sync_access.txt",
-            "BATCH_SIZE": 100
-        }
+    """Current configuration (read-only snapshot, reloaded when the file changes)"""
+    return config_service.get()
 
 def load_encrypted_credentials():
     """Load and decrypt credentials from encrypted file"""
@@ -69,13 +68,7 @@ def load_encrypted_credentials():
 
 def save_config(config):
     """Save public configuration to JSON file"""
-    try:
-        with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-            json.dump(config, f, indent=4, ensure_ascii=False)
-        return True
-    except Exception as e:
-        print(f"Error saving config: {e}")
-        return False
+    return config_service.save(config)
 
 def get_last_sync_position():
     """Get the last sync position (timestamp and SN) from file"""
@@ -104,6 +97,18 @@ ACCESS_DB_PATH = config.get("ACCESS_DB_PATH", "D:\\\\Program Files (x86)\\\\HIPP
 ACCESS_PASSWORD = config.get("ACCESS_PASSWORD", "hippmforyou")
 UPLOAD_TIMES = config.get("UPLOAD_TIMES", ["09:00", "12:00", "17:00", "22:00"])  # Scheduled times
 BATCH_SIZE = config.get("BATCH_SIZE", 100)
+PIPELINE_WORKERS = config.get("PIPELINE_WORKERS", DEFAULT_WORKERS)  # Parallel upload workers
+PIPELINE_QUEUE_BATCHES = config.get("PIPELINE_QUEUE_BATCHES", DEFAULT_QUEUE_BATCHES)  # Batches buffered ahead of the uploaders
+ACCESS_PAGE_SIZE = config.get("ACCESS_PAGE_SIZE", DEFAULT_PAGE_SIZE)  # Rows per SELECT TOP page from Access
+BACKFILL_STATE_FILE = config.get("BACKFILL_STATE_FILE", access_backfill.DEFAULT_STATE_FILE)
+BACKFILL_PARTITION_MONTHS = config.get("BACKFILL_PARTITION_MONTHS", access_backfill.DEFAULT_PARTITION_MONTHS)
+BACKFILL_WORKERS = config.get("BACKFILL_WORKERS", access_backfill.DEFAULT_WORKERS)
+BACKFILL_BATCH_SIZE = config.get("BACKFILL_BATCH_SIZE", access_backfill.DEFAULT_BATCH_SIZE)
+SCHEMA_CACHE_TTL = config.get("SCHEMA_CACHE_TTL", DEFAULT_SCHEMA_TTL)  # Seconds a verified table schema is trusted
+DEDUP_CHUNK_SIZE = config.get("DEDUP_CHUNK_SIZE", cloud_dedup.DEFAULT_CHUNK_SIZE)  # Ids scanned per dedup range
+DEDUP_DELETE_BATCH = config.get("DEDUP_DELETE_BATCH", cloud_dedup.DEFAULT_DELETE_BATCH)  # Rows deleted per transaction
+DEDUP_PAUSE_SECONDS = config.get("DEDUP_PAUSE_SECONDS", cloud_dedup.DEFAULT_PAUSE_SECONDS)  # Pause between delete transactions
+RECONCILE_DAYS = config.get("RECONCILE_DAYS", reconcile.DEFAULT_DAYS)  # Days checked by --reconcile
 
 # Lock file for preventing multiple instances
 LOCK_FILE = "access_to_cloud.lock"
@@ -193,87 +198,38 @@ def connect_to_access_db():
 def connect_to_mysql_db():
     """Connect to the MySQL cloud database"""
     try:
-        conn = pymysql.connect(
-            host=credentials.get('host', 'localhost'),
-            user=credentials.get('user', ''),
-            password=credentials.get('password', ''),
-            database=credentials.get('database', ''),
-            port=credentials.get('port', 3306),
-            charset='utf8mb4',
-            cursorclass=pymysql.cursors.DictCursor
-        )
+        # Borrow a pooled connection; close() hands it back for the next batch
+        conn = mysql_pool.connect(credentials, cursorclass=pymysql.cursors.DictCursor)
         return conn
     except Exception as e:
         log_msg(f"Error connecting to MySQL database: {e}")
         return None
 
-def check_table_exists():
-    """Check if the target table exists in MySQL database"""
-    mysql_conn = connect_to_mysql_db()
-    if not mysql_conn:
-        return False
+# Batch size and pacing learned from upload latency; kept across scheduled runs
+batch_controller = BatchSizeController.from_config(config, logger=log_msg)
 
-    try:
-        cursor = mysql_conn.cursor()
-        cursor.execute("SELECT 1 FROM access_device_logs LIMIT 1")
-        cursor.fetchone()
-        mysql_conn.close()
-        return True
-    except:
-        mysql_conn.close()
-        return False
+def on_config_changed(new, old):
+    """Apply an edited schedule and batch settings without restarting the service"""
+    global UPLOAD_TIMES, BATCH_SIZE
+    UPLOAD_TIMES = new.get("UPLOAD_TIMES", UPLOAD_TIMES)
+    BATCH_SIZE = new.get("BATCH_SIZE", BATCH_SIZE)
+    batch_controller.apply_config(new)
+    log_msg(f"Configuration reloaded. Schedule: {list(UPLOAD_TIMES)}, batch size: {BATCH_SIZE}")
 
-def ensure_unique_constraint():
-    """Ensure the unique constraint exists on the table to prevent duplicates"""
-    mysql_conn = connect_to_mysql_db()
-    if not mysql_conn:
-        return False
+config_service.subscribe(on_config_changed)
 
-    try:
-        cursor = mysql_conn.cursor()
-
-        # Check if the unique constraint already exists
-        cursor.execute("""
-            SELECT COUNT(*)
-            FROM information_schema.TABLE_CONSTRAINTS
-            WHERE TABLE_SCHEMA = %s
-            AND TABLE_NAME = 'access_device_logs'
-            AND CONSTRAINT_NAME = 'unique_badge_time_sn'
-        """, (credentials.get('database', ''),))
-
-        result = cursor.fetchone()
-        constraint_exists = result['COUNT(*)'] > 0 if result else False
-
-        if not constraint_exists:
-            # First, remove any existing duplicates
-            log_msg("Removing existing duplicates before adding unique constraint...")
-            cursor.execute("""
-                DELETE t1 FROM access_device_logs t1
-                INNER JOIN access_device_logs t2
-                WHERE t1.id > t2.id
-                AND t1.badge_number = t2.badge_number
-                AND t1.check_time = t2.check_time
-                AND t1.device_sn = t2.device_sn
-            """)
-
-            # Then add the unique constraint
-            cursor.execute("""
-                ALTER TABLE access_device_logs
-                ADD CONSTRAINT unique_badge_time_sn UNIQUE (badge_number, check_time, device_sn)
-            """)
-            log_msg("Unique constraint added successfully.")
-        else:
-            log_msg("Unique constraint already exists.")
+# Verified once per TTL instead of before every batch
+DEDUP_OPTIONS = {
+    "chunk_size": DEDUP_CHUNK_SIZE,
+    "delete_batch": DEDUP_DELETE_BATCH,
+    "pause_seconds": DEDUP_PAUSE_SECONDS,
+}
+schema = SchemaManager(connect_to_mysql_db, ["access_device_logs"], ttl=SCHEMA_CACHE_TTL,
+                       dedup_options=DEDUP_OPTIONS, logger=log_msg)
 
-        mysql_conn.commit()
-        return True
-    except Exception as e:
-        log_msg(f"Error ensuring unique constraint: {e}")
-        # If constraint creation fails, we can still continue with the ON DUPLICATE KEY UPDATE approach
-        return True  # Return True to allow the sync to continue
-    finally:
-        if mysql_conn and mysql_conn.is_connected():
-            mysql_conn.close()
+def check_table_exists():
+    """Check (cached) that access_device_logs exists with its unique constraint, creating it if missing"""
+    return schema.ensure("access_device_logs")
 
 def get_new_records_from_access(last_timestamp=None, last_sn=None, limit=None):
     """Get new records from the checkinout table since last sync position"""
@@ -282,45 +238,11 @@ def get_new_records_from_access(last_timestamp=None, last_sn=None, limit=None):
         return []
 
     try:
-        cursor = conn.cursor()
-
-        if last_timestamp:
-            if last_sn:
-                # Get records newer than last sync position (timestamp + SN)
-                query = """
-                SELECT Badgenumber, checktime, checktype, verifycode, sensorid, workcode, sn
-                FROM checkinout
-                WHERE (checktime > ?) OR (checktime = ? AND sn > ?)
-                ORDER BY checktime, sn
-                """
-                cursor.execute(query, (last_timestamp, last_timestamp, last_sn))
-            else:
-                # Get records newer than last timestamp only
-                query = """
-                SELECT Badgenumber, checktime, checktype, verifycode, sensorid, workcode, sn
-                FROM checkinout
-                WHERE checktime > ?
-                ORDER BY checktime, sn
-                """
-                cursor.execute(query, (last_timestamp,))
-        else:
-            # Get all records (first sync)
-            query = """
-            SELECT Badgenumber, checktime, checktype, verifycode, sensorid, workcode, sn
-            FROM checkinout
-            ORDER BY checktime, sn
-            """
-            cursor.execute(query)
-
         if limit:
-            # Limit the results
-            records = []
-            for i, row in enumerate(cursor.fetchall()):
-                if i >= limit:
-                    break
-                records.append(row)
+            # A single SELECT TOP page; Jet never produces more than we keep
+            records = list(islice(iter_checkinout(conn, last_timestamp, last_sn, page_size=limit), limit))
         else:
-            records = cursor.fetchall()
+            records = list(iter_checkinout(conn, last_timestamp, last_sn, page_size=ACCESS_PAGE_SIZE))
         
         conn.close()
         return records
@@ -330,42 +252,33 @@ def get_new_records_from_access(last_timestamp=None, last_sn=None, limit=None):
             conn.close()
         return []
 
-def sync_records_to_cloud(access_records):
-    """Sync records from Access to MySQL cloud database"""
-    if not access_records:
-        return 0
-
-    # Check if target table exists
-    if not check_table_exists():
-        log_msg("ERROR: access_device_logs table does not exist in MySQL database!")
-        log_msg("Please create the table using create_access_table.sql before running sync.")
-        return 0
+def iter_new_records_from_access(last_timestamp=None, last_sn=None, page_size=None):
+    """
+    Yield new checkinout records one at a time, reading them from Access in
+    keyset-paginated SELECT TOP pages so the full delta is never held in
+    memory. Errors propagate to the caller.
+    """
+    conn = connect_to_access_db()
+    if not conn:
+        raise ConnectionError("Could not connect to Access database")
 
-    # Ensure the unique constraint exists to prevent duplicates
-    ensure_unique_constraint()
+    try:
+        for row in iter_checkinout(conn, last_timestamp, last_sn, page_size=page_size or ACCESS_PAGE_SIZE):
+            yield row
+    finally:
+        conn.close()
 
+def upload_records_to_cloud(access_records):
+    """
+    Upload one batch of Access records and commit it.
+    Returns the number of records written; raises on failure.
+    """
     mysql_conn = connect_to_mysql_db()
     if not mysql_conn:
-        return 0
+        raise ConnectionError("Could not connect to MySQL database")
 
     try:
-        cursor = mysql_conn.cursor()
-
-        # Prepare INSERT statement for the new access_device_logs table
-        insert_query = """
-        INSERT INTO access_device_logs
-        (badge_number, check_time, check_type, verify_code, sensor_id, work_code, device_sn, raw_data)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-        ON DUPLICATE KEY UPDATE
-            check_type = VALUES(check_type),
-            verify_code = VALUES(verify_code),
-            sensor_id = VALUES(sensor_id),
-            work_code = VALUES(work_code),
-            raw_data = VALUES(raw_data),
-            server_time = VALUES(server_time)
-        """
-
-        count = 0
+        rows = []
         for record in access_records:
             # Extract Access fields
             badgenumber = record[0]  # Badgenumber
@@ -380,7 +293,7 @@ def sync_records_to_cloud(access_records):
             raw_data = f"Badge:{badgenumber}|CheckTime:{checktime}|Type:{checktype}|Verify:{verifycode}|Sensor:{sensorid}|WorkCode:{workcode}|SN:{sn}"
 
             # Map to MySQL fields
-            values = (
+            rows.append((
                 str(badgenumber) if badgenumber else '',  # badge_number
                 str(checktime) if checktime else None,    # check_time
                 str(checktype) if checktype else '',      # check_type
@@ -389,24 +302,53 @@ def sync_records_to_cloud(access_records):
                 str(workcode) if workcode else '',        # work_code
                 str(sn) if sn else 'HIP_ACCESS_DB',       # device_sn
                 raw_data                                   # raw_data
-            )
+            ))
 
-            cursor.execute(insert_query, values)
-            count += 1
+        # Multi-row INSERT ... ON DUPLICATE KEY UPDATE, one round trip per statement
+        try:
+            result = bulk_insert(mysql_conn, "access_device_logs", ACCESS_DEVICE_LOG_COLUMNS, rows,
+                                 update_columns=ACCESS_DEVICE_LOG_UPDATE_COLUMNS)
+        except Exception as e:
+            schema.handle_error("access_device_logs", e)
+            raise
 
         mysql_conn.commit()
-        log_msg(f"Uploaded {count} records to cloud database")
-        return count
+        log_msg(f"Uploaded {result.submitted} records to cloud database "
+                f"({result.inserted} new, {result.ignored} already present, {result.statements} statements)")
+        return result.submitted
+    finally:
+        mysql_conn.close()
+
+def sync_records_to_cloud(access_records):
+    """Sync records from Access to MySQL cloud database"""
+    if not access_records:
+        return 0
 
+    # Check if target table exists
+    if not check_table_exists():
+        log_msg("ERROR: access_device_logs table does not exist in MySQL database!")
+        log_msg("Please create the table using create_access_table.sql before running sync.")
+        return 0
+
+    try:
+        return upload_records_to_cloud(access_records)
     except Exception as e:
         log_msg(f"Error syncing to MySQL: {e}")
         return 0
-    finally:
-        if mysql_conn and mysql_conn.is_connected():
-            mysql_conn.close()
+
+def checkpoint_sync_position(last_record):
+    """Save the sync position of the last record in a committed batch"""
+    batch_last_timestamp = str(last_record[1])  # checktime is at index 1
+    batch_last_sn = str(last_record[6]) if last_record[6] else 'UNKNOWN'  # sn is at index 6
+    set_last_sync_position(batch_last_timestamp, batch_last_sn)
+    log_msg(f"Updated sync position to: {batch_last_timestamp}|{batch_last_sn}")
 
 def sync_from_access_to_cloud():
-    """Main sync function with batching and per-batch sync position updates"""
+    """
+    Main sync function. Reading from Access and uploading to MySQL overlap in
+    a SyncPipeline; the sync position only advances past a batch once it and
+    every batch before it have committed.
+    """
     log_msg("Starting sync from MS Access to Cloud...")
 
     # Check if target table exists first
@@ -418,44 +360,125 @@ def sync_from_access_to_cloud():
     # Get last sync position
     last_timestamp, last_sn = get_last_sync_position()
 
-    # Get total count first
-    all_records = get_new_records_from_access(last_timestamp, last_sn)
-    total_records = len(all_records)
-    
-    if total_records == 0:
+    log_msg(f"Streaming new records from Access in batches of {batch_controller.batch_size} "
+            f"({PIPELINE_WORKERS} upload workers)...")
+
+    pipeline = SyncPipeline(
+        upload_records_to_cloud,
+        checkpoint_sync_position,
+        batch_size=BATCH_SIZE,
+        workers=PIPELINE_WORKERS,
+        queue_batches=PIPELINE_QUEUE_BATCHES,
+        controller=batch_controller,
+        logger=log_msg
+    )
+    total_uploaded = pipeline.run(iter_new_records_from_access(last_timestamp, last_sn))
+
+    if pipeline.batches_read == 0 and not pipeline.failed:
         log_msg("No new records found in Access database")
         return 0
 
-    log_msg(f"Found {total_records} new records in Access database. Processing in batches of {BATCH_SIZE}...")
-
-    # Process in batches
-    total_uploaded = 0
-    for i in range(0, total_records, BATCH_SIZE):
-        batch = all_records[i:i + BATCH_SIZE]
-        batch_uploaded = sync_records_to_cloud(batch)
-        total_uploaded += batch_uploaded
-        
-        log_msg(f"Processed batch {i//BATCH_SIZE + 1}: {batch_uploaded} records uploaded")
-        
-        # Update last sync position after each batch with the last record's position
-        if batch:
-            last_record = batch[-1]  # Get the last record in this batch
-            batch_last_timestamp = str(last_record[1])  # checktime is at index 1
-            batch_last_sn = str(last_record[6]) if last_record[6] else 'UNKNOWN'  # sn is at index 6
-            set_last_sync_position(batch_last_timestamp, batch_last_sn)
-            log_msg(f"Updated sync position to: {batch_last_timestamp}|{batch_last_sn}")
-        
-        # Small delay between batches to avoid overwhelming the database
-        time.sleep(0.1)
+    if pipeline.failed:
+        log_msg("Sync stopped early; remaining records will be retried on the next run.")
 
     log_msg(f"Sync completed. Total uploaded: {total_uploaded} records.")
     return total_uploaded
 
+def run_backfill():
+    """
+    Partitioned parallel upload of the whole checkinout history (--backfill).
+    Hands the consolidated watermark to incremental mode once every partition
+    is done; an interrupted run resumes from BACKFILL_STATE_FILE.
+    """
+    log_msg("Starting partitioned backfill from MS Access to Cloud...")
+
+    backfill = access_backfill.Backfill(
+        connect_to_access_db,
+        upload_records_to_cloud,
+        state_file=BACKFILL_STATE_FILE,
+        partition_months=BACKFILL_PARTITION_MONTHS,
+        workers=BACKFILL_WORKERS,
+        batch_size=BACKFILL_BATCH_SIZE,
+        page_size=ACCESS_PAGE_SIZE,
+        logger=log_msg
+    )
+    watermark = backfill.run()
+    if watermark is None:
+        return False
+
+    timestamp, sn = watermark
+    last_timestamp, _ = get_last_sync_position()
+    try:
+        keep_existing = last_timestamp and datetime.fromisoformat(last_timestamp) > timestamp
+    except ValueError:
+        keep_existing = False
+
+    if keep_existing:
+        log_msg(f"Backfill complete; keeping newer sync position {last_timestamp}")
+    else:
+        set_last_sync_position(str(timestamp), sn if sn else 'UNKNOWN')
+        log_msg(f"Backfill complete; sync position set to {timestamp}|{sn if sn else 'UNKNOWN'}")
+    return True
+
+def run_dedup():
+    """
+    Remove duplicate access_device_logs rows in throttled id ranges (--dedup),
+    then add the unique_badge_time_sn constraint. Resumable after interruption.
+    """
+    log_msg("Starting chunked de-duplication of access_device_logs...")
+    constraint_name, key_columns = TABLES["access_device_logs"]["unique"]
+    deduplicator = cloud_dedup.Deduplicator(
+        connect_to_mysql_db,
+        "access_device_logs",
+        key_columns,
+        constraint_name,
+        logger=log_msg,
+        **DEDUP_OPTIONS
+    )
+    try:
+        done = deduplicator.run()
+    except Exception as e:
+        log_msg(f"De-duplication failed: {e}")
+        return False
+    schema.invalidate("access_device_logs")
+    return done
+
+def run_reconcile(days=None):
+    """
+    Compare per-day digests of Access and the cloud over the last `days`
+    days (--reconcile) and re-upload only the days that differ.
+    """
+    days = int(days or RECONCILE_DAYS)
+    until = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    since = until - timedelta(days=days)
+    log_msg(f"Starting reconciliation of the last {days} days...")
+
+    reconciler = reconcile.Reconciler(
+        connect_to_access_db,
+        connect_to_mysql_db,
+        upload_records_to_cloud,
+        batch_size=BACKFILL_BATCH_SIZE,
+        page_size=ACCESS_PAGE_SIZE,
+        logger=log_msg
+    )
+    try:
+        remaining = reconciler.run(since, until)
+    except Exception as e:
+        log_msg(f"Reconciliation failed: {e}")
+        return False
+
+    if remaining:
+        log_msg(f"{len(remaining)} days still differ after re-upload: {', '.join(remaining)}")
+        return False
+    log_msg("Reconciliation complete; Access and cloud agree")
+    return True
+
 if __name__ == "__main__":
     log_msg("=== MS Access to Cloud Sync Service Started ===")
     log_msg(f"Access DB: {ACCESS_DB_PATH}")
     log_msg(f"Schedule: {UPLOAD_TIMES}")  # Show the scheduled times like the original
-    log_msg(f"Batch size: {BATCH_SIZE} records")
+    log_msg(f"Batch size: {BATCH_SIZE} records (adaptive, "
+            f"{batch_controller.min_size}-{batch_controller.max_size})")
 
     # Check if credentials are loaded
     log_msg(f"Credential status: {'LOADED' if credentials else 'FAILED TO LOAD'}")
@@ -476,6 +499,19 @@ if __name__ == "__main__":
     log_msg("Lock acquired. Proceeding with sync service...")
 
     try:
+        if "--backfill" in sys.argv:
+            # One-off historical load, then exit; the scheduled service continues incrementally
+            sys.exit(0 if run_backfill() else 1)
+
+        if "--dedup" in sys.argv:
+            sys.exit(0 if run_dedup() else 1)
+
+        if "--reconcile" in sys.argv:
+            # Nightly verification: optional day count after the flag
+            position = sys.argv.index("--reconcile") + 1
+            days = sys.argv[position] if position < len(sys.argv) and sys.argv[position].isdigit() else None
+            sys.exit(0 if run_reconcile(days) else 1)
+
         # For continuous operation with scheduled times (like original sync_to_cloud.py)
         log_msg("--- Starting scheduled sync mode ---")
         last_run_minute = None
@@ -500,6 +536,8 @@ if __name__ == "__main__":
 
             # Sleep for 30 seconds to spare CPU
             time.sleep(30)
+            # Picks up schedule edits (see on_config_changed)
+            config_service.refresh()
 
     except KeyboardInterrupt:
         log_msg("Sync service interrupted by user")
@@ -511,6 +549,7 @@ if __name__ == "__main__":
     finally:
         # Always release the lock when exiting
         release_lock()
+        mysql_pool.close_all_pools()
         log_msg("Lock released.")
 
     log_msg("=== MS Access to Cloud Sync Service Ended ===")
\ No newline at end of file
@@ -5,6 +5,12 @@ import sys
 from datetime import datetime
 import json
 from cryptography.fernet import Fernet
+import mysql_pool
+from config_service import get_config_service
+from cloud_bulk_writer import bulk_insert, ACCESS_DEVICE_LOG_COLUMNS, ACCESS_DEVICE_LOG_UPDATE_COLUMNS
+from sync_pipeline import SyncPipeline, DEFAULT_WORKERS, DEFAULT_QUEUE_BATCHES
+from adaptive_batch import BatchSizeController
+from schema_manager import SchemaManager, DEFAULT_TTL as DEFAULT_SCHEMA_TTL
 
 # Platform-specific file locking
 try:
@@ -26,22 +32,19 @@ except ImportError:
 CONFIG_FILE = "config.json"
 ENCRYPTED_CREDENTIALS_FILE = "encrypted_credentials.bin"
 
+DEFAULT_CONFIG = {
+    "ACCESS_DB_PATH": "D:\\Program Files (x86)\\HIPPremiumTime-2.0.4\\db\\Pm2014.mdb",
+    "UPLOAD_TIMES": ["09:00", "12:00", "17:00", "22:00"],
+    "LAST_SYNC_FILE": "last_sync_access_pure.txt",
+    "BATCH_SIZE": 100
+}
+
+# Parsed once; re-read only when the file changes on disk
+config_service = get_config_service(CONFIG_FILE, defaults=DEFAULT_CONFIG)
+
 def load_config():
-    """Load public configuration from JSON file"""
-    try:
-        with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        # Default config
-        return {
-            "ACCESS_DB_PATH": "D:\\Program Files (x86)\\HIPPremiumTime-2.0.4\\db\\Pm2014.mdb",
-            "UPLOAD_TIMES": ["09:00", "12:00", "17:00", "22:00"],
-            "LAST_SYNC_FILE": "last_sync_access_pure.txt",
-            "BATCH_SIZE": 100
-        }
-    except Exception as e:
-        print(f"Error loading config: {e}")
-        return {}
+    """Current configuration (read-only snapshot, reloaded when the file changes)"""
+    return config_service.get()
 
 def load_encrypted_credentials():
     """Load and decrypt credentials from encrypted file"""
@@ -62,13 +65,7 @@ def load_encrypted_credentials():
 
 def save_config(config):
     """Save public configuration to JSON file"""
-    try:
-        with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-            json.dump(config, f, indent=4, ensure_ascii=False)
-        return True
-    except Exception as e:
-        print(f"Error saving config: {e}")
-        return False
+    return config_service.save(config)
 
 def get_last_sync_position():
     """Get the last sync position (timestamp and SN) from file"""
@@ -98,6 +95,9 @@ credentials = load_encrypted_credentials()
 ACCESS_DB_PATH = config.get("ACCESS_DB_PATH", "D:\\Program Files (x86)\\HIPPremiumTime-2.0.4\\db\\Pm2014.mdb")
 UPLOAD_TIMES = config.get("UPLOAD_TIMES", ["09:00", "12:00", "17:00", "22:00"])
 BATCH_SIZE = config.get("BATCH_SIZE", 100)
+PIPELINE_WORKERS = config.get("PIPELINE_WORKERS", DEFAULT_WORKERS)
+PIPELINE_QUEUE_BATCHES = config.get("PIPELINE_QUEUE_BATCHES", DEFAULT_QUEUE_BATCHES)
+SCHEMA_CACHE_TTL = config.get("SCHEMA_CACHE_TTL", DEFAULT_SCHEMA_TTL)
 
 # Lock file for preventing multiple instances
 LOCK_FILE = "access_to_cloud_pure.lock"
@@ -158,87 +158,32 @@ def release_lock():
 def connect_to_mysql_db():
     """Connect to the MySQL cloud database"""
     try:
-        conn = pymysql.connect(
-            host=credentials.get('host', 'localhost'),
-            user=credentials.get('user', ''),
-            password=credentials.get('password', ''),
-            database=credentials.get('database', ''),
-            port=credentials.get('port', 3306),
-            charset='utf8mb4',
-            cursorclass=pymysql.cursors.DictCursor
-        )
+        # Borrow a pooled connection; close() hands it back for the next batch
+        conn = mysql_pool.connect(credentials, cursorclass=pymysql.cursors.DictCursor)
         return conn
     except Exception as e:
         log_msg(f"Error connecting to MySQL database: {e}")
         return None
 
-def check_table_exists():
-    """Check if the target table exists in MySQL database"""
-    mysql_conn = connect_to_mysql_db()
-    if not mysql_conn:
-        return False
+# Batch size and pacing learned from upload latency; kept across scheduled runs
+batch_controller = BatchSizeController.from_config(config, logger=log_msg)
 
-    try:
-        cursor = mysql_conn.cursor()
-        cursor.execute("SELECT 1 FROM access_device_logs LIMIT 1")
-        cursor.fetchone()
-        mysql_conn.close()
-        return True
-    except:
-        mysql_conn.close()
-        return False
+def on_config_changed(new, old):
+    """Apply an edited schedule and batch settings without restarting the service"""
+    global UPLOAD_TIMES, BATCH_SIZE
+    UPLOAD_TIMES = new.get("UPLOAD_TIMES", UPLOAD_TIMES)
+    BATCH_SIZE = new.get("BATCH_SIZE", BATCH_SIZE)
+    batch_controller.apply_config(new)
+    log_msg(f"Configuration reloaded. Schedule: {list(UPLOAD_TIMES)}, batch size: {BATCH_SIZE}")
 
-def ensure_unique_constraint():
-    """Ensure the unique constraint exists on the table to prevent duplicates"""
-    mysql_conn = connect_to_mysql_db()
-    if not mysql_conn:
-        return False
+config_service.subscribe(on_config_changed)
 
-    try:
-        cursor = mysql_conn.cursor()
-
-        # Check if the unique constraint already exists
-        cursor.execute("""
-            SELECT COUNT(*)
-            FROM information_schema.TABLE_CONSTRAINTS
-            WHERE TABLE_SCHEMA = %s
-            AND TABLE_NAME = 'access_device_logs'
-            AND CONSTRAINT_NAME = 'unique_badge_time_sn'
-        """, (credentials.get('database', ''),))
-
-        result = cursor.fetchone()
-        constraint_exists = result['COUNT(*)'] > 0 if result else False
-
-        if not constraint_exists:
-            # First, remove any existing duplicates
-            log_msg("Removing existing duplicates before adding unique constraint...")
-            cursor.execute("""
-                DELETE t1 FROM access_device_logs t1
-                INNER JOIN access_device_logs t2
-                WHERE t1.id > t2.id
-                AND t1.badge_number = t2.badge_number
-                AND t1.check_time = t2.check_time
-                AND t1.device_sn = t2.device_sn
-            """)
-
-            # Then add the unique constraint
-            cursor.execute("""
-                ALTER TABLE access_device_logs
-                ADD CONSTRAINT unique_badge_time_sn UNIQUE (badge_number, check_time, device_sn)
-            """)
-            log_msg("Unique constraint added successfully.")
-        else:
-            log_msg("Unique constraint already exists.")
+# Verified once per TTL instead of before every batch
+schema = SchemaManager(connect_to_mysql_db, ["access_device_logs"], ttl=SCHEMA_CACHE_TTL, logger=log_msg)
 
-        mysql_conn.commit()
-        return True
-    except Exception as e:
-        log_msg(f"Error ensuring unique constraint: {e}")
-        # If constraint creation fails, we can still continue with the ON DUPLICATE KEY UPDATE approach
-        return True  # Return True to allow the sync to continue
-    finally:
-        if mysql_conn and mysql_conn.is_connected():
-            mysql_conn.close()
+def check_table_exists():
+    """Check (cached) that access_device_logs exists with its unique constraint, creating it if missing"""
+    return schema.ensure("access_device_logs")
 
 def parse_access_records_pure(last_timestamp=None, last_sn=None):
     """
@@ -342,39 +287,14 @@ def parse_access_records_pure(last_timestamp=None, last_sn=None):
         traceback.print_exc()
         return []
 
-def sync_records_to_cloud(access_records):
-    """Sync records from Access to MySQL cloud database"""
-    if not access_records:
-        return 0
-
-    if not check_table_exists():
-        log_msg("ERROR: access_device_logs table does not exist in MySQL database!")
-        return 0
-
-    # Ensure the unique constraint exists to prevent duplicates
-    ensure_unique_constraint()
-
+def upload_records_to_cloud(access_records):
+    """Upload and commit one batch. Returns the record count; raises on failure."""
     mysql_conn = connect_to_mysql_db()
     if not mysql_conn:
-        return 0
+        raise ConnectionError("Could not connect to MySQL database")
 
     try:
-        cursor = mysql_conn.cursor()
-
-        insert_query = """
-        INSERT INTO access_device_logs
-        (badge_number, check_time, check_type, verify_code, sensor_id, work_code, device_sn, raw_data)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-        ON DUPLICATE KEY UPDATE
-            check_type = VALUES(check_type),
-            verify_code = VALUES(verify_code),
-            sensor_id = VALUES(sensor_id),
-            work_code = VALUES(work_code),
-            raw_data = VALUES(raw_data),
-            server_time = VALUES(server_time)
-        """
-
-        count = 0
+        rows = []
         for record in access_records:
             badgenumber = record[0]
             checktime = record[1]
@@ -389,7 +309,7 @@ def sync_records_to_cloud(access_records):
 
             raw_data = f"Badge:{badgenumber}|CheckTime:{checktime_str}|Type:{checktype}|Verify:{verifycode}|Sensor:{sensorid}|WorkCode:{workcode}|SN:{sn}"
 
-            values = (
+            rows.append((
                 str(badgenumber) if badgenumber else '',
                 checktime_str,
                 str(checktype) if checktype else '',
@@ -398,20 +318,43 @@ def sync_records_to_cloud(access_records):
                 str(workcode) if workcode else '',
                 str(sn) if sn else 'HIP_ACCESS_DB',
                 raw_data
-            )
+            ))
 
-            cursor.execute(insert_query, values)
-            count += 1
+        try:
+            result = bulk_insert(mysql_conn, "access_device_logs", ACCESS_DEVICE_LOG_COLUMNS, rows,
+                                 update_columns=ACCESS_DEVICE_LOG_UPDATE_COLUMNS)
+        except Exception as e:
+            schema.handle_error("access_device_logs", e)
+            raise
 
         mysql_conn.commit()
-        return count
+        log_msg(f"Uploaded {result.submitted} records ({result.inserted} new, {result.ignored} already present)")
+        return result.submitted
+    finally:
+        mysql_conn.close()
+
+def sync_records_to_cloud(access_records):
+    """Sync records from Access to MySQL cloud database"""
+    if not access_records:
+        return 0
 
+    if not check_table_exists():
+        log_msg("ERROR: access_device_logs table does not exist in MySQL database!")
+        return 0
+
+    try:
+        return upload_records_to_cloud(access_records)
     except Exception as e:
         log_msg(f"Error syncing to MySQL: {e}")
         return 0
-    finally:
-        if mysql_conn and mysql_conn.is_connected():
-            mysql_conn.close()
+
+def checkpoint_sync_position(last_record):
+    """Save the sync position of the last record in a committed batch"""
+    # timestamp is at index 1 (datetime object)
+    batch_last_timestamp = last_record[1].strftime("%Y-%m-%d %H:%M:%S")
+    batch_last_sn = str(last_record[6]) if last_record[6] else 'UNKNOWN'
+    set_last_sync_position(batch_last_timestamp, batch_last_sn)
+    log_msg(f"Updated sync position to: {batch_last_timestamp}|{batch_last_sn}")
 
 def sync_from_access_to_cloud():
     """Main sync function"""
@@ -428,25 +371,25 @@ def sync_from_access_to_cloud():
         log_msg("No new records found.")
         return 0
 
-    log_msg(f"Found {total_records} new records. Processing in batches of {BATCH_SIZE}...")
+    if not check_table_exists():
+        log_msg("ERROR: access_device_logs table does not exist in MySQL database!")
+        return 0
 
-    total_uploaded = 0
-    for i in range(0, total_records, BATCH_SIZE):
-        batch = all_records[i:i + BATCH_SIZE]
-        batch_uploaded = sync_records_to_cloud(batch)
-        total_uploaded += batch_uploaded
-        
-        log_msg(f"Processed batch {i//BATCH_SIZE + 1}: {batch_uploaded} records uploaded")
-        
-        if batch:
-            last_record = batch[-1]
-            # timestamp is at index 1 (datetime object)
-            batch_last_timestamp = last_record[1].strftime("%Y-%m-%d %H:%M:%S")
-            batch_last_sn = str(last_record[6]) if last_record[6] else 'UNKNOWN'
-            set_last_sync_position(batch_last_timestamp, batch_last_sn)
-            log_msg(f"Updated sync position to: {batch_last_timestamp}|{batch_last_sn}")
-        
-        time.sleep(0.1)
+    log_msg(f"Found {total_records} new records. Processing in batches of {batch_controller.batch_size}...")
+
+    pipeline = SyncPipeline(
+        upload_records_to_cloud,
+        checkpoint_sync_position,
+        batch_size=BATCH_SIZE,
+        workers=PIPELINE_WORKERS,
+        queue_batches=PIPELINE_QUEUE_BATCHES,
+        controller=batch_controller,
+        logger=log_msg
+    )
+    total_uploaded = pipeline.run(all_records)
+
+    if pipeline.failed:
+        log_msg("Sync stopped early; remaining records will be retried on the next run.")
 
     log_msg(f"Sync completed. Total uploaded: {total_uploaded} records.")
     return total_uploaded
@@ -479,6 +422,8 @@ if __name__ == "__main__":
                     last_run_minute = current_time
 
             time.sleep(30)
+            # Picks up schedule edits (see on_config_changed)
+            config_service.refresh()
 
     except KeyboardInterrupt:
         log_msg("Sync service interrupted by user")
@@ -487,4 +432,5 @@ if __name__ == "__main__":
     finally:
         # Always release the lock when exiting
         release_lock()
+        mysql_pool.close_all_pools()
         log_msg("Lock released.")
@@ -4,13 +4,19 @@ Provides a user-friendly interface with system tray controls
 """
 import os
 import sys
-import json
 import threading
 import time
 from datetime import datetime
+from itertools import islice
 import pyodbc
 import pymysql
-from cryptography.fernet import Fernet
+import mysql_pool
+from config_service import get_config_service
+from credential_provider import get_credential_provider
+from schema_manager import SchemaManager, DEFAULT_TTL as DEFAULT_SCHEMA_TTL
+from cloud_bulk_writer import bulk_insert, ACCESS_DEVICE_LOG_COLUMNS
+from access_paging import iter_checkinout, DEFAULT_PAGE_SIZE
+from adaptive_batch import BatchSizeController
 from PyQt5.QtWidgets import QApplication, QSystemTrayIcon, QMenu, QAction, QMessageBox, QDialog, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit, QPushButton, QTextEdit, QGroupBox, QFormLayout
 from PyQt5.QtGui import QIcon, QPixmap
 from PyQt5.QtCore import QTimer, QThread, pyqtSignal
@@ -21,61 +27,31 @@ import ctypes
 CONFIG_FILE = "config.json"
 ENCRYPTED_CREDENTIALS_FILE = "encrypted_credentials.bin"
 
+DEFAULT_CONFIG = {
+    "ACCESS_DB_PATH": "D:\\\\Program Files (x86)\\\\HIPPremiumTime-2.0.4\\\\db\\\\Pm2014.mdb",
+    "ACCESS_PASSWORD": "hippmforyou",
+    "UPLOAD_TIMES": ["09:00", "12:00", "17:00", "22:00"],
+    "LAST_SYNC_FILE": "last_sync_access.txt",
+    "BATCH_SIZE": 100
+}
+
+# Parsed once; re-read only when the file changes on disk
+config_service = get_config_service(CONFIG_FILE, defaults=DEFAULT_CONFIG, create_missing=True)
+
 def load_config():
-    """Load public configuration from JSON file"""
-    try:
-        with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        # Create default config if file doesn't exist
-        default_config = {
-            "ACCESS_DB_PATH": "D:\\\\Program Files (x86)\\\\HIPPremiumTime-2.0.4\\\\db\\\\Pm2014.mdb",
-            "ACCESS_PASSWORD": "hippmforyou",
-            "UPLOAD_TIMES": ["09:00", "12:00", "17:00", "22:00"],
-            "LAST_SYNC_FILE": "last_sync_access.txt",
-            "BATCH_SIZE": 100
-        }
-        save_config(default_config)
-        return default_config
-    except Exception as e:
-        print(f"Error loading config: {e}")
-        return {
-            "ACCESS_DB_PATH": "D:\\\\Program Files (x86)\\\\HIPPremiumTime-2.0.4\\\\db\\\\Pm2014.mdb",
-            "ACCESS_PASSWORD": "hippmforyou",
-            "UPLOAD_TIMES": ["09:00", "12:00", "17:00", "22:00"],
-            "LAST_SYNC_FILE": "last_sync_access.txt",
-            "BATCH_SIZE": 100
-        }
+    """Current configuration as an editable dict (served from the shared cache, no disk read)"""
+    return config_service.as_dict()
+
+# Decrypted once; decrypted again only when the .bin file changes
+credential_provider = get_credential_provider(ENCRYPTED_CREDENTIALS_FILE)
 
 def load_encrypted_credentials():
-    """Load and decrypt credentials from encrypted file"""
-    try:
-        # Fixed encryption key - this must match the key used in encrypt_credentials.py
-        ENCRYPTION_KEY = b'XZgpn7Se8pQeHY8RMyeYf6e5Twq9PdOBVo9JPsqHZA4='
-        
-        with open(ENCRYPTED_CREDENTIALS_FILE, 'rb') as f:
-            encrypted_data = f.read()
-        
-        fernet = Fernet(ENCRYPTION_KEY)
-        decrypted_data = fernet.decrypt(encrypted_data)
-        credentials = json.loads(decrypted_data.decode())
-        return credentials.get("DB_CONFIG", {})
-    except FileNotFoundError:
-        print(f"Encrypted credentials file {ENCRYPTED_CREDENTIALS_FILE} not found!")
-        return {}
-    except Exception as e:
-        print(f"Error decrypting credentials: {e}")
-        return {}
+    """Database credentials (cached in memory, no file read or decrypt per call)"""
+    return credential_provider.get()
 
 def save_config(config):
     """Save public configuration to JSON file"""
-    try:
-        with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-            json.dump(config, f, indent=4, ensure_ascii=False)
-        return True
-    except Exception as e:
-        print(f"Error saving config: {e}")
-        return False
+    return config_service.save(config)
 
 def log_msg(message):
     print(f"[{datetime.now()}] {message}")
@@ -91,6 +67,25 @@ class SyncWorker(QThread):
         self.running = False
         self.paused = False
         self.credentials = load_encrypted_credentials()
+        # Batch size and pacing learned from upload latency, kept for the worker's lifetime
+        self.batch_controller = BatchSizeController.from_config(config_service.get(), logger=self.log_signal.emit)
+        # Verified once per TTL instead of before every batch
+        self.schema = SchemaManager(
+            self.connect_to_mysql_db,
+            ["access_device_logs"],
+            ttl=config_service.get().get("SCHEMA_CACHE_TTL", DEFAULT_SCHEMA_TTL),
+            logger=self.log_signal.emit
+        )
+        self.upload_times = config_service.get().get("UPLOAD_TIMES", ["09:00", "12:00", "17:00", "22:00"])
+        # Schedule and batch edits (config dialog or the file itself) apply without a restart
+        config_service.subscribe(self._on_config_changed)
+
+    def _on_config_changed(self, new, old):
+        upload_times = new.get("UPLOAD_TIMES", ["09:00", "12:00", "17:00", "22:00"])
+        if list(upload_times) != list(self.upload_times):
+            self.log_signal.emit(f"Upload schedule changed to {', '.join(upload_times)}")
+        self.upload_times = upload_times
+        self.batch_controller.apply_config(new)
     
     def run(self):
         self.running = True
@@ -99,9 +94,9 @@ class SyncWorker(QThread):
         while self.running:
             # Check if paused at the beginning of the loop
             if not self.paused:
-                # Reload config periodically to pick up changes
-                current_config = load_config()
-                current_upload_times = current_config.get("UPLOAD_TIMES", ["09:00", "12:00", "17:00", "22:00"])
+                # Only stats the file; a changed schedule arrives via _on_config_changed
+                config_service.refresh()
+                current_upload_times = self.upload_times
 
                 now = datetime.now()
                 current_time = now.strftime("%H:%M")
@@ -139,8 +134,8 @@ class SyncWorker(QThread):
     def connect_to_access_db(self):
         """Connect to the MS Access database"""
         try:
-            # Load config dynamically
-            config = load_config()
+            # Current settings (cached; re-read only after the file changes)
+            config = config_service.get()
             db_path = config.get("ACCESS_DB_PATH", "D:\\\\Program Files (x86)\\\\HIPPremiumTime-2.0.4\\\\db\\\\Pm2014.mdb")
             password = config.get("ACCESS_PASSWORD", "hippmforyou")
 
@@ -159,16 +154,11 @@ class SyncWorker(QThread):
     def connect_to_mysql_db(self):
         """Connect to the MySQL cloud database"""
         try:
-            # Load credentials dynamically
+            # Served from memory; re-decrypted only after the file changes
             current_credentials = load_encrypted_credentials()
 
-            conn = pymysql.connect(
-                host=current_credentials.get('host', 'localhost'),
-                user=current_credentials.get('user', ''),
-                password=current_credentials.get('password', ''),
-                database=current_credentials.get('database', ''),
-                port=current_credentials.get('port', 3306),
-                charset='utf8mb4',
+            conn = mysql_pool.connect(
+                current_credentials,
                 cursorclass=pymysql.cursors.DictCursor,
                 connect_timeout=60,
                 read_timeout=60,
@@ -180,25 +170,13 @@ class SyncWorker(QThread):
             return None
 
     def check_table_exists(self):
-        """Check if the target table exists in MySQL database"""
-        mysql_conn = self.connect_to_mysql_db()
-        if not mysql_conn:
-            return False
-        
-        try:
-            cursor = mysql_conn.cursor()
-            cursor.execute("SELECT 1 FROM access_device_logs LIMIT 1")
-            cursor.fetchone()
-            mysql_conn.close()
-            return True
-        except:
-            mysql_conn.close()
-            return False
+        """Check (cached) that access_device_logs exists with its unique constraint"""
+        return self.schema.ensure("access_device_logs")
 
     def get_last_sync_position(self):
         """Get the last sync position (timestamp and SN) from file"""
         try:
-            with open(load_config().get("LAST_SYNC_FILE", "last_sync_access.txt"), 'r') as f:
+            with open(config_service.get().get("LAST_SYNC_FILE", "last_sync_access.txt"), 'r') as f:
                 content = f.read().strip()
                 if '|' in content:
                     timestamp_part, sn_part = content.rsplit('|', 1)
@@ -210,7 +188,7 @@ class SyncWorker(QThread):
 
     def set_last_sync_position(self, timestamp, sn):
         """Save the last sync position (timestamp and SN) to file"""
-        with open(load_config().get("LAST_SYNC_FILE", "last_sync_access.txt"), 'w') as f:
+        with open(config_service.get().get("LAST_SYNC_FILE", "last_sync_access.txt"), 'w') as f:
             f.write(f"{timestamp}|{sn}")
 
     def get_new_records_from_access(self, last_timestamp=None, last_sn=None, limit=None):
@@ -220,45 +198,12 @@ class SyncWorker(QThread):
             return []
 
         try:
-            cursor = conn.cursor()
-
-            if last_timestamp:
-                if last_sn:
-                    # Get records newer than last sync position (timestamp + SN)
-                    query = """
-                    SELECT Badgenumber, checktime, checktype, verifycode, sensorid, workcode, sn
-                    FROM checkinout
-                    WHERE (checktime > ?) OR (checktime = ? AND sn > ?)
-                    ORDER BY checktime, sn
-                    """
-                    cursor.execute(query, (last_timestamp, last_timestamp, last_sn))
-                else:
-                    # Get records newer than last timestamp only
-                    query = """
-                    SELECT Badgenumber, checktime, checktype, verifycode, sensorid, workcode, sn
-                    FROM checkinout
-                    WHERE checktime > ?
-                    ORDER BY checktime, sn
-                    """
-                    cursor.execute(query, (last_timestamp,))
-            else:
-                # Get all records (first sync)
-                query = """
-                SELECT Badgenumber, checktime, checktype, verifycode, sensorid, workcode, sn
-                FROM checkinout
-                ORDER BY checktime, sn
-                """
-                cursor.execute(query)
-
             if limit:
-                # Limit the results
-                records = []
-                for i, row in enumerate(cursor.fetchall()):
-                    if i >= limit:
-                        break
-                    records.append(row)
+                # Limit the results with a single SELECT TOP page
+                records = list(islice(iter_checkinout(conn, last_timestamp, last_sn, page_size=limit), limit))
             else:
-                records = cursor.fetchall()
+                page_size = config_service.get().get("ACCESS_PAGE_SIZE", DEFAULT_PAGE_SIZE)
+                records = list(iter_checkinout(conn, last_timestamp, last_sn, page_size=page_size))
 
             conn.close()
             return records
@@ -268,6 +213,19 @@ class SyncWorker(QThread):
                 conn.close()
             return []
 
+    def iter_new_records_from_access(self, last_timestamp=None, last_sn=None):
+        """Yield new records page by page (SELECT TOP keyset pagination); errors propagate"""
+        conn = self.connect_to_access_db()
+        if not conn:
+            raise ConnectionError("Could not connect to Access database")
+
+        try:
+            page_size = config_service.get().get("ACCESS_PAGE_SIZE", DEFAULT_PAGE_SIZE)
+            for row in iter_checkinout(conn, last_timestamp, last_sn, page_size=page_size):
+                yield row
+        finally:
+            conn.close()
+
     def sync_records_to_cloud(self, access_records):
         """Sync records from Access to MySQL cloud database"""
         if not access_records:
@@ -284,16 +242,7 @@ class SyncWorker(QThread):
             return 0
 
         try:
-            cursor = mysql_conn.cursor()
-
-            # Prepare INSERT statement for the new access_device_logs table
-            insert_query = """
-            INSERT IGNORE INTO access_device_logs
-            (badge_number, check_time, check_type, verify_code, sensor_id, work_code, device_sn, raw_data)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-            """
-
-            count = 0
+            rows = []
             for record in access_records:
                 # Extract Access fields
                 badgenumber = record[0]  # Badgenumber
@@ -308,7 +257,7 @@ class SyncWorker(QThread):
                 raw_data = f"Badge:{badgenumber}|CheckTime:{checktime}|Type:{checktype}|Verify:{verifycode}|Sensor:{sensorid}|WorkCode:{workcode}|SN:{sn}"
 
                 # Map to MySQL fields
-                values = (
+                rows.append((
                     str(badgenumber) if badgenumber else '',  # badge_number
                     str(checktime) if checktime else None,    # check_time
                     str(checktype) if checktype else '',      # check_type
@@ -317,24 +266,24 @@ class SyncWorker(QThread):
                     str(workcode) if workcode else '',        # work_code
                     str(sn) if sn else 'HIP_ACCESS_DB',       # device_sn
                     raw_data                                   # raw_data
-                )
+                ))
 
-                cursor.execute(insert_query, values)
-                count += 1
+            # One multi-row INSERT IGNORE instead of a round trip per record
+            try:
+                result = bulk_insert(mysql_conn, "access_device_logs", ACCESS_DEVICE_LOG_COLUMNS, rows)
+            except Exception as e:
+                self.schema.handle_error("access_device_logs", e)
+                raise
 
             mysql_conn.commit()
-            self.log_signal.emit(f"Uploaded {count} records to cloud database")
-            return count
+            self.log_signal.emit(f"Uploaded {result.submitted} records to cloud database "
+                                 f"({result.inserted} new, {result.ignored} already present)")
+            return result.submitted
 
         except Exception as e:
             self.log_signal.emit(f"Error syncing to MySQL: {e}")
             return 0
         finally:
-            try:
-                if 'cursor' in locals():
-                    cursor.close()
-            except:
-                pass
             try:
                 if mysql_conn and mysql_conn.open:
                     mysql_conn.close()
@@ -354,47 +303,56 @@ class SyncWorker(QThread):
         # Get last sync position
         last_timestamp, last_sn = self.get_last_sync_position()
 
-        # Get total count first
-        all_records = self.get_new_records_from_access(last_timestamp, last_sn)
-        total_records = len(all_records)
+        # Batch size adapts to measured upload latency (BATCH_SIZE_MIN..BATCH_SIZE_MAX)
+        controller = self.batch_controller
 
-        if total_records == 0:
-            self.log_signal.emit("No new records found in Access database")
-            return 0
-
-        # Get current config for batch size
-        current_config = load_config()
-        current_batch_size = current_config.get("BATCH_SIZE", 100)
-
-        self.log_signal.emit(f"Found {total_records} new records in Access database. Processing in batches of {current_batch_size}...")
+        # Stream new records page by page instead of loading the whole delta
+        records = self.iter_new_records_from_access(last_timestamp, last_sn)
 
         # Process in batches
         total_uploaded = 0
-        for i in range(0, total_records, current_batch_size):
-            # Check if we should stop/pause during processing
-            if self.paused or not self.running:
-                self.log_signal.emit("Sync interrupted due to pause or stop command.")
-                break
-
-            batch = all_records[i:i + current_batch_size]
-            batch_uploaded = self.sync_records_to_cloud(batch)
-            total_uploaded += batch_uploaded
-
-            self.log_signal.emit(f"Processed batch {i//current_batch_size + 1}: {batch_uploaded} records uploaded")
-
-            # Update last sync position after each batch with the last record's position
-            if batch:
+        batch_number = 0
+        try:
+            while True:
+                # Check if we should stop/pause during processing
+                if self.paused or not self.running:
+                    self.log_signal.emit("Sync interrupted due to pause or stop command.")
+                    break
+
+                batch = list(islice(records, controller.batch_size))
+                if not batch:
+                    break
+                batch_number += 1
+                if batch_number == 1:
+                    self.log_signal.emit(f"Found new records in Access database. Processing in batches of {len(batch)}...")
+
+                started = time.monotonic()
+                batch_uploaded = self.sync_records_to_cloud(batch)
+                controller.record(len(batch), time.monotonic() - started, batch_uploaded > 0)
+                total_uploaded += batch_uploaded
+
+                self.log_signal.emit(f"Processed batch {batch_number}: {batch_uploaded} records uploaded")
+
+                # Update last sync position after each batch with the last record's position
                 last_record = batch[-1]  # Get the last record in this batch
                 batch_last_timestamp = str(last_record[1])  # checktime is at index 1
                 batch_last_sn = str(last_record[6]) if last_record[6] else 'UNKNOWN'  # sn is at index 6
                 self.set_last_sync_position(batch_last_timestamp, batch_last_sn)
                 self.log_signal.emit(f"Updated sync position to: {batch_last_timestamp}|{batch_last_sn}")
 
-            # Small delay between batches to avoid overwhelming the database
-            # Check pause status during the delay
-            start_time = time.time()
-            while time.time() - start_time < 0.1 and not self.paused and self.running:
-                time.sleep(0.01)  # Small sleep to allow checking pause status
+                # Adaptive delay between batches (grows while the link is struggling)
+                # Check pause status during the delay
+                start_time = time.time()
+                while time.time() - start_time < controller.delay and not self.paused and self.running:
+                    time.sleep(0.01)  # Small sleep to allow checking pause status
+        except Exception as e:
+            self.log_signal.emit(f"Error querying Access database: {e}")
+        finally:
+            records.close()
+
+        if batch_number == 0:
+            self.log_signal.emit("No new records found in Access database")
+            return 0
 
         self.log_signal.emit(f"Sync completed. Total uploaded: {total_uploaded} records.")
         return total_uploaded
@@ -554,6 +512,9 @@ class SystemTrayApp:
         
         self.config_action = self.tray_menu.addAction("Configure")
         self.config_action.triggered.connect(self.configure_settings)
+
+        self.credentials_action = self.tray_menu.addAction("Reload Credentials")
+        self.credentials_action.triggered.connect(self.reload_credentials)
         
         self.logs_action = self.tray_menu.addAction("View Logs")
         self.logs_action.triggered.connect(self.view_logs)
@@ -622,6 +583,13 @@ class SystemTrayApp:
         status = "Running" if not self.worker.paused else "Stopped"
         QMessageBox.information(None, "Service Status", f"Current status: {status}")
     
+    def reload_credentials(self):
+        """Decrypt encrypted_credentials.bin again (e.g. after replacing it)"""
+        if credential_provider.refresh():
+            QMessageBox.information(None, "Credentials", "Credentials reloaded.")
+        else:
+            QMessageBox.warning(None, "Credentials", "Could not load credentials. Check the logs for details.")
+
     def configure_settings(self):
         """Open configuration dialog"""
         try:
@@ -0,0 +1,104 @@
+"""
+Adaptive upload batch sizing from observed commit latency.
+Grows the batch while commits stay under the latency target and shrinks it (AIMD) when they do not.
+"""
+
+import threading
+
+DEFAULT_MIN_SIZE = 25
+DEFAULT_MAX_SIZE = 2000
+DEFAULT_TARGET_SECONDS = 5.0
+DEFAULT_MAX_DELAY_SECONDS = 10.0
+
+# Delay used after the first failure; doubled on each further one
+FAILURE_DELAY_SECONDS = 0.5
+
+
+class BatchSizeController(object):
+    """Thread-safe AIMD controller for the upload batch size and inter-batch delay"""
+
+    def __init__(self, initial_size=100, min_size=DEFAULT_MIN_SIZE, max_size=DEFAULT_MAX_SIZE,
+                 target_seconds=DEFAULT_TARGET_SECONDS, max_delay=DEFAULT_MAX_DELAY_SECONDS,
+                 increase_step=None, logger=None):
+        self.min_size = max(1, int(min_size))
+        self.max_size = max(self.min_size, int(max_size))
+        self.target_seconds = max(0.01, float(target_seconds))
+        self.max_delay = max(0.0, float(max_delay))
+        self.initial_size = int(initial_size)
+        self._size = min(self.max_size, max(self.min_size, self.initial_size))
+        # Grow by a quarter of the starting size per good batch unless told otherwise
+        self.increase_step = max(1, int(increase_step or self._size // 4 or 1))
+        self._delay = 0.0
+        self._lock = threading.Lock()
+        self.logger = logger or print
+
+    @classmethod
+    def from_config(cls, config, logger=None):
+        """Build from the BATCH_SIZE* keys of a config dict"""
+        return cls(
+            initial_size=config.get("BATCH_SIZE", 100),
+            min_size=config.get("BATCH_SIZE_MIN", DEFAULT_MIN_SIZE),
+            max_size=config.get("BATCH_SIZE_MAX", DEFAULT_MAX_SIZE),
+            target_seconds=config.get("BATCH_TARGET_SECONDS", DEFAULT_TARGET_SECONDS),
+            max_delay=config.get("BATCH_MAX_DELAY_SECONDS", DEFAULT_MAX_DELAY_SECONDS),
+            logger=logger,
+        )
+
+    def apply_config(self, config):
+        """
+        Take edited BATCH_SIZE* settings without a restart. A new BATCH_SIZE
+        restarts adaptation from that size; new limits clamp the current one.
+        """
+        with self._lock:
+            old_size = self._size
+            self.min_size = max(1, int(config.get("BATCH_SIZE_MIN", self.min_size)))
+            self.max_size = max(self.min_size, int(config.get("BATCH_SIZE_MAX", self.max_size)))
+            self.target_seconds = max(0.01, float(config.get("BATCH_TARGET_SECONDS", self.target_seconds)))
+            self.max_delay = max(0.0, float(config.get("BATCH_MAX_DELAY_SECONDS", self.max_delay)))
+            self._delay = min(self._delay, self.max_delay)
+
+            initial_size = int(config.get("BATCH_SIZE", self.initial_size))
+            if initial_size != self.initial_size:
+                self.initial_size = initial_size
+                self.increase_step = max(1, initial_size // 4 or 1)
+                self._size = initial_size
+            self._size = min(self.max_size, max(self.min_size, self._size))
+
+            if self._size != old_size:
+                self.log(f"Batch size {old_size} -> {self._size}: settings changed")
+
+    def log(self, message):
+        self.logger(message)
+
+    @property
+    def batch_size(self):
+        with self._lock:
+            return self._size
+
+    @property
+    def delay(self):
+        with self._lock:
+            return self._delay
+
+    def record(self, rows, seconds, ok):
+        """Feed back one batch: its row count, commit latency in seconds and whether it succeeded"""
+        with self._lock:
+            old_size, old_delay = self._size, self._delay
+
+            if not ok:
+                self._size = max(self.min_size, self._size // 2)
+                self._delay = min(self.max_delay, max(FAILURE_DELAY_SECONDS, self._delay * 2))
+                reason = f"batch of {rows} failed after {seconds:.1f}s"
+            elif seconds > self.target_seconds:
+                factor = max(0.5, self.target_seconds / seconds)
+                self._size = max(self.min_size, int(self._size * factor))
+                reason = f"{rows} rows took {seconds:.1f}s (target {self.target_seconds:.1f}s)"
+            else:
+                # Only grow once a full-sized batch proved fast; a short tail batch says little
+                if rows >= self._size:
+                    self._size = min(self.max_size, self._size + self.increase_step)
+                self._delay = self._delay / 2 if self._delay >= 0.05 else 0.0
+                reason = f"{rows} rows committed in {seconds:.1f}s"
+
+            if self._size != old_size or (self._delay > old_delay):
+                self.log(f"Batch size {old_size} -> {self._size}, delay {old_delay:.2f}s -> {self._delay:.2f}s: {reason}")
@@ -0,0 +1,213 @@
+"""
+asyncio ADMS push server for large device fleets.
+Keeps every connection on one event loop and runs the ADMS handler on a small thread pool.
+"""
+
+import asyncio
+import concurrent.futures
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPMessage
+
+from http_body import BodyReader, BodyError
+from log_callback import level_logger
+
+DEFAULT_MAX_CONNECTIONS = 2000
+DEFAULT_REQUEST_TIMEOUT = 30
+DEFAULT_WORKER_THREADS = 4
+
+MAX_HEADER_BYTES = 16 * 1024
+
+# Content-Length bodies up to this size are read on the event loop before
+# dispatch; anything larger (or chunked) streams into the worker thread
+BUFFERED_BODY_BYTES = 256 * 1024
+
+REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    405: "Method Not Allowed",
+    408: "Request Timeout",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+
+
+class BadRequest(Exception):
+    def __init__(self, status, message):
+        Exception.__init__(self, message)
+        self.status = status
+
+
+class AsyncADMSServer(object):
+    """
+    Single-threaded asyncio HTTP/1.0 front end for an ADMS request handler.
+
+    dispatch(method, raw_path, body) -> (status, text) runs on the worker
+    thread pool, so blocking work (parsing, disk writes) never stalls the
+    event loop. sock serves an already listening socket instead of binding
+    host:port (prefork workers).
+    """
+
+    def __init__(self, dispatch, host="0.0.0.0", port=8080, max_connections=DEFAULT_MAX_CONNECTIONS,
+                 request_timeout=DEFAULT_REQUEST_TIMEOUT, worker_threads=DEFAULT_WORKER_THREADS, logger=None,
+                 sock=None):
+        self.dispatch = dispatch
+        self.host = host
+        self.port = port
+        self.sock = sock
+        self.max_connections = max(1, int(max_connections))
+        self.request_timeout = max(1.0, float(request_timeout))
+        self.worker_threads = max(1, int(worker_threads))
+        self.logger = level_logger(logger)
+        self.active_connections = 0
+        self.rejected_connections = 0
+        self._executor = None
+
+    def log(self, message, level="INFO"):
+        self.logger(message, level)
+
+    async def _read_head(self, reader):
+        """Read the request line and headers; returns (method, raw_path, headers)"""
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except asyncio.LimitOverrunError:
+            raise BadRequest(400, "request headers too large")
+        except asyncio.IncompleteReadError:
+            raise BadRequest(400, "connection closed before end of headers")
+
+        lines = head.decode('latin-1').split("\r\n")
+        parts = lines[0].split()
+        if len(parts) < 2:
+            raise BadRequest(400, f"malformed request line: {lines[0][:100]!r}")
+        method, raw_path = parts[0].upper(), parts[1]
+        if method not in ('GET', 'POST'):
+            raise BadRequest(405, f"unsupported method {method}")
+
+        headers = HTTPMessage()
+        for line in lines[1:]:
+            if ':' in line:
+                name, value = line.split(':', 1)
+                headers[name.strip()] = value.strip()
+        return method, raw_path, headers
+
+    async def _open_body(self, reader, headers):
+        """
+        BodyReader for a POST body: small Content-Length bodies are read here
+        so slow uploads do not hold a worker thread, the rest is streamed.
+        """
+        body = BodyReader.from_headers(_BlockingStream(reader, asyncio.get_running_loop(), self.request_timeout),
+                                       headers)
+        if not body.chunked and body.content_length <= BUFFERED_BODY_BYTES:
+            try:
+                data = await asyncio.wait_for(reader.readexactly(body.content_length), self.request_timeout)
+            except asyncio.IncompleteReadError:
+                raise BadRequest(400, "connection closed before end of body")
+            return BodyReader.from_bytes(data)
+        return body
+
+    async def _respond(self, writer, status, text):
+        body = text.encode('utf-8')
+        head = (f"HTTP/1.0 {status} {REASONS.get(status, '')}\r\n"
+                f"Content-Type: text/plain\r\n"
+                f"Content-Length: {len(body)}\r\n\r\n").encode('latin-1')
+        writer.write(head + body)
+        await asyncio.wait_for(writer.drain(), self.request_timeout)
+
+    async def _handle_connection(self, reader, writer):
+        peer = writer.get_extra_info('peername')
+        if self.active_connections >= self.max_connections:
+            self.rejected_connections += 1
+            if self.rejected_connections % 100 == 1:
+                self.log(f"Connection limit {self.max_connections} reached; "
+                         f"{self.rejected_connections} connections turned away so far", "WARNING")
+            try:
+                await self._respond(writer, 503, "BUSY")
+            except Exception:
+                pass
+            writer.close()
+            return
+
+        self.active_connections += 1
+        try:
+            try:
+                method, raw_path, headers = await asyncio.wait_for(self._read_head(reader), self.request_timeout)
+                body = await self._open_body(reader, headers) if method == 'POST' else b""
+            except asyncio.TimeoutError:
+                self.log(f"Request from {peer} timed out after {self.request_timeout:.0f}s", "WARNING")
+                await self._respond(writer, 408, "TIMEOUT")
+                return
+            except (BadRequest, BodyError) as e:
+                self.log(f"Bad request from {peer}: {e}", "WARNING")
+                await self._respond(writer, e.status, "ERROR")
+                return
+
+            loop = asyncio.get_running_loop()
+            try:
+                status, text = await loop.run_in_executor(self._executor, self.dispatch, method, raw_path, body)
+            except Exception as e:
+                self.log(f"Error handling {method} {raw_path} from {peer}: {e}", "ERROR")
+                status, text = 500, "ERROR"
+            await self._respond(writer, status, text)
+        except (ConnectionError, asyncio.TimeoutError):
+            pass
+        finally:
+            self.active_connections -= 1
+            try:
+                writer.close()
+            except Exception:
+                pass
+
+    async def serve(self):
+        self._executor = ThreadPoolExecutor(max_workers=self.worker_threads, thread_name_prefix="adms-worker")
+        if self.sock is not None:
+            server = await asyncio.start_server(self._handle_connection, sock=self.sock, limit=MAX_HEADER_BYTES)
+        else:
+            server = await asyncio.start_server(
+                self._handle_connection, self.host, self.port,
+                limit=MAX_HEADER_BYTES, backlog=min(self.max_connections, 4096))
+        self.log(f"Async ADMS server started on {self.host}:{self.port} "
+                 f"(max {self.max_connections} connections, {self.worker_threads} worker threads)")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self._executor.shutdown(wait=True)
+
+    def run(self):
+        """Serve until interrupted (Ctrl+C raises KeyboardInterrupt to the caller)"""
+        asyncio.run(self.serve())
+
+
+class _BlockingStream(object):
+    """
+    File-like read()/readline() over an asyncio StreamReader for BodyReader
+    on a worker thread; each call waits on the event loop for at most
+    timeout seconds.
+    """
+
+    def __init__(self, reader, loop, timeout):
+        self.reader = reader
+        self.loop = loop
+        self.timeout = timeout
+
+    def _wait(self, coro):
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        try:
+            return future.result(self.timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise BodyError(408, f"no body data for {self.timeout:.0f}s")
+        except ValueError:
+            # StreamReader line limit
+            raise BodyError(400, "chunk header too large")
+        except OSError as e:
+            raise BodyError(400, f"connection lost: {e}")
+
+    def read(self, size=-1):
+        return self._wait(self.reader.read(size))
+
+    def readline(self, limit=-1):
+        line = self._wait(self.reader.readline())
+        if 0 <= limit < len(line):
+            raise BodyError(400, "chunk header too large")
+        return line
@@ -0,0 +1,292 @@
+"""
+Buffered, rotating local journal of received attendance records.
+A background thread writes queued records in batches, fsyncs by policy and rotates by size or age.
+"""
+
+import glob
+import gzip
+import os
+import shutil
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from log_callback import level_logger
+
+FSYNC_ALWAYS = "always"
+FSYNC_INTERVAL = "interval"
+FSYNC_NEVER = "never"
+
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+DEFAULT_ROTATE_HOURS = 24
+DEFAULT_BACKUP_COUNT = 30
+DEFAULT_FSYNC = FSYNC_INTERVAL
+DEFAULT_FSYNC_INTERVAL = 1.0
+DEFAULT_FLUSH_INTERVAL = 0.5
+DEFAULT_MAX_QUEUE = 100000
+
+# Wait before retrying a rotation that failed
+ROTATE_RETRY_SECONDS = 60
+
+# Sidecar next to the journal holding the time its current file was started
+CREATED_SUFFIX = ".created"
+
+
+class AttendanceJournal(object):
+    """
+    Append-only journal with a background flusher thread.
+
+    formatter(item) -> str turns a queued item into one line (without the
+    newline); it runs on the flusher thread, not the caller's.
+    """
+
+    def __init__(self, path, formatter=str, max_bytes=DEFAULT_MAX_BYTES,
+                 rotate_seconds=DEFAULT_ROTATE_HOURS * 3600, backup_count=DEFAULT_BACKUP_COUNT,
+                 compress=True, fsync=DEFAULT_FSYNC, fsync_interval=DEFAULT_FSYNC_INTERVAL,
+                 flush_interval=DEFAULT_FLUSH_INTERVAL, max_queue=DEFAULT_MAX_QUEUE, logger=None):
+        if fsync not in (FSYNC_ALWAYS, FSYNC_INTERVAL, FSYNC_NEVER):
+            raise ValueError(f"fsync must be '{FSYNC_ALWAYS}', '{FSYNC_INTERVAL}' or '{FSYNC_NEVER}', not {fsync!r}")
+        self.path = path
+        self.formatter = formatter
+        self.max_bytes = max(0, int(max_bytes))
+        self.rotate_seconds = max(0.0, float(rotate_seconds))
+        self.backup_count = max(0, int(backup_count))
+        self.compress = compress
+        self.fsync = fsync
+        self.fsync_interval = max(0.0, float(fsync_interval))
+        self.flush_interval = max(0.01, float(flush_interval))
+        self.max_queue = max(1, int(max_queue))
+        self.logger = level_logger(logger)
+        self.dropped = 0
+
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._closing = False
+        self._busy = False
+        self._file = None
+        self._opened_at = 0.0
+        self._last_fsync = 0.0
+        self._last_write = 0.0
+        self._retry_rotate_at = 0.0
+        self._thread = threading.Thread(target=self._run, name="attendance-journal", daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def from_config(cls, path, config, formatter=str, logger=None):
+        """Build from the JOURNAL_* keys of a config dict"""
+        return cls(
+            path,
+            formatter=formatter,
+            max_bytes=config.get("JOURNAL_MAX_BYTES", DEFAULT_MAX_BYTES),
+            rotate_seconds=config.get("JOURNAL_ROTATE_HOURS", DEFAULT_ROTATE_HOURS) * 3600,
+            backup_count=config.get("JOURNAL_BACKUP_COUNT", DEFAULT_BACKUP_COUNT),
+            compress=config.get("JOURNAL_COMPRESS", True),
+            fsync=config.get("JOURNAL_FSYNC", DEFAULT_FSYNC),
+            max_queue=config.get("JOURNAL_QUEUE_SIZE", DEFAULT_MAX_QUEUE),
+            logger=logger,
+        )
+
+    def log(self, message, level="INFO"):
+        self.logger(message, level)
+
+    def write(self, item):
+        """Queue one item; returns False if it was dropped because the queue is full"""
+        return self.write_many((item,)) == 1
+
+    def write_many(self, items):
+        """Queue items without touching the disk; returns how many were accepted"""
+        items = list(items)
+        with self._cond:
+            if self._closing:
+                return 0
+            room = self.max_queue - len(self._queue)
+            accepted = items[:max(0, room)]
+            self._queue.extend(accepted)
+            lost = len(items) - len(accepted)
+            if lost:
+                # Warn on the first drop and then once per 10,000 dropped records
+                warn = self.dropped == 0 or (self.dropped // 10000) != ((self.dropped + lost) // 10000)
+                self.dropped += lost
+            self._cond.notify()
+        if lost and warn:
+            self.log(f"Attendance journal queue full ({self.max_queue} records); "
+                     f"{self.dropped} records not journaled so far", "WARNING")
+        return len(accepted)
+
+    def pending(self):
+        with self._cond:
+            return len(self._queue)
+
+    def flush(self, timeout=None):
+        """Wait until everything queued so far is written; returns False on timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._cond.notify()
+            while self._queue or self._busy:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining if remaining is not None else self.flush_interval)
+        return True
+
+    def close(self, timeout=10):
+        """Write what is still queued and stop the flusher"""
+        with self._cond:
+            if self._closing:
+                return
+            self._closing = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._queue and not self._closing:
+                    self._cond.wait(self.flush_interval)
+                closing = self._closing
+                batch = list(self._queue)
+                self._queue.clear()
+                self._busy = bool(batch)
+            if not batch:
+                if closing:
+                    break
+                self._maybe_periodic_fsync()
+                continue
+            try:
+                self._write_batch(batch)
+            except Exception as e:
+                self.log(f"Error writing to attendance journal {self.path}: {e}", "ERROR")
+                self._close_file()
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+        self._close_file()
+
+    def _write_batch(self, batch):
+        lines = []
+        for item in batch:
+            try:
+                lines.append(self.formatter(item) + "\n")
+            except Exception as e:
+                self.log(f"Skipping unformattable journal record {item!r}: {e}", "ERROR")
+        if time.monotonic() >= self._retry_rotate_at and self._should_rotate():
+            try:
+                self._rotate()
+            except Exception as e:
+                # Keep appending to the current file (e.g. locked by a viewer); retry later
+                self.log(f"Could not rotate attendance journal {self.path}: {e}", "WARNING")
+                self._retry_rotate_at = time.monotonic() + ROTATE_RETRY_SECONDS
+        if self._file is None:
+            self._open()
+        self._file.write("".join(lines))
+        self._file.flush()
+        self._last_write = time.monotonic()
+        if self.fsync == FSYNC_ALWAYS:
+            self._fsync()
+        elif self.fsync == FSYNC_INTERVAL and time.monotonic() - self._last_fsync >= self.fsync_interval:
+            self._fsync()
+
+    def _maybe_periodic_fsync(self):
+        # Unsynced tail of an "interval" journal once traffic stops
+        if (self._file is not None and self.fsync == FSYNC_INTERVAL
+                and self._last_fsync < self._last_write
+                and time.monotonic() - self._last_fsync >= self.fsync_interval):
+            try:
+                self._fsync()
+            except Exception as e:
+                self.log(f"Error syncing attendance journal {self.path}: {e}", "ERROR")
+
+    def _fsync(self):
+        os.fsync(self._file.fileno())
+        self._last_fsync = time.monotonic()
+
+    def _open(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        self._file = open(self.path, 'a', encoding='utf-8')
+        if self._file.tell():
+            # An existing journal keeps aging from when it was started
+            self._opened_at = self._created_at()
+        else:
+            self._opened_at = time.time()
+            self._write_created(self._opened_at)
+
+    def _created_at(self):
+        """When the current journal file was started; st_ctime is only that on Windows"""
+        try:
+            st = os.stat(self.path)
+            if hasattr(st, "st_birthtime"):
+                return st.st_birthtime
+            if os.name == "nt":
+                return st.st_ctime
+        except OSError:
+            pass
+        try:
+            with open(self.path + CREATED_SUFFIX, encoding='utf-8') as f:
+                return float(f.read().strip())
+        except (OSError, ValueError):
+            # Journal from before the sidecar existed: age it from now
+            created = time.time()
+            self._write_created(created)
+            return created
+
+    def _write_created(self, created):
+        try:
+            with open(self.path + CREATED_SUFFIX, 'w', encoding='utf-8') as f:
+                f.write(f"{created:.3f}\n")
+        except OSError as e:
+            self.log(f"Could not record start time of attendance journal {self.path}: {e}", "WARNING")
+
+    def _close_file(self):
+        if self._file is not None:
+            try:
+                self._file.flush()
+                if self.fsync != FSYNC_NEVER:
+                    os.fsync(self._file.fileno())
+                self._file.close()
+            except Exception as e:
+                self.log(f"Error closing attendance journal {self.path}: {e}", "ERROR")
+            self._file = None
+
+    def _should_rotate(self):
+        try:
+            size = self._file.tell() if self._file is not None else os.path.getsize(self.path)
+        except OSError:
+            return False
+        if size == 0:
+            return False
+        if self.max_bytes and size >= self.max_bytes:
+            return True
+        if self.rotate_seconds:
+            opened_at = self._opened_at if self._file is not None else self._created_at()
+            return time.time() - opened_at >= self.rotate_seconds
+        return False
+
+    def _rotate(self):
+        self._close_file()
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        target = f"{self.path}.{stamp}"
+        suffix = 1
+        while os.path.exists(target) or os.path.exists(target + ".gz"):
+            target = f"{self.path}.{stamp}-{suffix}"
+            suffix += 1
+        os.replace(self.path, target)
+        if self.compress:
+            with open(target, 'rb') as src, gzip.open(target + ".gz", 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(target)
+            target += ".gz"
+        self.log(f"Rotated attendance journal to {target}")
+        self._prune()
+
+    def _prune(self):
+        segments = sorted((path for path in glob.glob(glob.escape(self.path) + ".*")
+                           if not path.endswith(".tmp") and path != self.path + CREATED_SUFFIX),
+                          key=lambda path: (os.path.getmtime(path), path))
+        for old in segments[:max(0, len(segments) - self.backup_count)]:
+            try:
+                os.remove(old)
+            except OSError as e:
+                self.log(f"Could not remove old journal segment {old}: {e}", "WARNING")
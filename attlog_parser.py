@@ -0,0 +1,230 @@
+"""
+Batch parser for ADMS ATTLOG push bodies.
+Detects each device's line layout once and parses whole bodies (or streamed lines) into column batches.
+"""
+
+import threading
+from datetime import datetime
+from itertools import repeat
+
+from log_callback import level_logger
+
+# Date layouts seen on ZKTeco/HIP firmware
+DATE_FORMATS = ("%Y-%m-%d", "%Y/%m/%d", "%d/%m/%Y")
+
+# Tab-separated lines carry "date time" in one field; whitespace-separated
+# lines carry them as two tokens
+SEPARATORS = ("\t", None)
+
+MERIDIEMS = frozenset(("AM", "PM", "am", "pm"))
+
+# Memo caches are cleared when they grow beyond this many entries
+MAX_CACHE_ENTRIES = 100000
+
+# Records per batch yielded by parse_stream()
+DEFAULT_STREAM_BATCH = 5000
+
+
+class AttlogBatch(object):
+    """Parsed ATTLOG records of one push, column by column"""
+
+    __slots__ = ("device_sn", "received_at", "user_ids", "check_times", "check_types",
+                 "verify_types", "work_codes", "raw_lines", "rejected", "first_rejected")
+
+    def __init__(self, device_sn, received_at):
+        self.device_sn = device_sn
+        self.received_at = received_at
+        self.user_ids = []
+        self.check_times = []
+        self.check_types = []
+        self.verify_types = []
+        self.work_codes = []
+        self.raw_lines = []
+        self.rejected = 0
+        self.first_rejected = None
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    def rows(self):
+        """
+        Row tuples: (device_sn, user_id, check_time, check_type,
+        verify_type, work_code, raw_data, received_at)
+        """
+        return zip(repeat(self.device_sn), self.user_ids, self.check_times, self.check_types,
+                   self.verify_types, self.work_codes, self.raw_lines, repeat(self.received_at))
+
+
+class _Layout(object):
+    __slots__ = ("separator", "ampm", "date_format")
+
+    def __init__(self, separator, ampm, date_format):
+        self.separator = separator
+        self.ampm = ampm
+        self.date_format = date_format
+
+    def __repr__(self):
+        separator = "tab" if self.separator == "\t" else "whitespace"
+        clock = "12h" if self.ampm else "24h"
+        return f"{separator}/{self.date_format}/{clock}"
+
+
+ALL_LAYOUTS = tuple(_Layout(separator, ampm, date_format)
+                    for separator in SEPARATORS
+                    for ampm in (False, True)
+                    for date_format in DATE_FORMATS)
+
+
+class AttlogParser(object):
+    """Thread-safe; keep one instance per process so layouts and caches are shared"""
+
+    def __init__(self, logger=None):
+        self.logger = level_logger(logger)
+        self._layouts = {}
+        self._dates = {}
+        self._times = {}
+        self._lock = threading.Lock()
+
+    def log(self, message, level="INFO"):
+        self.logger(message, level)
+
+    def layout_for(self, device_sn):
+        """Cached layout of a device, or None before its first parsed line"""
+        return self._layouts.get(device_sn)
+
+    def _date(self, text, date_format):
+        cache = self._dates.get(date_format)
+        if cache is None:
+            cache = self._dates.setdefault(date_format, {})
+        value = cache.get(text)
+        if value is None:
+            value = datetime.strptime(text, date_format).strftime("%Y-%m-%d")
+            if len(cache) >= MAX_CACHE_ENTRIES:
+                cache.clear()
+            cache[text] = value
+        return value
+
+    def _time(self, text, meridiem):
+        key = text if meridiem is None else f"{text} {meridiem}"
+        value = self._times.get(key)
+        if value is None:
+            hour, minute, second = (int(part) for part in text.split(":"))
+            if meridiem is not None:
+                if not 1 <= hour <= 12 or meridiem not in ("AM", "PM"):
+                    raise ValueError(f"invalid 12-hour time {text} {meridiem}")
+                hour = hour % 12 + (12 if meridiem == "PM" else 0)
+            if not (0 <= hour < 24 and 0 <= minute < 60 and 0 <= second < 60):
+                raise ValueError(f"invalid time {text}")
+            value = f"{hour:02d}:{minute:02d}:{second:02d}"
+            if len(self._times) >= MAX_CACHE_ENTRIES:
+                self._times.clear()
+            self._times[key] = value
+        return value
+
+    def _parse_line(self, line, layout):
+        """(user_id, check_time, check_type, verify_type, work_code); raises on mismatch"""
+        parts = line.split(layout.separator)
+        if layout.separator is None:
+            date_text, time_text = parts[1], parts[2]
+            index = 3
+        else:
+            stamp = parts[1].strip()
+            date_text, _, time_text = stamp.partition(" ")
+            if not time_text:
+                date_text, _, time_text = stamp.partition("T")
+            index = 2
+        count = len(parts)
+        meridiem = None
+        if layout.ampm:
+            meridiem = parts[index].strip().upper()
+            index += 1
+        elif count > index and parts[index] in MERIDIEMS:
+            raise ValueError("12-hour time in a 24-hour layout")
+
+        check_time = f"{self._date(date_text, layout.date_format)} {self._time(time_text, meridiem)}"
+        return (parts[0].strip(), check_time,
+                parts[index].strip() if count > index else "",
+                parts[index + 1].strip() if count > index + 1 else "",
+                parts[index + 2].strip() if count > index + 2 else "")
+
+    def _detect(self, line):
+        for layout in ALL_LAYOUTS:
+            try:
+                return layout, self._parse_line(line, layout)
+            except (ValueError, IndexError):
+                continue
+        return None, None
+
+    def parse(self, device_sn, body, received_at=None):
+        """Parse a whole ATTLOG body (str) into an AttlogBatch"""
+        return next(self.parse_stream(device_sn, body.split("\n"), received_at, batch_size=0))
+
+    def parse_stream(self, device_sn, lines, received_at=None, batch_size=DEFAULT_STREAM_BATCH):
+        """
+        Parse an iterable of ATTLOG lines, yielding AttlogBatches of at most
+        batch_size records (0 = everything in one batch). Always yields at
+        least one batch, the last possibly empty.
+        """
+        received_at = received_at or datetime.now()
+        received_text = received_at.strftime("%Y-%m-%d %H:%M:%S")
+        layout = self._layouts.get(device_sn)
+        alternate, alternate_lines = None, 0
+        parsed_lines = rejected = 0
+        first_rejected = None
+
+        batch = AttlogBatch(device_sn, received_text)
+        user_ids, check_times = batch.user_ids, batch.check_times
+        check_types, verify_types, work_codes = batch.check_types, batch.verify_types, batch.work_codes
+        raw_lines = batch.raw_lines
+
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            parsed = None
+            if layout is not None:
+                try:
+                    parsed = self._parse_line(line, layout)
+                except (ValueError, IndexError):
+                    parsed = None
+            if parsed is None:
+                # Slow path: first line of a new device, or a line in another layout
+                found, parsed = self._detect(line)
+                if found is None:
+                    batch.rejected += 1
+                    rejected += 1
+                    if first_rejected is None:
+                        first_rejected = batch.first_rejected = line
+                    continue
+                if layout is None:
+                    layout = found
+                else:
+                    alternate, alternate_lines = found, alternate_lines + 1
+
+            user_id, check_time, check_type, verify_type, work_code = parsed
+            user_ids.append(user_id)
+            check_times.append(check_time)
+            check_types.append(check_type)
+            verify_types.append(verify_type)
+            work_codes.append(work_code)
+            raw_lines.append(line)
+            parsed_lines += 1
+
+            if batch_size and len(user_ids) >= batch_size:
+                yield batch
+                batch = AttlogBatch(device_sn, received_text)
+                user_ids, check_times = batch.user_ids, batch.check_times
+                check_types, verify_types, work_codes = batch.check_types, batch.verify_types, batch.work_codes
+                raw_lines = batch.raw_lines
+
+        if alternate is not None and alternate_lines * 2 > parsed_lines:
+            layout = alternate
+        if layout is not None and self._layouts.get(device_sn) is not layout:
+            with self._lock:
+                self._layouts[device_sn] = layout
+            self.log(f"ATTLOG layout for device {device_sn}: {layout!r}")
+
+        if rejected:
+            self.log(f"{rejected} ATTLOG lines from {device_sn} could not be parsed "
+                     f"(first: {first_rejected[:200]!r})", "WARNING")
+        yield batch
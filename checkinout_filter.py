@@ -0,0 +1,215 @@
+"""
+Watermark filter for checkinout rows parsed by access-parser.
+Selects rows after (last_timestamp, last_sn) sorted by (checktime, sn), vectorized when NumPy is available.
+"""
+
+from datetime import datetime, timedelta
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+RECORD_COLUMNS = ('badgenumber', 'checktime', 'checktype', 'verifycode', 'sensorid', 'workcode', 'sn')
+
+WATERMARK_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def resolve_columns(table):
+    """Map lower-case column names to the actual keys in the parsed table"""
+    columns = {name: None for name in RECORD_COLUMNS}
+    for col_name in table.keys():
+        lower_name = col_name.lower()
+        if lower_name in columns:
+            columns[lower_name] = col_name
+    return columns
+
+
+def _column(table, columns, name, num_rows):
+    key = columns.get(name)
+    values = table[key] if key else None
+    if isinstance(values, dict):
+        return [values.get(i) for i in range(num_rows)]
+    if not isinstance(values, list):
+        return [None] * num_rows
+    if len(values) < num_rows:
+        return values + [None] * (num_rows - len(values))
+    return values
+
+
+def _row_count(table, columns):
+    first_col = next((c for c in columns.values() if c is not None), None)
+    if not first_col:
+        return 0
+    values = table[first_col]
+    if isinstance(values, dict):
+        return max(values.keys()) + 1 if values else 0
+    if isinstance(values, list):
+        return len(values)
+    return 0
+
+
+def parse_checktime(value):
+    """datetime (rounded to the second) from a datetime or its string form; None if invalid"""
+    if not value:
+        return None
+    if not isinstance(value, datetime):
+        try:
+            value = datetime.fromisoformat(str(value))
+        except ValueError:
+            return None
+    if value.microsecond:
+        value = value.replace(microsecond=0) + timedelta(seconds=1 if value.microsecond >= 500000 else 0)
+    return value
+
+
+def parse_watermark(last_timestamp):
+    """Watermark timestamp as datetime; an unreadable watermark means 'from the beginning'"""
+    try:
+        return datetime.strptime(str(last_timestamp), WATERMARK_FORMAT)
+    except ValueError:
+        return datetime.min
+
+
+def sn_is_newer(sn, last_sn):
+    """SN tie-break for rows at the watermark timestamp: numeric when both are digits"""
+    curr_sn_val = sn or 0
+    last_sn_val = last_sn or 0
+    if str(curr_sn_val).isdigit() and str(last_sn_val).isdigit():
+        return int(curr_sn_val) > int(last_sn_val)
+    return str(curr_sn_val) > str(last_sn_val)
+
+
+def sn_sort_key(sn):
+    return int(sn) if sn and str(sn).isdigit() else 0
+
+
+def filter_new_records(table, last_timestamp=None, last_sn=None):
+    """Rows of a parsed checkinout table after the watermark, sorted by (checktime, sn)"""
+    columns = resolve_columns(table)
+    num_rows = _row_count(table, columns)
+    if num_rows == 0:
+        return []
+
+    if NUMPY_AVAILABLE:
+        try:
+            return _filter_numpy(table, columns, num_rows, last_timestamp, last_sn)
+        except (ValueError, TypeError, OverflowError):
+            # Values NumPy cannot convert; the row-wise path handles anything
+            pass
+    return _filter_python(table, columns, num_rows, last_timestamp, last_sn)
+
+
+def _filter_python(table, columns, num_rows, last_timestamp, last_sn):
+    checktimes = _column(table, columns, 'checktime', num_rows)
+    sns = _column(table, columns, 'sn', num_rows)
+    last_dt = parse_watermark(last_timestamp) if last_timestamp is not None else None
+
+    selected = []
+    for i in range(num_rows):
+        checktime_dt = parse_checktime(checktimes[i])
+        if not checktime_dt:
+            continue
+        if last_dt is not None:
+            if checktime_dt < last_dt:
+                continue
+            if checktime_dt == last_dt and not sn_is_newer(sns[i], last_sn):
+                continue
+        selected.append((i, checktime_dt))
+
+    selected.sort(key=lambda item: (item[1], sn_sort_key(sns[item[0]])))
+    return _build_records(table, columns, num_rows, selected)
+
+
+# Character layout of 'YYYY-MM-DD HH:MM:SS[.ffffff]'
+ISO_WIDTH = 26
+ISO_DIGITS = (0, 1, 2, 3, 5, 6, 8, 9, 11, 12, 14, 15, 17, 18)
+ISO_SEPARATORS = ((4, '-'), (7, '-'), (13, ':'), (16, ':'))
+
+
+def _checktime_array(values):
+    """
+    Convert the checktime column to datetime64[s] in bulk; invalid dates
+    become NaT. The ISO text is decoded digit by digit as integer arrays,
+    which is much faster than NumPy's generic string-to-datetime parser.
+    Rows that fail this strict check go through parse_checktime(), so both
+    filter paths accept exactly the same values.
+    """
+    text = np.array(values, dtype=f'U{ISO_WIDTH}')
+    codes = text.view(np.int32).reshape(len(text), ISO_WIDTH)
+    digits = codes - ord('0')
+
+    valid = np.ones(len(text), dtype=bool)
+    for pos in ISO_DIGITS:
+        valid &= (digits[:, pos] >= 0) & (digits[:, pos] <= 9)
+    for pos, char in ISO_SEPARATORS:
+        valid &= codes[:, pos] == ord(char)
+    valid &= (codes[:, 10] == ord(' ')) | (codes[:, 10] == ord('T'))
+
+    def number(*positions):
+        result = np.zeros(len(text), dtype=np.int64)
+        for pos in positions:
+            result = result * 10 + digits[:, pos]
+        return result
+
+    year, month, day = number(0, 1, 2, 3), number(5, 6), number(8, 9)
+    hour, minute, second = number(11, 12), number(14, 15), number(17, 18)
+    valid &= (month >= 1) & (month <= 12) & (hour <= 23) & (minute <= 59) & (second <= 59)
+    seconds = hour * 3600 + minute * 60 + second
+
+    # Round float noise ('.999996') to the nearest second
+    has_fraction = codes[:, 19] == ord('.')
+    seconds += has_fraction & (digits[:, 20] >= 5)
+
+    month_index = np.where(valid, (year - 1970) * 12 + month - 1, 0)
+    month_start = month_index.astype('datetime64[M]').astype('datetime64[D]')
+    month_days = ((month_index + 1).astype('datetime64[M]').astype('datetime64[D]') - month_start).astype(np.int64)
+    # 2024-02-30 must not roll over into March
+    valid &= (day >= 1) & (day <= month_days)
+    days = month_start + np.where(valid, day - 1, 0)
+    stamps = days.astype('datetime64[s]') + seconds.astype('timedelta64[s]')
+    stamps[~valid] = np.datetime64('NaT')
+    for i in np.nonzero(~valid)[0]:
+        checktime_dt = parse_checktime(values[i])
+        if checktime_dt:
+            stamps[i] = np.datetime64(checktime_dt, 's')
+    return stamps
+
+
+def _filter_numpy(table, columns, num_rows, last_timestamp, last_sn):
+    checktimes = _checktime_array(_column(table, columns, 'checktime', num_rows))
+    sns = _column(table, columns, 'sn', num_rows)
+
+    mask = ~np.isnat(checktimes)
+    if last_timestamp is not None:
+        last_dt = np.datetime64(parse_watermark(last_timestamp), 's')
+        ties = np.nonzero(mask & (checktimes == last_dt))[0]
+        mask &= checktimes > last_dt
+        for i in ties:
+            if sn_is_newer(sns[i], last_sn):
+                mask[i] = True
+
+    indices = np.nonzero(mask)[0]
+    if len(indices) == 0:
+        return []
+
+    sn_keys = np.array([sn_sort_key(sns[i]) for i in indices], dtype=np.int64)
+    # lexsort sorts by the last key first, and is stable like list.sort
+    order = indices[np.lexsort((sn_keys, checktimes[indices]))]
+    selected = list(zip(order.tolist(), checktimes[order].astype(object).tolist()))
+    return _build_records(table, columns, num_rows, selected)
+
+
+def _build_records(table, columns, num_rows, selected):
+    cols = {name: _column(table, columns, name, num_rows)
+            for name in ('badgenumber', 'checktype', 'verifycode', 'sensorid', 'workcode', 'sn')}
+    return [(
+        cols['badgenumber'][i],
+        checktime_dt,
+        cols['checktype'][i],
+        cols['verifycode'][i],
+        cols['sensorid'][i],
+        cols['workcode'][i],
+        cols['sn'][i]
+    ) for i, checktime_dt in selected]
@@ -0,0 +1,171 @@
+"""
+Bulk writer for the cloud MySQL database.
+Builds multi-row INSERT statements that stay under the server's max_allowed_packet.
+"""
+
+from collections import namedtuple
+
+import pymysql
+
+# Result of one bulk_insert() call
+#   submitted  - rows handed to the writer
+#   inserted   - rows that created a new record in MySQL
+#   ignored    - rows that matched an existing unique key
+#   rejected   - rows MySQL refused (only with skip_bad_rows=True)
+#   statements - number of INSERT statements sent
+BulkInsertResult = namedtuple(
+    "BulkInsertResult", ["submitted", "inserted", "ignored", "rejected", "statements"]
+)
+
+# Never build a statement larger than this, even if the server would accept it
+MAX_STATEMENT_BYTES = 4 * 1024 * 1024
+
+# Used when @@max_allowed_packet cannot be read (MySQL 5.x default is 1-4 MB)
+DEFAULT_MAX_ALLOWED_PACKET = 1024 * 1024
+
+# Room left for the packet header and the statement prefix/suffix
+PACKET_HEADROOM = 4096
+
+# Errors caused by the row data itself rather than by the connection
+ROW_DATA_ERRORS = (pymysql.err.DataError, pymysql.err.IntegrityError)
+
+# Column order used by every Access -> access_device_logs uploader
+ACCESS_DEVICE_LOG_COLUMNS = (
+    "badge_number", "check_time", "check_type", "verify_code",
+    "sensor_id", "work_code", "device_sn", "raw_data"
+)
+
+# Columns refreshed when an Access record is uploaded again
+ACCESS_DEVICE_LOG_UPDATE_COLUMNS = (
+    "check_type", "verify_code", "sensor_id", "work_code", "raw_data", "server_time"
+)
+
+# Cached statement limit per (host, port)
+_statement_limits = {}
+
+
+def get_statement_limit(conn):
+    """Return the largest statement (in bytes) we may send on this connection"""
+    key = (getattr(conn, 'host', None), getattr(conn, 'port', None))
+    limit = _statement_limits.get(key)
+    if limit is not None:
+        return limit
+
+    try:
+        cursor = conn.cursor(pymysql.cursors.Cursor)
+        cursor.execute("SELECT @@max_allowed_packet")
+        max_packet = int(cursor.fetchone()[0])
+        cursor.close()
+    except Exception:
+        max_packet = DEFAULT_MAX_ALLOWED_PACKET
+
+    limit = min(max_packet, MAX_STATEMENT_BYTES) - PACKET_HEADROOM
+    _statement_limits[key] = limit
+    return limit
+
+
+def build_insert_prefix(table, columns, update_columns=None):
+    """Return (prefix, suffix) SQL for a multi-row insert into table"""
+    column_list = ", ".join(columns)
+    if update_columns:
+        prefix = f"INSERT INTO {table} ({column_list}) VALUES "
+        updates = ", ".join(f"{col} = VALUES({col})" for col in update_columns)
+        suffix = f" ON DUPLICATE KEY UPDATE {updates}"
+    else:
+        prefix = f"INSERT IGNORE INTO {table} ({column_list}) VALUES "
+        suffix = ""
+    return prefix, suffix
+
+
+def iter_statements(conn, table, columns, rows, update_columns=None, max_bytes=None):
+    """
+    Yield (sql, row_count, rows) tuples, each sql being one multi-row INSERT
+    no larger than max_bytes.
+    """
+    if max_bytes is None:
+        max_bytes = get_statement_limit(conn)
+
+    prefix, suffix = build_insert_prefix(table, columns, update_columns)
+    base_size = len(prefix.encode('utf-8')) + len(suffix.encode('utf-8'))
+
+    fragments = []
+    chunk_rows = []
+    size = base_size
+    for row in rows:
+        fragment = conn.escape(tuple(row))
+        fragment_size = len(fragment.encode('utf-8')) + 1  # +1 for the comma
+
+        if fragments and size + fragment_size > max_bytes:
+            yield prefix + ",".join(fragments) + suffix, len(fragments), chunk_rows
+            fragments = []
+            chunk_rows = []
+            size = base_size
+
+        fragments.append(fragment)
+        chunk_rows.append(row)
+        size += fragment_size
+
+    if fragments:
+        yield prefix + ",".join(fragments) + suffix, len(fragments), chunk_rows
+
+
+def _count_new_rows(affected, row_count, upsert):
+    """
+    Translate MySQL's affected-row count into the number of new rows.
+
+    INSERT IGNORE reports 1 per inserted row. ON DUPLICATE KEY UPDATE reports 1
+    per inserted row and 2 per updated row; our upserts always touch
+    server_time, so every duplicate counts as an update.
+    """
+    if upsert:
+        inserted = 2 * row_count - affected
+    else:
+        inserted = affected
+    return max(0, min(row_count, inserted))
+
+
+def bulk_insert(conn, table, columns, rows, update_columns=None, skip_bad_rows=False, max_bytes=None):
+    """
+    Insert rows into table using multi-row INSERT statements.
+
+    Without update_columns the statements are INSERT IGNORE; with them they
+    become INSERT ... ON DUPLICATE KEY UPDATE col = VALUES(col).
+
+    With skip_bad_rows=True a statement rejected because of bad data is
+    retried one row at a time so that a single malformed record does not
+    block the rest of the batch.
+
+    The caller is responsible for commit(). Returns a BulkInsertResult.
+    """
+    upsert = bool(update_columns)
+    submitted = inserted = rejected = statements = 0
+
+    cursor = conn.cursor()
+    try:
+        for sql, row_count, chunk_rows in iter_statements(conn, table, columns, rows,
+                                                          update_columns, max_bytes):
+            submitted += row_count
+            try:
+                affected = cursor.execute(sql)
+                statements += 1
+                inserted += _count_new_rows(affected, row_count, upsert)
+            except ROW_DATA_ERRORS:
+                if not skip_bad_rows:
+                    raise
+                # Fall back to row-by-row for this chunk only
+                prefix, suffix = build_insert_prefix(table, columns, update_columns)
+                for row in chunk_rows:
+                    try:
+                        affected = cursor.execute(prefix + conn.escape(tuple(row)) + suffix)
+                        statements += 1
+                        inserted += _count_new_rows(affected, 1, upsert)
+                    except ROW_DATA_ERRORS:
+                        rejected += 1
+    finally:
+        try:
+            cursor.close()
+        except Exception:
+            pass
+
+    ignored = submitted - inserted - rejected
+    return BulkInsertResult(submitted, inserted, ignored, rejected, statements)
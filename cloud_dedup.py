@@ -0,0 +1,182 @@
+"""
+Chunked, throttled, resumable removal of duplicate rows from a cloud table,
+followed by adding the unique key that keeps it clean.
+"""
+
+import json
+import os
+import time
+
+DEFAULT_CHUNK_SIZE = 20000
+DEFAULT_DELETE_BATCH = 500
+DEFAULT_PAUSE_SECONDS = 0.2
+
+# ER_DUP_ENTRY: rows inserted behind the walk collide with the new key
+ER_DUP_ENTRY = 1062
+
+
+def default_state_file(table):
+    return f"dedup_state_{table}.json"
+
+
+def _value(row, key, index):
+    return row[key] if isinstance(row, dict) else row[index]
+
+
+class Deduplicator(object):
+    """
+    Removes rows that repeat key_columns (keeping the lowest id) and then
+    adds UNIQUE (key_columns) as constraint_name.
+
+    connect_fn()  - borrows a MySQL connection (closed after use), or None
+    """
+
+    def __init__(self, connect_fn, table, key_columns, constraint_name, chunk_size=DEFAULT_CHUNK_SIZE,
+                 delete_batch=DEFAULT_DELETE_BATCH, pause_seconds=DEFAULT_PAUSE_SECONDS, state_file=None,
+                 logger=None):
+        self.connect_fn = connect_fn
+        self.table = table
+        self.key_columns = tuple(key_columns)
+        self.constraint_name = constraint_name
+        self.chunk_size = max(1, int(chunk_size))
+        self.delete_batch = max(1, int(delete_batch))
+        self.pause_seconds = max(0.0, float(pause_seconds))
+        self.state_file = state_file or default_state_file(table)
+        self.logger = logger or print
+
+    def log(self, message):
+        self.logger(message)
+
+    def _load_state(self):
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            if state.get("table") == self.table and not state.get("completed"):
+                return state
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            self.log(f"Ignoring unreadable dedup state {self.state_file}: {e}")
+        return {"table": self.table, "next_id": 0, "deleted": 0, "completed": False}
+
+    def _save_state(self, state):
+        tmp_path = self.state_file + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp_path, self.state_file)
+
+    def _duplicate_ids_query(self):
+        keys = ", ".join(self.key_columns)
+        match_chunk = " AND ".join(f"a.{c} = c.{c}" for c in self.key_columns)
+        match_group = " AND ".join(f"t.{c} = g.{c}" for c in self.key_columns)
+        select_a = ", ".join(f"a.{c}" for c in self.key_columns)
+        return f"""
+            SELECT t.id AS id
+            FROM {self.table} t
+            JOIN (
+                SELECT {select_a}, MIN(a.id) AS keep_id
+                FROM {self.table} a
+                JOIN (
+                    SELECT DISTINCT {keys} FROM {self.table} WHERE id >= %s AND id < %s
+                ) c ON {match_chunk}
+                GROUP BY {select_a}
+                HAVING COUNT(*) > 1
+            ) g ON {match_group}
+            WHERE t.id >= %s AND t.id < %s AND t.id > g.keep_id
+        """
+
+    def _id_bounds(self, cursor):
+        cursor.execute(f"SELECT MIN(id) AS min_id, MAX(id) AS max_id FROM {self.table}")
+        row = cursor.fetchone()
+        return _value(row, "min_id", 0), _value(row, "max_id", 1)
+
+    def _constraint_exists(self, cursor):
+        cursor.execute("""
+            SELECT COUNT(*) AS total FROM information_schema.STATISTICS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s
+        """, (self.table, self.constraint_name))
+        return _value(cursor.fetchone(), "total", 0) > 0
+
+    def _delete(self, conn, cursor, ids):
+        for start in range(0, len(ids), self.delete_batch):
+            batch = ids[start:start + self.delete_batch]
+            placeholders = ", ".join(["%s"] * len(batch))
+            cursor.execute(f"DELETE FROM {self.table} WHERE id IN ({placeholders})", batch)
+            conn.commit()
+            if self.pause_seconds:
+                time.sleep(self.pause_seconds)
+
+    def _add_constraint(self, cursor):
+        columns = ", ".join(self.key_columns)
+        statement = f"ALTER TABLE {self.table} ADD CONSTRAINT {self.constraint_name} UNIQUE ({columns})"
+        try:
+            # Build the index online where the server supports it
+            cursor.execute(statement + ", ALGORITHM=INPLACE, LOCK=NONE")
+        except Exception as e:
+            if e.args and e.args[0] == ER_DUP_ENTRY:
+                raise
+            cursor.execute(statement)
+
+    def run(self):
+        """
+        Walk the table, delete duplicates and add the constraint.
+        Returns True once the constraint is in place.
+        """
+        conn = self.connect_fn()
+        if not conn:
+            return False
+
+        try:
+            cursor = conn.cursor()
+            if self._constraint_exists(cursor):
+                self.log(f"Unique constraint {self.constraint_name} already exists on {self.table}.")
+                return True
+
+            state = self._load_state()
+            min_id, max_id = self._id_bounds(cursor)
+            if max_id is None:
+                self.log(f"{self.table} is empty; adding unique constraint.")
+            else:
+                next_id = max(state["next_id"], min_id)
+                if state["next_id"]:
+                    self.log(f"Resuming dedup of {self.table} at id {next_id} ({state['deleted']} rows deleted so far)")
+                query = self._duplicate_ids_query()
+
+                while next_id <= max_id:
+                    end_id = next_id + self.chunk_size
+                    cursor.execute(query, (next_id, end_id, next_id, end_id))
+                    ids = [_value(row, "id", 0) for row in cursor.fetchall()]
+                    conn.commit()
+                    if ids:
+                        self._delete(conn, cursor, ids)
+                        state["deleted"] += len(ids)
+
+                    state["next_id"] = next_id = end_id
+                    self._save_state(state)
+                    done = min(100.0, 100.0 * (next_id - min_id) / (max_id - min_id + 1))
+                    self.log(f"Dedup {self.table}: {done:.1f}% (up to id {min(end_id, max_id + 1) - 1}), "
+                             f"{state['deleted']} duplicates removed")
+
+                    # Rows keep arriving while we walk; finish at the current end of the table
+                    if next_id > max_id:
+                        max_id = self._id_bounds(cursor)[1]
+
+            try:
+                self._add_constraint(cursor)
+            except Exception as e:
+                if e.args and e.args[0] == ER_DUP_ENTRY:
+                    # Duplicates slipped in behind the walk; the next run rescans from the start
+                    state.update(next_id=0)
+                    self._save_state(state)
+                    self.log(f"New duplicates appeared in {self.table} during the walk; run the dedup again")
+                    return False
+                raise
+            conn.commit()
+
+            state["completed"] = True
+            self._save_state(state)
+            self.log(f"Unique constraint {self.constraint_name} added to {self.table} "
+                     f"({state['deleted']} duplicates removed).")
+            return True
+        finally:
+            conn.close()
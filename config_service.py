@@ -0,0 +1,184 @@
+"""
+Shared, hot-reloadable cache of a JSON config file.
+The file is parsed once and re-read only when its mtime or size changes.
+"""
+
+import json
+import os
+import threading
+import time
+from types import MappingProxyType
+
+from log_callback import level_logger
+
+DEFAULT_CHECK_INTERVAL = 1.0
+
+_services = {}
+_services_lock = threading.Lock()
+
+
+def freeze(value):
+    """Read-only copy of parsed JSON"""
+    if isinstance(value, dict):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+def thaw(value):
+    """Editable (and JSON-serialisable) copy of a frozen snapshot"""
+    if isinstance(value, (dict, MappingProxyType)):
+        return {key: thaw(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [thaw(item) for item in value]
+    return value
+
+
+class ConfigService(object):
+    """
+    Thread-safe cache of one JSON config file.
+
+    defaults        - used when the file is missing or unreadable on first load
+    merge_defaults  - also fill keys the file leaves out from defaults
+    create_missing  - write defaults to disk when the file does not exist
+    """
+
+    def __init__(self, path, defaults=None, merge_defaults=False, create_missing=False,
+                 check_interval=DEFAULT_CHECK_INTERVAL, logger=None):
+        self.path = path
+        self.defaults = dict(defaults or {})
+        self.merge_defaults = merge_defaults
+        self.create_missing = create_missing
+        self.check_interval = max(0.0, float(check_interval))
+        self.logger = level_logger(logger)
+        self._lock = threading.Lock()
+        self._subscribers = []
+        self._snapshot = None
+        self._signature = None
+        self._next_check = 0.0
+
+    def log(self, message, level="INFO"):
+        self.logger(message, level)
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+            return (st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            return None
+
+    def _parse(self):
+        with open(self.path, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        if self.merge_defaults:
+            for key, value in self.defaults.items():
+                config.setdefault(key, value)
+        return config
+
+    def _load(self, signature):
+        """Parse the file; returns the new snapshot or None to keep the current one"""
+        if signature is None:
+            if self._snapshot is not None:
+                self.log(f"Config file {self.path} disappeared; keeping the last loaded settings", "WARNING")
+                return None
+            if self.create_missing:
+                self.log(f"Config file not found, creating default: {self.path}")
+                try:
+                    self._write(self.defaults)
+                    self._signature = self._stat()
+                except Exception as e:
+                    self.log(f"Error saving config {self.path}: {e}", "ERROR")
+            return freeze(self.defaults)
+        try:
+            return freeze(self._parse())
+        except Exception as e:
+            self.log(f"Error loading config {self.path}: {e}", "ERROR")
+            if self._snapshot is None:
+                return freeze(self.defaults)
+            return None
+
+    def _write(self, config):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(thaw(config), f, indent=4, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def refresh(self, force=False):
+        """
+        Re-read the file if it changed since the last load (or always with
+        force). Notifies subscribers and returns True when settings changed.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if not force and self._snapshot is not None and now < self._next_check:
+                return False
+            self._next_check = now + self.check_interval
+
+            signature = self._stat()
+            if not force and self._snapshot is not None and signature == self._signature:
+                return False
+            self._signature = signature
+
+            snapshot = self._load(signature)
+            old = self._snapshot
+            if snapshot is None or snapshot == old:
+                return False
+            self._snapshot = snapshot
+            subscribers = list(self._subscribers)
+
+        if old is not None:
+            for callback in subscribers:
+                try:
+                    callback(snapshot, old)
+                except Exception as e:
+                    self.log(f"Config subscriber {getattr(callback, '__name__', callback)} failed: {e}", "ERROR")
+        return old is not None
+
+    def get(self):
+        """Current settings as a read-only mapping"""
+        self.refresh()
+        return self._snapshot
+
+    def as_dict(self):
+        """Current settings as an editable copy, e.g. to change and save()"""
+        return thaw(self.get())
+
+    def save(self, config):
+        """Write config to the file and serve it immediately. Returns True on success."""
+        try:
+            with self._lock:
+                self._write(config)
+                self._next_check = 0.0
+        except Exception as e:
+            self.log(f"Error saving config {self.path}: {e}", "ERROR")
+            return False
+        self.refresh(force=True)
+        return True
+
+    def subscribe(self, callback):
+        """
+        Call callback(new, old) with both snapshots after every reload that
+        changes the settings. Returns a function that removes the callback.
+        """
+        with self._lock:
+            self._subscribers.append(callback)
+
+        def unsubscribe():
+            with self._lock:
+                if callback in self._subscribers:
+                    self._subscribers.remove(callback)
+        return unsubscribe
+
+
+def get_config_service(path, **kwargs):
+    """
+    The process-wide ConfigService for path, created with kwargs on first
+    use, so every module reading the same file shares one cache.
+    """
+    key = os.path.abspath(path)
+    with _services_lock:
+        service = _services.get(key)
+        if service is None:
+            service = _services[key] = ConfigService(path, **kwargs)
+        return service
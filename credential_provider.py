@@ -0,0 +1,93 @@
+"""
+In-memory cache of the decrypted database credentials.
+The encrypted file is decrypted once and again only when it changes on disk.
+"""
+
+import json
+import os
+import threading
+import time
+
+from cryptography.fernet import Fernet
+
+from log_callback import level_logger
+
+DEFAULT_CREDENTIALS_FILE = "encrypted_credentials.bin"
+DEFAULT_CHECK_INTERVAL = 1.0
+
+# Fixed key shared with encrypt_credentials.py
+ENCRYPTION_KEY = b'XZgpn7Se8pQeHY8RMyeYf6e5Twq9PdOBVo9JPsqHZA4='
+
+_providers = {}
+_providers_lock = threading.Lock()
+
+
+class CredentialProvider(object):
+    """Thread-safe, decrypt-once view of the DB_CONFIG section of an encrypted credentials file"""
+
+    def __init__(self, path=DEFAULT_CREDENTIALS_FILE, key=ENCRYPTION_KEY,
+                 check_interval=DEFAULT_CHECK_INTERVAL, logger=None):
+        self.path = path
+        self.key = key
+        self.check_interval = max(0.0, float(check_interval))
+        self.logger = level_logger(logger)
+        self._lock = threading.Lock()
+        self._credentials = None
+        self._signature = None
+        self._next_check = 0.0
+
+    def log(self, message, level="INFO"):
+        self.logger(message, level)
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+            return (st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            return None
+
+    def _decrypt(self, signature):
+        if signature is None:
+            self.log(f"Credentials file not found: {self.path}", "ERROR")
+            return {}
+        try:
+            with open(self.path, 'rb') as f:
+                encrypted_data = f.read()
+            credentials = json.loads(Fernet(self.key).decrypt(encrypted_data).decode())
+            return credentials.get("DB_CONFIG", {})
+        except Exception as e:
+            self.log(f"Error decrypting credentials {self.path}: {e!r}", "ERROR")
+            return {}
+
+    def get(self):
+        """Decrypted DB_CONFIG as a new dict ({} if unavailable)"""
+        with self._lock:
+            now = time.monotonic()
+            if self._credentials is None or now >= self._next_check:
+                self._next_check = now + self.check_interval
+                signature = self._stat()
+                if self._credentials is None or signature != self._signature:
+                    if self._credentials is not None:
+                        self.log(f"{self.path} changed; reloading credentials")
+                    self._signature = signature
+                    self._credentials = self._decrypt(signature)
+            return dict(self._credentials)
+
+    def refresh(self):
+        """Drop the cached credentials and decrypt the file again. Returns True if usable."""
+        with self._lock:
+            self._credentials = None
+        return bool(self.get())
+
+
+def get_credential_provider(path=DEFAULT_CREDENTIALS_FILE, **kwargs):
+    """
+    The process-wide CredentialProvider for path, created with kwargs on
+    first use, so every connect in the process shares one decrypted copy.
+    """
+    key = os.path.abspath(path)
+    with _providers_lock:
+        provider = _providers.get(key)
+        if provider is None:
+            provider = _providers[key] = CredentialProvider(path, **kwargs)
+        return provider
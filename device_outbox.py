@@ -0,0 +1,336 @@
+"""
+Durable SQLite outbox for punches received from devices.
+Records stay queued until MySQL has committed them; overflow spills to disk segments.
+"""
+
+import sqlite3
+import threading
+
+from log_callback import level_logger
+from outbox_spill import SpillSegments
+
+DEFAULT_OUTBOX_DB = "device_outbox.db"
+DEFAULT_HIGH_WATERMARK = 200000
+DEFAULT_LOW_WATERMARK = 50000
+
+OUTBOX_COLUMNS = ("device_sn", "user_id", "check_time", "check_type",
+                  "verify_type", "work_code", "raw_data", "received_at")
+
+SCHEMA = """
+-- AUTOINCREMENT: ids must never be reused once acked rows are deleted
+CREATE TABLE IF NOT EXISTS outbox (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    device_sn   TEXT,
+    user_id     TEXT,
+    check_time  TEXT,
+    check_type  TEXT,
+    verify_type TEXT,
+    work_code   TEXT,
+    raw_data    TEXT,
+    received_at TEXT
+);
+CREATE TABLE IF NOT EXISTS outbox_cursor (
+    name     TEXT PRIMARY KEY,
+    acked_id INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO outbox_cursor (name, acked_id) VALUES ('cloud', 0);
+-- Last push stamp per device and table, returned in the ADMS handshake
+CREATE TABLE IF NOT EXISTS device_stamps (
+    device_sn  TEXT NOT NULL,
+    table_name TEXT NOT NULL,
+    stamp      TEXT NOT NULL,
+    updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (device_sn, table_name)
+);
+"""
+
+INSERT_ROW = (f"INSERT INTO outbox ({', '.join(OUTBOX_COLUMNS)}) VALUES "
+              f"({', '.join(['?'] * len(OUTBOX_COLUMNS))})")
+
+# Unacked rows: ids are never reused and everything up to acked_id is deleted
+PENDING_COUNT = """
+SELECT COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'outbox'), 0)
+     - (SELECT acked_id FROM outbox_cursor WHERE name = 'cloud')
+"""
+
+UPSERT_STAMP = """
+INSERT INTO device_stamps (device_sn, table_name, stamp, updated_at) VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+ON CONFLICT (device_sn, table_name) DO UPDATE SET stamp = excluded.stamp, updated_at = excluded.updated_at
+"""
+
+
+class _PendingAppend(object):
+    __slots__ = ("rows", "stamps", "done", "error")
+
+    def __init__(self, rows, stamps):
+        self.rows = rows
+        self.stamps = stamps
+        self.done = False
+        self.error = None
+
+
+class DeviceOutbox(object):
+    """
+    Thread-safe persistent queue with an ack cursor.
+
+    high_watermark  - unacked records kept in the table before spilling (0 = no limit)
+    low_watermark   - table depth at which spilled segments are drained back
+    spill_dir       - directory for spill segments (required for spilling)
+    shared          - other processes append to or drain the same outbox
+    """
+
+    def __init__(self, path=DEFAULT_OUTBOX_DB, high_watermark=0, low_watermark=None,
+                 spill_dir=None, shared=False, logger=None):
+        self.path = path
+        self.shared = shared
+        self.high_watermark = max(0, int(high_watermark or 0))
+        if low_watermark is None:
+            low_watermark = self.high_watermark // 4
+        self.low_watermark = min(self.high_watermark, max(0, int(low_watermark)))
+        self.logger = level_logger(logger)
+        self._lock = threading.Lock()          # guards the connection
+        self._queue_lock = threading.Lock()    # guards _queue
+        self._queue = []
+        # Generous busy timeout: in shared mode other processes hold the write lock at times
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        # (device_sn, table_name) -> stamp, mirrors device_stamps
+        self._stamps = {(sn, table): stamp for sn, table, stamp in
+                        self._conn.execute("SELECT device_sn, table_name, stamp FROM device_stamps")}
+        # Unacked rows in the table, kept in step by append() and ack() (re-read when shared)
+        self._pending = self._conn.execute(PENDING_COUNT).fetchone()[0]
+        self._spill = None
+        if self.high_watermark and spill_dir:
+            self._spill = SpillSegments(spill_dir, shared=shared)
+            if len(self._spill):
+                self.log(f"Outbox spill {spill_dir}: {self._spill.record_count()} records "
+                         f"in {len(self._spill)} segments from a previous run")
+
+    def log(self, message, level="INFO"):
+        self.logger(message, level)
+
+    def _refresh_shared(self):
+        # Caller holds self._lock (and SQLite's write lock when about to write)
+        if self.shared:
+            self._pending = self._conn.execute(PENDING_COUNT).fetchone()[0]
+            if self._spill is not None:
+                self._spill.rescan()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def append(self, rows, stamps=()):
+        """
+        Durably queue rows (tuples in OUTBOX_COLUMNS order). Returns once
+        they are committed to disk, possibly together with other threads'
+        rows. Raises if the write failed.
+
+        stamps - (device_sn, table_name, stamp) tuples saved in the same
+        transaction, so a device's stamp never runs ahead of its records
+        """
+        rows = [tuple(row) for row in rows]
+        stamps = [tuple(stamp) for stamp in stamps]
+        if not rows and not stamps:
+            return 0
+
+        entry = _PendingAppend(rows, stamps)
+        with self._queue_lock:
+            self._queue.append(entry)
+
+        with self._lock:
+            if not entry.done:
+                # Leader: commit everything queued so far in one transaction
+                with self._queue_lock:
+                    group, self._queue = self._queue, []
+                spilled = None
+                try:
+                    # IMMEDIATE: decide on spilling while no other process can write
+                    self._conn.execute("BEGIN IMMEDIATE")
+                    group_rows = sum(len(pending.rows) for pending in group)
+                    spill = self._should_spill(group_rows)
+                    if spill:
+                        # Segment is on disk before the stamps move past its records
+                        spilled = self._spill.write(row for pending in group for row in pending.rows)
+                    for pending in group:
+                        if not spill:
+                            self._conn.executemany(INSERT_ROW, pending.rows)
+                        self._conn.executemany(UPSERT_STAMP, pending.stamps)
+                    self._conn.execute("COMMIT")
+                    if not spill:
+                        self._pending += group_rows
+                    for pending in group:
+                        for device_sn, table_name, stamp in pending.stamps:
+                            self._stamps[(device_sn, table_name)] = stamp
+                except Exception as e:
+                    try:
+                        self._conn.execute("ROLLBACK")
+                    except sqlite3.Error:
+                        pass
+                    if spilled is not None:
+                        # The devices resend these pushes after the error
+                        try:
+                            self._spill.remove(spilled)
+                        except OSError:
+                            pass
+                    for pending in group:
+                        pending.error = e
+                for pending in group:
+                    pending.done = True
+
+        if entry.error is not None:
+            raise entry.error
+        return len(rows)
+
+    def _should_spill(self, rows):
+        # Caller holds self._lock and SQLite's write lock
+        if self._spill is None or not rows:
+            return False
+        self._refresh_shared()
+        if len(self._spill):
+            # Stay behind the records already spilled
+            return True
+        if self._pending + rows <= self.high_watermark:
+            return False
+        self.log(f"Outbox holds {self._pending} unacked records (high watermark {self.high_watermark}); "
+                 f"spilling new pushes to {self._spill.directory}", "WARNING")
+        return True
+
+    def refill(self):
+        """
+        Move spilled segments back into the table, oldest first, while it is
+        at or below low_watermark. Returns the number of records moved.
+        """
+        with self._lock:
+            return self._refill_locked()
+
+    def _refill_locked(self):
+        if self._spill is None:
+            return 0
+        self._refresh_shared()
+        if not len(self._spill) or self._pending > self.low_watermark:
+            return 0
+        moved = 0
+        while True:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._refresh_shared()
+                paths = self._spill.paths()
+                if not paths or self._pending >= self.high_watermark:
+                    self._conn.execute("COMMIT")
+                    break
+                path = paths[0]
+                rows = self._spill.read(path)
+                self._conn.executemany(INSERT_ROW, rows)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._pending += len(rows)
+            moved += len(rows)
+            # A crash before this remove re-queues the segment; INSERT IGNORE absorbs the repeat
+            self._spill.remove(path)
+        if moved:
+            remaining = self._spill.record_count()
+            if remaining:
+                self.log(f"Outbox refilled with {moved} spilled records; "
+                         f"{remaining} records in {len(self._spill)} segments still on disk")
+            else:
+                self.log(f"Outbox refilled with {moved} spilled records; spill drained, "
+                         f"pushes go straight to the outbox again")
+        return moved
+
+    def save_stamp(self, device_sn, table_name, stamp):
+        """Record a device's stamp for a table whose data is not queued (e.g. OPERLOG)"""
+        self.append((), [(device_sn, table_name, str(stamp))])
+
+    def get_stamp(self, device_sn, table_name, default="0"):
+        """Last saved stamp for the device and table (from memory unless shared)"""
+        with self._lock:
+            if self.shared:
+                row = self._conn.execute("SELECT stamp FROM device_stamps WHERE device_sn = ? AND table_name = ?",
+                                         (device_sn, table_name)).fetchone()
+                return row[0] if row else default
+            return self._stamps.get((device_sn, table_name), default)
+
+    def last_id(self):
+        """Highest id ever queued; grows with every append, in any process"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'outbox'), 0)").fetchone()[0]
+
+    def acked_id(self):
+        with self._lock:
+            return self._conn.execute("SELECT acked_id FROM outbox_cursor WHERE name = 'cloud'").fetchone()[0]
+
+    def read_batch(self, limit, after_id=None):
+        """Up to `limit` unacked rows as (id, *OUTBOX_COLUMNS), oldest first"""
+        with self._lock:
+            if after_id is None:
+                after_id = self._conn.execute("SELECT acked_id FROM outbox_cursor WHERE name = 'cloud'").fetchone()[0]
+            return self._conn.execute(
+                f"SELECT id, {', '.join(OUTBOX_COLUMNS)} FROM outbox WHERE id > ? ORDER BY id LIMIT ?",
+                (after_id, int(limit))).fetchall()
+
+    def iter_batches(self, batch_size):
+        """
+        Yield successive unacked batches. The caller must ack() each batch
+        before asking for the next one; an un-acked batch ends the iteration
+        so a failed upload is retried from the same place next time.
+        """
+        while True:
+            batch = self.read_batch(batch_size)
+            if not batch:
+                return
+            yield batch
+            if self.acked_id() < batch[-1][0]:
+                return
+
+    def ack(self, last_id):
+        """Advance the cursor to last_id (after the cloud commit) and drop acked rows"""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute("UPDATE outbox_cursor SET acked_id = MAX(acked_id, ?) WHERE name = 'cloud'",
+                                   (int(last_id),))
+                deleted = self._conn.execute("DELETE FROM outbox WHERE id <= ?", (int(last_id),)).rowcount
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._pending = max(0, self._pending - deleted)
+            try:
+                self._refill_locked()
+            except Exception as e:
+                # Segments stay on disk; the next ack or refill() tries again
+                self.log(f"Error draining outbox spill segments: {e}", "ERROR")
+
+    def oldest_received_at(self):
+        """received_at of the oldest unacked record in the table, or None when it is empty"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT received_at FROM outbox WHERE id > (SELECT acked_id FROM outbox_cursor WHERE name = 'cloud') "
+                "ORDER BY id LIMIT 1").fetchone()
+            return row[0] if row else None
+
+    def pending_count(self):
+        """Unacked records in the table (not counting spilled ones)"""
+        with self._lock:
+            self._refresh_shared()
+            return self._pending
+
+    def spilled_count(self):
+        """Records waiting in spill segments"""
+        with self._lock:
+            self._refresh_shared()
+            return self._spill.record_count() if self._spill is not None else 0
+
+    def stats(self):
+        """(table depth, spilled records, spill segments, spill bytes)"""
+        with self._lock:
+            self._refresh_shared()
+            if self._spill is None:
+                return self._pending, 0, 0, 0
+            return self._pending, self._spill.record_count(), len(self._spill), self._spill.size_bytes()
@@ -32,11 +32,20 @@ class SyncWorker(QThread):
         self.paused = False
         # Initialize manager with a callback that emits to our signal
         self.manager = AccessSyncManager(logger_callback=self._log_wrapper)
+        self.upload_times = self.manager.config.get().get("UPLOAD_TIMES", ["09:00", "12:00", "17:00", "22:00"])
+        # Schedule edits (config dialog or the file itself) apply without a restart
+        self.manager.config.subscribe(self._on_config_changed)
     
     def _log_wrapper(self, message):
         """Redirects manager logs to the PyQt signal"""
         self.log_signal.emit(f"[{datetime.now().strftime('%H:%M:%S')}] {message}")
 
+    def _on_config_changed(self, new, old):
+        upload_times = new.get("UPLOAD_TIMES", ["09:00", "12:00", "17:00", "22:00"])
+        if list(upload_times) != list(self.upload_times):
+            self.log_signal.emit(f"Upload schedule changed to {', '.join(upload_times)}")
+        self.upload_times = upload_times
+
     def run(self):
         self.running = True
         last_run_minute = None
@@ -44,9 +53,9 @@ class SyncWorker(QThread):
 
         while self.running:
             if not self.paused:
-                # Reload config to get latest times
-                config = self.manager.load_config()
-                upload_times = config.get("UPLOAD_TIMES", ["09:00", "12:00", "17:00", "22:00"])
+                # Only stats the file; a changed schedule arrives via _on_config_changed
+                self.manager.config.refresh()
+                upload_times = self.upload_times
                 
                 now = datetime.now()
                 current_time = now.strftime("%H:%M")
@@ -225,6 +234,9 @@ class SystemTrayApp:
         self.config_action = self.menu.addAction("Configure")
         self.config_action.triggered.connect(self.open_config)
 
+        self.credentials_action = self.menu.addAction("Reload Credentials")
+        self.credentials_action.triggered.connect(self.reload_credentials)
+
         self.logs_action = self.menu.addAction("View Live Logs")
         self.logs_action.triggered.connect(self.log_viewer.show)
 
@@ -255,6 +267,13 @@ class SystemTrayApp:
         # For now, let's just log that it's scheduled.
         QMessageBox.information(None, "Info", "To force a sync, please restart the service or wait for the schedule.\n(Manual trigger not yet implemented in worker loop)")
 
+    def reload_credentials(self):
+        # Picks up a replaced encrypted_credentials.bin without restarting
+        if self.worker.manager.refresh_credentials():
+            QMessageBox.information(None, "Credentials", "Credentials reloaded.")
+        else:
+            QMessageBox.warning(None, "Credentials", "Could not load credentials. See the live logs for details.")
+
     def open_config(self):
         dialog = ConfigDialog(self.worker.manager)
         dialog.exec_()
@@ -18,11 +18,17 @@ import os
 import sys
 import json
 import time
+import threading
 import socket
 import struct
 from datetime import datetime
 import pymysql
-from cryptography.fernet import Fernet
+import mysql_pool
+from schema_manager import SchemaManager
+from cloud_bulk_writer import bulk_insert
+from config_service import get_config_service
+from attendance_journal import AttendanceJournal
+from credential_provider import get_credential_provider
 
 # Configuration files
 CONFIG_FILE = "device_puller_config.json"
@@ -43,9 +49,20 @@ DEFAULT_CONFIG = {
     "SYNC_TO_CLOUD": True,
     "PULL_INTERVAL_MINUTES": 15,
     "CONNECTION_TIMEOUT": 10,
+    "LOG_RAW_DATA": True,  # Keep a local backup in device_pull_attendance.log
     "DEBUG_MODE": True
 }
 
+# Column order for device_pull_logs inserts
+DEVICE_PULL_LOG_COLUMNS = (
+    "device_sn", "user_id", "check_time", "check_type",
+    "verify_type", "work_code", "raw_data"
+)
+
+# Buffered backup log of pulled records (opened on first use)
+journal = None
+journal_lock = threading.Lock()
+
 # Encryption key (same as other scripts)
 ENCRYPTION_KEY = b'XZgpn7Se8pQeHY8RMyeYf6e5Twq9PdOBVo9JPsqHZA4='
 
@@ -57,51 +74,28 @@ def log_msg(message, level="INFO"):
     sys.stdout.flush()
 
 
+# Parsed once; re-read only when the file changes on disk
+config_service = get_config_service(CONFIG_FILE, defaults=DEFAULT_CONFIG, merge_defaults=True,
+                                    create_missing=True, logger=log_msg)
+
+
 def load_config():
-    """Load configuration from JSON file"""
-    try:
-        with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-            config = json.load(f)
-            for key, value in DEFAULT_CONFIG.items():
-                if key not in config:
-                    config[key] = value
-            return config
-    except FileNotFoundError:
-        log_msg(f"Config file not found, creating default: {CONFIG_FILE}")
-        save_config(DEFAULT_CONFIG)
-        return DEFAULT_CONFIG
-    except Exception as e:
-        log_msg(f"Error loading config: {e}", "ERROR")
-        return DEFAULT_CONFIG
+    """Current configuration (read-only snapshot, reloaded when the file changes)"""
+    return config_service.get()
 
 
 def save_config(config):
     """Save configuration to JSON file"""
-    try:
-        with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-            json.dump(config, f, indent=4, ensure_ascii=False)
-        return True
-    except Exception as e:
-        log_msg(f"Error saving config: {e}", "ERROR")
-        return False
+    return config_service.save(config)
+
+
+# Decrypted once; decrypted again only when the .bin file changes
+credential_provider = get_credential_provider(ENCRYPTED_CREDENTIALS_FILE, key=ENCRYPTION_KEY, logger=log_msg)
 
 
 def load_encrypted_credentials():
-    """Load and decrypt database credentials"""
-    try:
-        with open(ENCRYPTED_CREDENTIALS_FILE, 'rb') as f:
-            encrypted_data = f.read()
-        
-        fernet = Fernet(ENCRYPTION_KEY)
-        decrypted_data = fernet.decrypt(encrypted_data)
-        credentials = json.loads(decrypted_data.decode())
-        return credentials.get("DB_CONFIG", {})
-    except FileNotFoundError:
-        log_msg(f"Credentials file not found: {ENCRYPTED_CREDENTIALS_FILE}", "ERROR")
-        return {}
-    except Exception as e:
-        log_msg(f"Error decrypting credentials: {e}", "ERROR")
-        return {}
+    """Database credentials (cached in memory, no file read or decrypt per call)"""
+    return credential_provider.get()
 
 
 def connect_to_mysql():
@@ -111,13 +105,8 @@ def connect_to_mysql():
         return None
     
     try:
-        conn = pymysql.connect(
-            host=credentials.get('host', 'localhost'),
-            user=credentials.get('user', ''),
-            password=credentials.get('password', ''),
-            database=credentials.get('database', ''),
-            port=credentials.get('port', 3306),
-            charset='utf8mb4',
+        conn = mysql_pool.connect(
+            credentials,
             cursorclass=pymysql.cursors.DictCursor,
             connect_timeout=30
         )
@@ -127,15 +116,30 @@ def connect_to_mysql():
         return None
 
 
-def log_attendance_to_file(device_name, record):
-    """Log attendance record to local file as backup"""
-    try:
-        with open(ATTENDANCE_LOG_FILE, 'a', encoding='utf-8') as f:
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            # Convert record dict to JSON string
-            f.write(f"{timestamp}|{device_name}|{json.dumps(record)}\n")
-    except Exception as e:
-        log_msg(f"Error writing to attendance log: {e}", "ERROR")
+# Table is created/verified once per TTL instead of on every sync
+schema = SchemaManager(connect_to_mysql, ["device_pull_logs"], logger=log_msg)
+
+
+def format_journal_entry(entry):
+    """Journal line: logged_at|device|record as JSON"""
+    logged_at, device_name, record = entry
+    return f"{logged_at}|{device_name}|{json.dumps(record, default=str)}"
+
+
+def get_journal():
+    """Open the attendance journal (and its flusher thread) once per process"""
+    global journal
+    with journal_lock:
+        if journal is None:
+            journal = AttendanceJournal.from_config(ATTENDANCE_LOG_FILE, load_config(),
+                                                    formatter=format_journal_entry, logger=log_msg)
+        return journal
+
+
+def log_attendance_to_file(device_name, records):
+    """Queue attendance records for the local backup log; written in the background"""
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    get_journal().write_many((timestamp, device_name, record) for record in records)
 
 
 def sync_records_to_cloud(device_sn, records):
@@ -143,61 +147,37 @@ def sync_records_to_cloud(device_sn, records):
     if not records:
         return 0
     
+    if not schema.ensure("device_pull_logs"):
+        log_msg("Cannot sync to cloud - device_pull_logs is not available", "WARNING")
+        return 0
+    
     conn = connect_to_mysql()
     if not conn:
         log_msg("Cannot sync to cloud - no database connection", "WARNING")
         return 0
     
     try:
-        cursor = conn.cursor()
-        
-        # Create table if not exists
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS device_pull_logs (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                device_sn VARCHAR(50),
-                user_id VARCHAR(50),
-                check_time DATETIME,
-                check_type VARCHAR(10),
-                verify_type VARCHAR(10),
-                work_code VARCHAR(20),
-                raw_data TEXT,
-                pulled_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                INDEX idx_device_sn (device_sn),
-                INDEX idx_user_id (user_id),
-                INDEX idx_check_time (check_time),
-                UNIQUE KEY unique_record (device_sn, user_id, check_time)
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
-        """)
+        rows = [
+            (
+                device_sn,
+                record.get('user_id', ''),
+                record.get('check_time'),
+                record.get('check_type', ''),
+                record.get('verify_type', ''),
+                record.get('work_code', ''),
+                record.get('raw_data', '')
+            )
+            for record in records
+        ]
         
-        insert_query = """
-            INSERT IGNORE INTO device_pull_logs 
-            (device_sn, user_id, check_time, check_type, verify_type, work_code, raw_data)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
-        """
-        
-        count = 0
-        for record in records:
-            try:
-                values = (
-                    device_sn,
-                    record.get('user_id', ''),
-                    record.get('check_time'),
-                    record.get('check_type', ''),
-                    record.get('verify_type', ''),
-                    record.get('work_code', ''),
-                    record.get('raw_data', '')
-                )
-                cursor.execute(insert_query, values)
-                count += cursor.rowcount
-            except Exception as e:
-                pass
+        result = bulk_insert(conn, "device_pull_logs", DEVICE_PULL_LOG_COLUMNS, rows, skip_bad_rows=True)
         
         conn.commit()
-        return count
+        return result.inserted
         
     except Exception as e:
         log_msg(f"Error syncing to MySQL: {e}", "ERROR")
+        schema.handle_error("device_pull_logs", e)
         return 0
     finally:
         if conn:
@@ -395,8 +375,12 @@ def pull_from_device(device_config):
         records = device.get_attendance_logs()
         
         if records:
-            # Sync to cloud
             config = load_config()
+            if config.get('LOG_RAW_DATA', True):
+                # Backup copy, written by the journal's flusher thread
+                log_attendance_to_file(f"{name}_{ip}", records)
+            
+            # Sync to cloud
             if config.get('SYNC_TO_CLOUD'):
                 # For raw dumps, we might need a special table or just log it
                 # But let's try to sync what we have
@@ -437,7 +421,8 @@ def run_scheduled():
     while True:
         try:
             pull_all_devices()
-            time.sleep(interval * 60)
+            # Picks up an edited interval without a restart
+            time.sleep(load_config().get('PULL_INTERVAL_MINUTES', interval) * 60)
         except KeyboardInterrupt:
             break
         except Exception:
@@ -466,28 +451,33 @@ def main():
     log_msg("HIP CMI F68S Device Puller (Proprietary Protocol)")
     log_msg("=" * 60)
     
-    if len(sys.argv) > 1:
-        cmd = sys.argv[1].lower()
-        if cmd == 'test':
-            ip = sys.argv[2] if len(sys.argv) > 2 else "192.168.100.166"
-            test_connection(ip)
-        elif cmd == 'once':
-            run_once()
-        elif cmd == 'scheduled':
-            run_scheduled()
+    try:
+        if len(sys.argv) > 1:
+            cmd = sys.argv[1].lower()
+            if cmd == 'test':
+                ip = sys.argv[2] if len(sys.argv) > 2 else "192.168.100.166"
+                test_connection(ip)
+            elif cmd == 'once':
+                run_once()
+            elif cmd == 'scheduled':
+                run_scheduled()
+            else:
+                print("Usage: python hip_device_puller.py [test|once|scheduled]")
         else:
-            print("Usage: python hip_device_puller.py [test|once|scheduled]")
-    else:
-        # Default behavior
-        print("1. Test Connection")
-        print("2. Pull Once")
-        print("3. Scheduled Mode")
-        try:
-            choice = input("Choice: ")
-            if choice == '1': test_connection(input("IP: "))
-            elif choice == '2': run_once()
-            elif choice == '3': run_scheduled()
-        except: pass
+            # Default behavior
+            print("1. Test Connection")
+            print("2. Pull Once")
+            print("3. Scheduled Mode")
+            try:
+                choice = input("Choice: ")
+                if choice == '1': test_connection(input("IP: "))
+                elif choice == '2': run_once()
+                elif choice == '3': run_scheduled()
+            except: pass
+    finally:
+        # Write out whatever the journal still has queued
+        if journal is not None:
+            journal.close()
 
 if __name__ == "__main__":
     main()
@@ -21,14 +21,29 @@ import os
 import sys
 import json
 import time
+import signal
 import threading
+import multiprocessing
 import socket
 from datetime import datetime
 from http.server import HTTPServer, BaseHTTPRequestHandler
 from urllib.parse import parse_qs, urlparse
 from socketserver import ThreadingMixIn
 import pymysql
-from cryptography.fernet import Fernet
+import mysql_pool
+from schema_manager import SchemaManager
+from cloud_bulk_writer import bulk_insert
+from device_outbox import DeviceOutbox, DEFAULT_OUTBOX_DB, DEFAULT_HIGH_WATERMARK, DEFAULT_LOW_WATERMARK
+from outbox_spill import DEFAULT_SPILL_DIR
+from metrics import MetricsRegistry, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from sync_trigger import SyncTrigger, DEFAULT_TRIGGER_RECORDS, DEFAULT_MAX_AGE_SECONDS
+from attendance_journal import AttendanceJournal
+from attlog_parser import AttlogParser
+from http_body import BodyReader, BodyError
+from config_service import get_config_service
+from credential_provider import get_credential_provider
+import adms_async_server
+import prefork
 
 # Configuration files
 CONFIG_FILE = "device_receiver_config.json"
@@ -39,84 +54,128 @@ ATTENDANCE_LOG_FILE = "device_attendance.log"
 DEFAULT_CONFIG = {
     "SERVER_HOST": "0.0.0.0",  # Listen on all interfaces
     "SERVER_PORT": 8080,
+    "SERVER_MODE": "threaded",  # "threaded" (thread per connection), "async" (asyncio, large fleets) or "prefork"
+    "WORKER_PROCESSES": 0,  # prefork mode only: worker processes (0 = one per CPU core)
+    "WORKER_SERVER_MODE": "threaded",  # prefork mode only: "threaded" or "async" server in each worker
+    "MAX_CONNECTIONS": adms_async_server.DEFAULT_MAX_CONNECTIONS,  # async mode only
+    "REQUEST_TIMEOUT_SECONDS": adms_async_server.DEFAULT_REQUEST_TIMEOUT,  # async mode only
+    "ASYNC_WORKER_THREADS": adms_async_server.DEFAULT_WORKER_THREADS,  # async mode only
     "DEVICE_SN": "HIP_CMI_F68S",  # Default device serial number
     "SYNC_TO_CLOUD": True,
-    "SYNC_INTERVAL_SECONDS": 60,  # How often to sync pending records to cloud
+    "SYNC_INTERVAL_SECONDS": 60,  # Longest wait between syncs of pending records to cloud
+    "SYNC_TRIGGER_RECORDS": DEFAULT_TRIGGER_RECORDS,  # Sync at once when this many records arrived (0 = off)
+    "SYNC_MAX_AGE_SECONDS": DEFAULT_MAX_AGE_SECONDS,  # ...or when the oldest arrival waited this long
+    "OUTBOX_FILE": DEFAULT_OUTBOX_DB,  # SQLite queue of records not yet in the cloud
+    "SYNC_BATCH_SIZE": 1000,  # Records per MySQL commit when draining the outbox
+    "OUTBOX_HIGH_WATERMARK": DEFAULT_HIGH_WATERMARK,  # Unsent records kept in the outbox before spilling (0 = no limit)
+    "OUTBOX_LOW_WATERMARK": DEFAULT_LOW_WATERMARK,  # Outbox depth at which spilled records are read back
+    "OUTBOX_SPILL_DIR": DEFAULT_SPILL_DIR,  # Compressed overflow segments beyond the high watermark
     "LOG_RAW_DATA": True,
+    "JOURNAL_MAX_BYTES": 10 * 1024 * 1024,  # Rotate device_attendance.log beyond this size
+    "JOURNAL_ROTATE_HOURS": 24,  # ...or this age (0 = size only)
+    "JOURNAL_BACKUP_COUNT": 30,  # Rotated segments kept (gzipped)
+    "JOURNAL_FSYNC": "interval",  # "always", "interval" (about once a second) or "never"
+    "METRICS_PORT": 0,  # Extra port serving only /metrics (0 = /metrics on SERVER_PORT only)
+    "WORKER_METRICS_DIR": "worker_metrics",  # prefork mode only: workers' metric snapshots merged on METRICS_PORT
     "DEBUG_MODE": True
 }
 
 # Encryption key (same as other scripts)
 ENCRYPTION_KEY = b'XZgpn7Se8pQeHY8RMyeYf6e5Twq9PdOBVo9JPsqHZA4='
 
-# Global storage for pending records
-pending_records = []
-pending_lock = threading.Lock()
+# Column order for device_push_logs inserts
+DEVICE_PUSH_LOG_COLUMNS = (
+    "device_sn", "user_id", "check_time", "check_type",
+    "verify_type", "work_code", "raw_data", "received_at"
+)
+
+# Endpoints reported by name in the request metrics; anything else is "other"
+ADMS_ENDPOINTS = ("/iclock/cdata", "/iclock/getrequest", "/iclock/devicecmd", "/metrics")
+
+# ATTLOG records parsed, journaled and queued together while a push streams in
+STREAM_BATCH_RECORDS = 5000
+
+# Seconds between a prefork worker's metric snapshots
+METRICS_SNAPSHOT_SECONDS = 5.0
+
+# Bytes of a POST body shown in DEBUG_MODE
+BODY_PREVIEW_BYTES = 500
+
+# ADMS tables whose push stamp is remembered per device (see handle_cdata_get)
+STAMPED_TABLES = ("ATTLOG", "OPERLOG", "ATTPHOTO")
+
+# Durable queue of records waiting for the cloud (opened on first use)
+outbox = None
+outbox_lock = threading.Lock()
+
+# Wakes the cloud sync worker when enough records arrived or one waited too long
+sync_trigger = SyncTrigger()
+
+# Buffered backup log of received records (opened on first use)
+journal = None
+journal_lock = threading.Lock()
+
+# "worker-N" inside a prefork worker process, "" otherwise
+process_label = ""
 
 
 def log_msg(message, level="INFO"):
     """Log messages with timestamp"""
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    print(f"[{timestamp}] [{level}] {message}")
+    label = f" [{process_label}]" if process_label else ""
+    print(f"[{timestamp}]{label} [{level}] {message}")
     sys.stdout.flush()
 
 
+# Parsed once; re-read only when the file changes on disk
+config_service = get_config_service(CONFIG_FILE, defaults=DEFAULT_CONFIG, merge_defaults=True,
+                                    create_missing=True, logger=log_msg)
+
+
 def load_config():
-    """Load configuration from JSON file"""
-    try:
-        with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-            config = json.load(f)
-            # Merge with defaults
-            for key, value in DEFAULT_CONFIG.items():
-                if key not in config:
-                    config[key] = value
-            return config
-    except FileNotFoundError:
-        log_msg(f"Config file not found, creating default: {CONFIG_FILE}")
-        save_config(DEFAULT_CONFIG)
-        return DEFAULT_CONFIG
-    except Exception as e:
-        log_msg(f"Error loading config: {e}", "ERROR")
-        return DEFAULT_CONFIG
+    """Current configuration (read-only snapshot, reloaded when the file changes)"""
+    return config_service.get()
 
 
 def save_config(config):
     """Save configuration to JSON file"""
-    try:
-        with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-            json.dump(config, f, indent=4, ensure_ascii=False)
-        return True
-    except Exception as e:
-        log_msg(f"Error saving config: {e}", "ERROR")
-        return False
+    return config_service.save(config)
+
+
+# Decrypted once; decrypted again only when the .bin file changes
+credential_provider = get_credential_provider(ENCRYPTED_CREDENTIALS_FILE, key=ENCRYPTION_KEY, logger=log_msg)
 
 
 def load_encrypted_credentials():
-    """Load and decrypt database credentials"""
-    try:
-        with open(ENCRYPTED_CREDENTIALS_FILE, 'rb') as f:
-            encrypted_data = f.read()
-        
-        fernet = Fernet(ENCRYPTION_KEY)
-        decrypted_data = fernet.decrypt(encrypted_data)
-        credentials = json.loads(decrypted_data.decode())
-        return credentials.get("DB_CONFIG", {})
-    except FileNotFoundError:
-        log_msg(f"Credentials file not found: {ENCRYPTED_CREDENTIALS_FILE}", "ERROR")
-        return {}
-    except Exception as e:
-        log_msg(f"Error decrypting credentials: {e}", "ERROR")
-        return {}
+    """Database credentials (cached in memory, no file read or decrypt per call)"""
+    return credential_provider.get()
 
 
-def log_attendance_to_file(record):
-    """Log attendance record to local file as backup"""
-    try:
-        with open(ATTENDANCE_LOG_FILE, 'a', encoding='utf-8') as f:
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            f.write(f"{timestamp}|{json.dumps(record)}\n")
-    except Exception as e:
-        log_msg(f"Error writing to attendance log: {e}", "ERROR")
+def format_journal_entry(entry):
+    """Journal line: logged_at|record as JSON"""
+    logged_at, row = entry
+    return f"{logged_at}|{json.dumps(dict(zip(DEVICE_PUSH_LOG_COLUMNS, row)))}"
+
+
+def get_journal():
+    """Open the attendance journal (and its flusher thread) once per process"""
+    global journal
+    with journal_lock:
+        if journal is None:
+            path = ATTENDANCE_LOG_FILE
+            if process_label:
+                # Each prefork worker rotates its own file
+                root, ext = os.path.splitext(path)
+                path = f"{root}.{process_label}{ext}"
+            journal = AttendanceJournal.from_config(path, load_config(),
+                                                    formatter=format_journal_entry, logger=log_msg)
+        return journal
+
+
+def log_attendance_to_file(rows):
+    """Queue attendance rows (DEVICE_PUSH_LOG_COLUMNS order) for the local backup log"""
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    get_journal().write_many((timestamp, row) for row in rows)
 
 
 def connect_to_mysql():
@@ -126,13 +185,8 @@ def connect_to_mysql():
         return None
     
     try:
-        conn = pymysql.connect(
-            host=credentials.get('host', 'localhost'),
-            user=credentials.get('user', ''),
-            password=credentials.get('password', ''),
-            database=credentials.get('database', ''),
-            port=credentials.get('port', 3306),
-            charset='utf8mb4',
+        conn = mysql_pool.connect(
+            credentials,
             cursorclass=pymysql.cursors.DictCursor,
             connect_timeout=30
         )
@@ -142,87 +196,353 @@ def connect_to_mysql():
         return None
 
 
+def oldest_unsynced_age():
+    """Seconds since the oldest record still waiting for the cloud was received"""
+    if outbox is None:
+        return None
+    received_at = outbox.oldest_received_at()
+    if received_at is None:
+        return 0
+    return max(0.0, (datetime.now() - datetime.strptime(received_at, "%Y-%m-%d %H:%M:%S")).total_seconds())
+
+
+# Scraped from /metrics; updates are per-thread and lock-free
+metrics = MetricsRegistry(logger=log_msg)
+adms_requests = metrics.counter("adms_requests_total", "ADMS requests handled",
+                                ("method", "endpoint", "device_sn", "status"))
+adms_request_seconds = metrics.histogram("adms_request_seconds", "Time to handle an ADMS request",
+                                         ("method", "endpoint"))
+attlog_lines_parsed = metrics.counter("attlog_lines_parsed_total", "ATTLOG lines parsed into records", ("device_sn",))
+attlog_lines_rejected = metrics.counter("attlog_lines_rejected_total", "ATTLOG lines that could not be parsed",
+                                        ("device_sn",))
+attlog_parse_seconds = metrics.histogram("attlog_parse_seconds", "Time to read, parse and queue one ATTLOG push")
+cloud_sync_batch_records = metrics.histogram("cloud_sync_batch_records", "Records per MySQL commit",
+                                             buckets=(1, 10, 50, 100, 250, 500, 1000, 2000, 5000, 10000))
+cloud_sync_batch_seconds = metrics.histogram("cloud_sync_batch_seconds", "Time to insert and commit one batch")
+cloud_sync_records = metrics.counter("cloud_sync_records_total", "Records committed to the cloud database")
+cloud_sync_errors = metrics.counter("cloud_sync_errors_total", "Cloud syncs that stopped on an error")
+metrics.gauge("outbox_pending_records", "Records in the outbox waiting for the cloud",
+              lambda: outbox.pending_count() if outbox is not None else None)
+metrics.gauge("outbox_spilled_records", "Records spilled to disk segments beyond the high watermark",
+              lambda: outbox.spilled_count() if outbox is not None else None)
+metrics.gauge("outbox_oldest_record_age_seconds", "Age of the oldest record not yet in the cloud",
+              oldest_unsynced_age)
+metrics.gauge("attendance_journal_pending_records", "Records waiting for the backup log flusher",
+              lambda: journal.pending() if journal is not None else None)
+
+
+# Remembers each device's ATTLOG line layout across pushes
+attlog_parser = AttlogParser(logger=log_msg)
+
+
+# Table is created/verified once per TTL instead of on every sync
+schema = SchemaManager(connect_to_mysql, ["device_push_logs"], logger=log_msg)
+
+
+def get_outbox():
+    """Open the persistent outbox once per process"""
+    global outbox
+    with outbox_lock:
+        if outbox is None:
+            config = load_config()
+            path = config.get("OUTBOX_FILE", DEFAULT_OUTBOX_DB)
+            outbox = DeviceOutbox(
+                path,
+                high_watermark=config.get("OUTBOX_HIGH_WATERMARK", DEFAULT_HIGH_WATERMARK),
+                low_watermark=config.get("OUTBOX_LOW_WATERMARK", DEFAULT_LOW_WATERMARK),
+                spill_dir=config.get("OUTBOX_SPILL_DIR", DEFAULT_SPILL_DIR),
+                # Prefork workers append while the main process drains
+                shared=config.get("SERVER_MODE", "threaded").lower() == "prefork",
+                logger=log_msg
+            )
+            pending = outbox.pending_count()
+            if pending and not process_label:
+                log_msg(f"Outbox {path}: {pending} records waiting from a previous run")
+        return outbox
+
+
+def log_outbox_depth(queue):
+    """One line with the outbox depth and how much has spilled to disk"""
+    pending, spilled, segments, spill_bytes = queue.stats()
+    if spilled:
+        log_msg(f"Outbox depth: {pending} records queued, {spilled} spilled "
+                f"({segments} segments, {spill_bytes / 1024 / 1024:.1f} MB)")
+    else:
+        log_msg(f"Outbox depth: {pending} records queued")
+
+
 def sync_pending_records():
-    """Sync pending records to cloud database"""
-    global pending_records
+    """
+    Drain the outbox to the cloud database in bulk. The outbox cursor only
+    advances after each batch's MySQL commit, so a failure leaves the rest
+    queued on disk for the next run.
+    """
+    queue = get_outbox()
+    try:
+        # Spilled records left over from a previous run or a failed refill
+        queue.refill()
+    except Exception as e:
+        log_msg(f"Error reading outbox spill segments: {e}", "ERROR")
+    if not queue.pending_count():
+        return 0
+    log_outbox_depth(queue)
     
-    with pending_lock:
-        if not pending_records:
-            return 0
-        
-        records_to_sync = pending_records.copy()
-        pending_records = []
+    if not schema.ensure("device_push_logs"):
+        log_msg("device_push_logs is not available, records stay queued for retry", "WARNING")
+        return 0
     
     conn = connect_to_mysql()
     if not conn:
-        # Put records back if we can't connect
-        with pending_lock:
-            pending_records = records_to_sync + pending_records
-        log_msg("Failed to connect to MySQL, records queued for retry", "WARNING")
+        log_msg("Failed to connect to MySQL, records stay queued for retry", "WARNING")
         return 0
     
+    batch_size = load_config().get("SYNC_BATCH_SIZE", 1000)
+    total_synced = 0
     try:
-        cursor = conn.cursor()
-        
-        # Check if table exists, create if not
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS device_push_logs (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                device_sn VARCHAR(50),
-                user_id VARCHAR(50),
-                check_time DATETIME,
-                check_type VARCHAR(10),
-                verify_type VARCHAR(10),
-                work_code VARCHAR(20),
-                raw_data TEXT,
-                received_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                synced_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                INDEX idx_device_sn (device_sn),
-                INDEX idx_user_id (user_id),
-                INDEX idx_check_time (check_time),
-                UNIQUE KEY unique_record (device_sn, user_id, check_time)
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
-        """)
-        
-        insert_query = """
-            INSERT IGNORE INTO device_push_logs 
-            (device_sn, user_id, check_time, check_type, verify_type, work_code, raw_data, received_at)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-        """
-        
-        count = 0
-        for record in records_to_sync:
-            try:
-                values = (
-                    record.get('device_sn', ''),
-                    record.get('user_id', ''),
-                    record.get('check_time'),
-                    record.get('check_type', ''),
-                    record.get('verify_type', ''),
-                    record.get('work_code', ''),
-                    record.get('raw_data', ''),
-                    record.get('received_at')
-                )
-                cursor.execute(insert_query, values)
-                count += 1
-            except Exception as e:
-                log_msg(f"Error inserting record: {e}", "ERROR")
-        
-        conn.commit()
-        log_msg(f"Synced {count} records to cloud database")
-        return count
+        for batch in queue.iter_batches(batch_size):
+            # Outbox rows are (id, *DEVICE_PUSH_LOG_COLUMNS)
+            rows = [row[1:] for row in batch]
+            started = time.perf_counter()
+            result = bulk_insert(conn, "device_push_logs", DEVICE_PUSH_LOG_COLUMNS, rows, skip_bad_rows=True)
+            conn.commit()
+            cloud_sync_batch_seconds.observe(time.perf_counter() - started)
+            cloud_sync_batch_records.observe(len(rows))
+            cloud_sync_records.inc(amount=result.submitted - result.rejected)
+            queue.ack(batch[-1][0])
+            
+            if result.rejected:
+                log_msg(f"{result.rejected} records rejected by MySQL", "ERROR")
+            total_synced += result.submitted - result.rejected
+            log_msg(f"Synced {result.submitted - result.rejected} records to cloud database "
+                    f"({result.inserted} new, {result.ignored} already present)")
+        return total_synced
         
     except Exception as e:
         log_msg(f"Error syncing to MySQL: {e}", "ERROR")
-        # Put records back for retry
-        with pending_lock:
-            pending_records = records_to_sync + pending_records
-        return 0
+        cloud_sync_errors.inc()
+        schema.handle_error("device_push_logs", e)
+        return total_synced
     finally:
         if conn:
             conn.close()
 
 
+# ADMS protocol handling, shared by the threaded and the asyncio server.
+# Each handler takes the parsed query (and body) and returns (status, body).
+
+def handle_adms_request(method, raw_path, body=b""):
+    """
+    Route one ADMS request. raw_path includes the query string; body is a
+    BodyReader streaming the POST body (or the raw bytes). Returns (HTTP
+    status, response text).
+    """
+    started = time.perf_counter()
+    parsed_path = urlparse(raw_path)
+    path = parsed_path.path.rstrip('/')
+    query = parse_qs(parsed_path.query)
+    if not isinstance(body, BodyReader):
+        body = BodyReader.from_bytes(body or b"")
+    
+    try:
+        status, response_text = route_adms_request(method, raw_path, path, query, body)
+    except BodyError as e:
+        # Truncated or malformed body; the device resends the push
+        log_msg(f"Bad {method} body for {path} from {query.get('SN', ['UNKNOWN'])[0]}: {e}", "WARNING")
+        status, response_text = e.status, "ERROR"
+    
+    endpoint = path if path in ADMS_ENDPOINTS else "other"
+    adms_requests.inc((method, endpoint, query.get('SN', [''])[0], str(status)))
+    adms_request_seconds.observe(time.perf_counter() - started, (method, endpoint))
+    return status, response_text
+
+
+def route_adms_request(method, raw_path, path, query, body):
+    """Dispatch to the handler for path"""
+    config = load_config()
+    
+    if method == 'GET' and path == '/metrics':
+        if process_label:
+            # One worker's counters alone would look like resets; the main process merges them all
+            return 404, "Metrics are served by the main process on METRICS_PORT"
+        return 200, metrics.render()
+    
+    if method == 'GET':
+        if config.get("DEBUG_MODE"):
+            log_msg(f"GET {raw_path}", "DEBUG")
+            log_msg(f"Query params: {query}", "DEBUG")
+        
+        if path == '/iclock/cdata':
+            return handle_cdata_get(query)
+        if path == '/iclock/getrequest':
+            return handle_getrequest(query)
+        # Unknown endpoint - still respond OK
+        return 200, "OK"
+    
+    if method == 'POST':
+        if config.get("DEBUG_MODE"):
+            log_msg(f"POST {raw_path}", "DEBUG")
+            log_msg(f"Query params: {query}", "DEBUG")
+            # Only the first bytes are decoded; the handler still gets the whole stream
+            preview = body.peek(BODY_PREVIEW_BYTES).decode('utf-8', errors='replace')
+            log_msg(f"POST body: {preview}...", "DEBUG")
+        
+        if path == '/iclock/cdata':
+            return handle_cdata_post(query, body)
+        if path == '/iclock/devicecmd':
+            return handle_devicecmd(query, body)
+        body.drain()
+        return 200, "OK"
+    
+    return 200, "OK"
+
+
+def handle_cdata_get(query):
+    """
+    Handle device registration/handshake.
+    Device sends: GET /iclock/cdata?SN=xxxxx&options=...
+    Server responds with configuration commands.
+    """
+    device_sn = query.get('SN', ['UNKNOWN'])[0]
+    queue = get_outbox()
+    stamps = {table: queue.get_stamp(device_sn, table) for table in STAMPED_TABLES}
+    
+    log_msg(f"Device handshake from SN: {device_sn} "
+            f"(ATTLOGStamp={stamps['ATTLOG']}, OPERLOGStamp={stamps['OPERLOG']})")
+    
+    # Response tells device what data to send and how often
+    # ATTLOGStamp, OPERLOGStamp are the last stamps we stored for this device,
+    # so it only sends what came after them (0 = everything)
+    # ErrorDelay, Delay are retry intervals
+    # TransTimes is the time range to send data
+    # TransInterval is how often to push (in minutes)
+    response_lines = [
+        f"GET OPTION FROM: {device_sn}",
+        f"ATTLOGStamp={stamps['ATTLOG']}",      # Attendance logs after this stamp
+        f"OPERLOGStamp={stamps['OPERLOG']}",    # Operation logs after this stamp
+        f"ATTPHOTOStamp={stamps['ATTPHOTO']}",  # Attendance photos after this stamp
+        "ErrorDelay=60",       # Retry delay on error (seconds)
+        "Delay=5",             # Delay between data pushes (seconds)
+        "TransTimes=00:00;23:59",  # Time range to send data
+        "TransInterval=1",     # Push interval (minutes)
+        "TransFlag=TransData AttLog OpLog",  # What data to push
+        "Realtime=1",          # Enable realtime push
+        "TimeZone=7",          # Timezone offset (Thailand = UTC+7)
+        "Encrypt=0",           # No encryption
+    ]
+    
+    return 200, "\r\n".join(response_lines)
+
+
+def queue_attlog_batch(batch, stamps, config):
+    """Journal one parsed batch and queue it (with stamps) durably; returns its record count"""
+    rows = list(batch.rows())
+    if rows and config.get("LOG_RAW_DATA"):
+        # Backup copy; queued for the journal's flusher, never written in the request thread
+        log_attendance_to_file(rows)
+    if rows or stamps:
+        # Group-committed with other pushes; only acknowledge what is on disk
+        get_outbox().append(rows, stamps)
+        sync_trigger.notify(len(rows))
+    return len(rows)
+
+
+def handle_cdata_post(query, body):
+    """
+    Handle attendance data POST.
+    Device sends attendance records in the body.
+    
+    Format varies by device, common formats:
+    - Tab-separated: user_id\ttimestamp\tcheck_type\tverify_type\twork_code
+    - Line format: Each line is one record
+    
+    The body is parsed and queued in batches of STREAM_BATCH_RECORDS while
+    it is still arriving, so a large push is never held in memory whole.
+    """
+    config = load_config()
+    device_sn = query.get('SN', [config.get('DEVICE_SN', 'UNKNOWN')])[0]
+    table = query.get('table', ['ATTLOG'])[0].upper()
+    # Device's position after this push; saved only once the push is on disk
+    stamp = query.get('Stamp', query.get('OpStamp', [None]))[0]
+    stamps = [(device_sn, table, stamp)] if stamp and table in STAMPED_TABLES else []
+    
+    log_msg(f"Receiving {table} data from device: {device_sn}")
+    
+    records = 0
+    
+    try:
+        if table == 'ATTLOG':
+            # One pass over the streamed lines, using the layout remembered for this device.
+            # Each batch is queued once the next one starts, so the last carries the stamp.
+            started = time.perf_counter()
+            held = None
+            rejected = 0
+            first_time = last_time = None
+            for batch in attlog_parser.parse_stream(device_sn, body.lines(), datetime.now(),
+                                                    STREAM_BATCH_RECORDS):
+                if held is not None:
+                    records += queue_attlog_batch(held, (), config)
+                held = batch
+                rejected += batch.rejected
+                if len(batch):
+                    first_time = first_time or batch.check_times[0]
+                    last_time = batch.check_times[-1]
+            records += queue_attlog_batch(held, stamps, config)
+            
+            attlog_parse_seconds.observe(time.perf_counter() - started)
+            attlog_lines_parsed.inc((device_sn,), records)
+            if rejected:
+                attlog_lines_rejected.inc((device_sn,), rejected)
+            if records and config.get("DEBUG_MODE"):
+                log_msg(f"Attendance: {records} records, {first_time} .. {last_time}", "DEBUG")
+        
+        else:
+            size = body.drain()
+            if table == 'OPERLOG':
+                # Operation log (admin actions) - log but don't process
+                log_msg(f"Received OPERLOG data: {size} bytes")
+            else:
+                log_msg(f"Unknown table type: {table}")
+            if stamps:
+                get_outbox().append((), stamps)
+    
+    except BodyError:
+        raise
+    except Exception as e:
+        log_msg(f"Error queueing records to outbox: {e}", "ERROR")
+        # An error makes the device resend the push (INSERT IGNORE absorbs what was queued)
+        return 500, "ERROR"
+    
+    log_msg(f"Processed {records} attendance records")
+    
+    # Respond with OK and stamp
+    return 200, f"OK:{records}"
+
+
+def handle_getrequest(query):
+    """
+    Handle device command requests.
+    Device asks: What commands do you have for me?
+    We respond with: No commands (or specific commands if needed)
+    """
+    device_sn = query.get('SN', ['UNKNOWN'])[0]
+    
+    if load_config().get("DEBUG_MODE"):
+        log_msg(f"Command request from device: {device_sn}", "DEBUG")
+    
+    # Respond with OK (no pending commands)
+    # To send commands, format would be: CMD_TYPE PARAM1=VAL1 PARAM2=VAL2
+    return 200, "OK"
+
+
+def handle_devicecmd(query, body):
+    """Handle device command responses"""
+    device_sn = query.get('SN', ['UNKNOWN'])[0]
+    post_data = body.peek(200).decode('utf-8', errors='replace')
+    body.drain()
+    log_msg(f"Command response from {device_sn}: {post_data}")
+    return 200, "OK"
+
+
 class HTTP10RequestHandler(BaseHTTPRequestHandler):
     """
     HTTP 1.0 compatible request handler for ZKTeco/HIP ADMS protocol.
@@ -251,260 +571,28 @@ class HTTP10RequestHandler(BaseHTTPRequestHandler):
                 message = ''
         self.wfile.write(f"HTTP/1.0 {code} {message}\r\n".encode('utf-8'))
     
+    def send_text(self, status, response_body):
+        body = response_body.encode('utf-8')
+        self.send_response_only(status)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
     def do_GET(self):
         """Handle GET requests - typically device handshake/registration"""
-        config = load_config()
-        parsed_path = urlparse(self.path)
-        path = parsed_path.path
-        query = parse_qs(parsed_path.query)
-        
-        if config.get("DEBUG_MODE"):
-            log_msg(f"GET {self.path}", "DEBUG")
-            log_msg(f"Query params: {query}", "DEBUG")
-        
-        if path in ['/iclock/cdata', '/iclock/cdata/']:
-            self.handle_cdata_get(query)
-        elif path in ['/iclock/getrequest', '/iclock/getrequest/']:
-            self.handle_getrequest(query)
-        else:
-            # Unknown endpoint - still respond OK
-            self.send_response_only(200)
-            self.send_header('Content-Type', 'text/plain')
-            self.end_headers()
-            self.wfile.write(b'OK')
+        self.send_text(*handle_adms_request('GET', self.path))
     
     def do_POST(self):
         """Handle POST requests - attendance data submission"""
-        config = load_config()
-        parsed_path = urlparse(self.path)
-        path = parsed_path.path
-        query = parse_qs(parsed_path.query)
-        
-        # Read POST body
-        content_length = int(self.headers.get('Content-Length', 0))
-        post_data = self.rfile.read(content_length).decode('utf-8', errors='replace')
-        
-        if config.get("DEBUG_MODE"):
-            log_msg(f"POST {self.path}", "DEBUG")
-            log_msg(f"Query params: {query}", "DEBUG")
-            log_msg(f"POST body: {post_data[:500]}...", "DEBUG")
-        
-        if path in ['/iclock/cdata', '/iclock/cdata/']:
-            self.handle_cdata_post(query, post_data)
-        elif path in ['/iclock/devicecmd', '/iclock/devicecmd/']:
-            self.handle_devicecmd(query, post_data)
-        else:
-            self.send_response_only(200)
-            self.send_header('Content-Type', 'text/plain')
-            self.end_headers()
-            self.wfile.write(b'OK')
-    
-    def handle_cdata_get(self, query):
-        """
-        Handle device registration/handshake.
-        Device sends: GET /iclock/cdata?SN=xxxxx&options=...
-        Server responds with configuration commands.
-        """
-        config = load_config()
-        device_sn = query.get('SN', ['UNKNOWN'])[0]
-        
-        log_msg(f"Device handshake from SN: {device_sn}")
-        
-        # Response tells device what data to send and how often
-        # ATTLOGStamp, OPERLOGStamp are timestamps for incremental sync
-        # ErrorDelay, Delay are retry intervals
-        # TransTimes is the time range to send data
-        # TransInterval is how often to push (in minutes)
-        response_lines = [
-            f"GET OPTION FROM: {device_sn}",
-            "ATTLOGStamp=0",       # Request all attendance logs from beginning
-            "OPERLOGStamp=0",      # Request all operation logs from beginning  
-            "ATTPHOTOStamp=0",     # Request attendance photos
-            "ErrorDelay=60",       # Retry delay on error (seconds)
-            "Delay=5",             # Delay between data pushes (seconds)
-            "TransTimes=00:00;23:59",  # Time range to send data
-            "TransInterval=1",     # Push interval (minutes)
-            "TransFlag=TransData AttLog OpLog",  # What data to push
-            "Realtime=1",          # Enable realtime push
-            "TimeZone=7",          # Timezone offset (Thailand = UTC+7)
-            "Encrypt=0",           # No encryption
-        ]
-        
-        response_body = "\r\n".join(response_lines)
-        
-        self.send_response_only(200)
-        self.send_header('Content-Type', 'text/plain')
-        self.send_header('Content-Length', str(len(response_body)))
-        self.end_headers()
-        self.wfile.write(response_body.encode('utf-8'))
-    
-    def handle_cdata_post(self, query, post_data):
-        """
-        Handle attendance data POST.
-        Device sends attendance records in the body.
-        
-        Format varies by device, common formats:
-        - Tab-separated: user_id\ttimestamp\tcheck_type\tverify_type\twork_code
-        - Line format: Each line is one record
-        """
-        config = load_config()
-        device_sn = query.get('SN', [config.get('DEVICE_SN', 'UNKNOWN')])[0]
-        table = query.get('table', ['ATTLOG'])[0].upper()
-        
-        log_msg(f"Receiving {table} data from device: {device_sn}")
-        
-        records_processed = 0
-        received_at = datetime.now()
-        
-        if table == 'ATTLOG':
-            # Parse attendance log
-            lines = post_data.strip().split('\n')
-            for line in lines:
-                line = line.strip()
-                if not line:
-                    continue
-                
-                record = self.parse_attlog_line(line, device_sn, received_at)
-                if record:
-                    # Add to pending records
-                    with pending_lock:
-                        pending_records.append(record)
-                    
-                    # Log to file as backup
-                    if config.get("LOG_RAW_DATA"):
-                        log_attendance_to_file(record)
-                    
-                    records_processed += 1
-                    log_msg(f"Attendance: User={record.get('user_id')} Time={record.get('check_time')}")
-        
-        elif table == 'OPERLOG':
-            # Operation log (admin actions) - log but don't process
-            log_msg(f"Received OPERLOG data: {len(post_data)} bytes")
-        
-        else:
-            log_msg(f"Unknown table type: {table}")
-        
-        log_msg(f"Processed {records_processed} attendance records")
-        
-        # Respond with OK and stamp
-        response_body = f"OK:{records_processed}"
-        
-        self.send_response_only(200)
-        self.send_header('Content-Type', 'text/plain')
-        self.send_header('Content-Length', str(len(response_body)))
-        self.end_headers()
-        self.wfile.write(response_body.encode('utf-8'))
-    
-    def parse_attlog_line(self, line, device_sn, received_at):
-        """
-        Parse a single attendance log line.
-        
-        Common formats:
-        1. Tab-separated: user_id\tcheck_time\tcheck_type\tverify_type\twork_code\treserved
-        2. Space-separated: Similar but with spaces
-        3. HIP specific format may vary
-        
-        Returns dict with parsed fields or None if parsing fails.
-        """
+        # Body is streamed to the handler in chunks (Content-Length or chunked)
         try:
-            # Try tab-separated first (most common)
-            if '\t' in line:
-                parts = line.split('\t')
-            else:
-                # Try space-separated
-                parts = line.split()
-            
-            if len(parts) < 2:
-                log_msg(f"Cannot parse line (too few parts): {line}", "WARNING")
-                return None
-            
-            user_id = parts[0].strip()
-            
-            # Parse timestamp - try multiple formats
-            check_time_str = parts[1].strip()
-            check_time = None
-            
-            # Common timestamp formats from ZKTeco/HIP devices
-            time_formats = [
-                "%Y-%m-%d %H:%M:%S",
-                "%Y/%m/%d %H:%M:%S",
-                "%d/%m/%Y %H:%M:%S",
-                "%Y-%m-%dT%H:%M:%S",
-            ]
-            
-            # If time has AM/PM, adjust formats
-            if len(parts) >= 3 and parts[2].upper() in ['AM', 'PM']:
-                check_time_str = f"{parts[1]} {parts[2]}"
-                time_formats = [
-                    "%Y-%m-%d %I:%M:%S %p",
-                    "%Y/%m/%d %I:%M:%S %p",
-                    "%d/%m/%Y %I:%M:%S %p",
-                ]
-                # Adjust part indices
-                check_type = parts[3] if len(parts) > 3 else ''
-                verify_type = parts[4] if len(parts) > 4 else ''
-                work_code = parts[5] if len(parts) > 5 else ''
-            else:
-                check_type = parts[2] if len(parts) > 2 else ''
-                verify_type = parts[3] if len(parts) > 3 else ''
-                work_code = parts[4] if len(parts) > 4 else ''
-            
-            for fmt in time_formats:
-                try:
-                    check_time = datetime.strptime(check_time_str, fmt)
-                    break
-                except ValueError:
-                    continue
-            
-            if not check_time:
-                log_msg(f"Cannot parse timestamp: {check_time_str}", "WARNING")
-                return None
-            
-            return {
-                'device_sn': device_sn,
-                'user_id': user_id,
-                'check_time': check_time.strftime("%Y-%m-%d %H:%M:%S"),
-                'check_type': check_type,
-                'verify_type': verify_type,
-                'work_code': work_code,
-                'raw_data': line,
-                'received_at': received_at.strftime("%Y-%m-%d %H:%M:%S")
-            }
-            
-        except Exception as e:
-            log_msg(f"Error parsing line '{line}': {e}", "ERROR")
-            return None
-    
-    def handle_getrequest(self, query):
-        """
-        Handle device command requests.
-        Device asks: What commands do you have for me?
-        We respond with: No commands (or specific commands if needed)
-        """
-        device_sn = query.get('SN', ['UNKNOWN'])[0]
-        
-        if load_config().get("DEBUG_MODE"):
-            log_msg(f"Command request from device: {device_sn}", "DEBUG")
-        
-        # Respond with OK (no pending commands)
-        # To send commands, format would be: CMD_TYPE PARAM1=VAL1 PARAM2=VAL2
-        response_body = "OK"
-        
-        self.send_response_only(200)
-        self.send_header('Content-Type', 'text/plain')
-        self.send_header('Content-Length', str(len(response_body)))
-        self.end_headers()
-        self.wfile.write(response_body.encode('utf-8'))
-    
-    def handle_devicecmd(self, query, post_data):
-        """Handle device command responses"""
-        device_sn = query.get('SN', ['UNKNOWN'])[0]
-        log_msg(f"Command response from {device_sn}: {post_data[:200]}")
-        
-        self.send_response_only(200)
-        self.send_header('Content-Type', 'text/plain')
-        self.end_headers()
-        self.wfile.write(b'OK')
+            body = BodyReader.from_headers(self.rfile, self.headers)
+        except BodyError as e:
+            log_msg(f"Bad request body from {self.address_string()}: {e}", "WARNING")
+            self.send_text(e.status, "ERROR")
+            return
+        self.send_text(*handle_adms_request('POST', self.path, body))
 
 
 class ThreadedHTTPServer(ThreadingMixIn, HTTPServer):
@@ -513,16 +601,164 @@ class ThreadedHTTPServer(ThreadingMixIn, HTTPServer):
     daemon_threads = True
 
 
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    """Serves /metrics alone, for the separate METRICS_PORT"""
+    
+    def log_message(self, format, *args):
+        pass
+    
+    def do_GET(self):
+        if urlparse(self.path).path.rstrip('/') != '/metrics':
+            self.send_error(404)
+            return
+        body = metrics.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', METRICS_CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_metrics_server(host, port):
+    """Serve /metrics on its own port from a background thread"""
+    try:
+        server = ThreadedHTTPServer((host, port), MetricsRequestHandler)
+    except Exception as e:
+        log_msg(f"Could not start metrics server on {host}:{port}: {e}", "ERROR")
+        return None
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    log_msg(f"Metrics available at http://{host}:{port}/metrics")
+    return server
+
+
 def cloud_sync_worker(interval):
-    """Background worker to sync pending records to cloud"""
-    log_msg(f"Cloud sync worker started (interval: {interval}s)")
+    """
+    Background worker to sync pending records to cloud. Wakes as soon as
+    SYNC_TRIGGER_RECORDS records arrived or the oldest has waited
+    SYNC_MAX_AGE_SECONDS, and at least every SYNC_INTERVAL_SECONDS.
+    """
+    config = load_config()
+    sync_trigger.apply_config(config)
+    log_msg(f"Cloud sync worker started (interval: {interval}s, "
+            f"trigger: {sync_trigger.threshold} records or {sync_trigger.max_age:g}s)")
+    
+    # Records left from a previous run go out on the first trigger check
+    sync_trigger.notify(get_outbox().pending_count())
+    hold_off = False
     
     while True:
         try:
-            time.sleep(interval)
-            sync_pending_records()
+            reason = sync_trigger.wait(interval, hold_off=hold_off)
+            config = load_config()
+            interval = config.get("SYNC_INTERVAL_SECONDS", interval)
+            sync_trigger.apply_config(config)
+            if config.get("DEBUG_MODE"):
+                log_msg(f"Cloud sync triggered by {reason}", "DEBUG")
+            synced = sync_pending_records()
+            # Cloud unreachable: retry on the interval instead of on every push
+            hold_off = not synced and get_outbox().pending_count() > 0
         except Exception as e:
             log_msg(f"Cloud sync worker error: {e}", "ERROR")
+            time.sleep(1)
+
+
+def watch_outbox(poll_interval=1.0):
+    """
+    Prefork mode: records arrive in worker processes, so the uploader sees
+    them through the outbox's id sequence and wakes the sync worker itself.
+    """
+    queue = get_outbox()
+    last_id = queue.last_id()
+    while True:
+        time.sleep(poll_interval)
+        try:
+            current = queue.last_id()
+            if current > last_id:
+                sync_trigger.notify(current - last_id)
+                last_id = current
+        except Exception as e:
+            log_msg(f"Error watching outbox: {e}", "ERROR")
+
+
+def write_metrics_snapshots(path, interval=METRICS_SNAPSHOT_SECONDS):
+    """Prefork worker: keep this process's counters on disk for the main process to merge"""
+    while True:
+        time.sleep(interval)
+        try:
+            metrics.write_snapshot(path)
+        except Exception as e:
+            log_msg(f"Error writing metrics snapshot: {e}", "ERROR")
+
+
+def serve_http(config, host, port, sock=None, mode=None):
+    """Run the threaded or asyncio ADMS server until interrupted; sock is an already listening socket"""
+    mode = (mode or config.get("SERVER_MODE", "threaded")).lower()
+    if mode == "async":
+        server = adms_async_server.AsyncADMSServer(
+            handle_adms_request, host, port,
+            max_connections=config.get("MAX_CONNECTIONS", adms_async_server.DEFAULT_MAX_CONNECTIONS),
+            request_timeout=config.get("REQUEST_TIMEOUT_SECONDS", adms_async_server.DEFAULT_REQUEST_TIMEOUT),
+            worker_threads=config.get("ASYNC_WORKER_THREADS", adms_async_server.DEFAULT_WORKER_THREADS),
+            logger=log_msg,
+            sock=sock
+        )
+        server.run()
+        return
+    
+    if sock is not None:
+        server = ThreadedHTTPServer((host, port), HTTP10RequestHandler, bind_and_activate=False)
+        server.socket.close()
+        server.socket = sock
+        server.server_name, server.server_port = host, port
+    else:
+        server = ThreadedHTTPServer((host, port), HTTP10RequestHandler)
+    log_msg(f"HTTP Server started on {host}:{port}")
+    server.serve_forever()
+
+
+def run_worker(sock, host, port, index):
+    """
+    Entry point of a prefork worker process: parse pushes and queue them in
+    the shared outbox. The main process runs the only cloud sync worker.
+    """
+    global process_label
+    process_label = f"worker-{index}"
+    # terminate() from the supervisor: unwind so the journal is flushed
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    config = load_config()
+    if sock is None:
+        sock = prefork.bind_listener(host, port, reuse_port=True)
+    log_msg(f"Worker started (pid {os.getpid()})")
+    # Per pid, so a restarted worker does not overwrite its predecessor's totals
+    snapshot_path = os.path.join(config.get("WORKER_METRICS_DIR", "worker_metrics"),
+                                 f"{process_label}-{os.getpid()}.json")
+    threading.Thread(target=write_metrics_snapshots, args=(snapshot_path,),
+                     name="metrics-snapshots", daemon=True).start()
+    try:
+        serve_http(config, host, port, sock=sock, mode=config.get("WORKER_SERVER_MODE", "threaded"))
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    except Exception as e:
+        log_msg(f"Worker error: {e}", "ERROR")
+    finally:
+        if journal is not None:
+            journal.close()
+        try:
+            metrics.write_snapshot(snapshot_path)
+        except Exception as e:
+            log_msg(f"Error writing metrics snapshot: {e}", "ERROR")
+
+
+def prepare_worker_metrics(directory):
+    """Start from empty worker snapshots and merge them into this process's /metrics"""
+    os.makedirs(directory, exist_ok=True)
+    for name in os.listdir(directory):
+        if name.endswith(".json") or name.endswith(".tmp"):
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+    metrics.include_snapshots(directory)
 
 
 def get_local_ip():
@@ -544,8 +780,8 @@ def main():
     log_msg("HIP CMI F68S Device Receiver - HTTP 1.0 ADMS Server")
     log_msg("=" * 60)
     
-    # Load configuration
-    config = load_config()
+    # Load configuration (own copy: SYNC_TO_CLOUD is switched off below without credentials)
+    config = dict(load_config())
     host = config.get("SERVER_HOST", "0.0.0.0")
     port = config.get("SERVER_PORT", 8080)
     
@@ -576,6 +812,8 @@ def main():
     
     # Start cloud sync worker thread if enabled
     if config.get("SYNC_TO_CLOUD"):
+        # Create/verify device_push_logs once up front; syncs then reuse the cached result
+        schema.verify_all()
         sync_interval = config.get("SYNC_INTERVAL_SECONDS", 60)
         sync_thread = threading.Thread(
             target=cloud_sync_worker, 
@@ -584,26 +822,50 @@ def main():
         )
         sync_thread.start()
     
+    metrics_port = config.get("METRICS_PORT", 0)
+    if config.get("SERVER_MODE", "threaded").lower() == "prefork":
+        prepare_worker_metrics(config.get("WORKER_METRICS_DIR", "worker_metrics"))
+        if not metrics_port:
+            log_msg("Prefork mode serves /metrics on METRICS_PORT only; set it to scrape the receiver", "WARNING")
+    if metrics_port:
+        start_metrics_server(host, metrics_port)
+    
     # Create and start HTTP server
+    supervisor = None
     try:
-        server = ThreadedHTTPServer((host, port), HTTP10RequestHandler)
-        log_msg(f"HTTP Server started on {host}:{port}")
-        log_msg("Waiting for device connections...")
-        log_msg("Press Ctrl+C to stop")
-        log_msg("")
-        
-        server.serve_forever()
+        if config.get("SERVER_MODE", "threaded").lower() == "prefork":
+            # Workers parse and queue; this process only uploads
+            supervisor = prefork.PreforkSupervisor(run_worker, host, port,
+                                                   workers=config.get("WORKER_PROCESSES", 0), logger=log_msg)
+            threading.Thread(target=watch_outbox, name="outbox-watcher", daemon=True).start()
+            supervisor.start()
+            log_msg("Waiting for device connections...")
+            log_msg("Press Ctrl+C to stop")
+            log_msg("")
+            supervisor.monitor()
+        else:
+            log_msg("Waiting for device connections...")
+            log_msg("Press Ctrl+C to stop")
+            log_msg("")
+            serve_http(config, host, port)
         
     except KeyboardInterrupt:
         log_msg("Server stopped by user")
     except Exception as e:
         log_msg(f"Server error: {e}", "ERROR")
     finally:
+        if supervisor is not None:
+            supervisor.stop()
         # Final sync before exit
         log_msg("Performing final sync...")
         sync_pending_records()
+        if journal is not None:
+            journal.close()
+        mysql_pool.close_all_pools()
         log_msg("Server shutdown complete")
 
 
 if __name__ == "__main__":
+    # Needed by prefork workers in a frozen (PyInstaller) build
+    multiprocessing.freeze_support()
     main()
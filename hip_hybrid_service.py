@@ -4,14 +4,17 @@ Monitors the MS Access database (populated by HIP Premium Time) and syncs to Clo
 """
 import os
 import sys
-import time
 import json
 from datetime import datetime
 from access_sync_manager_pure import PureAccessSyncManager
+from mdb_watcher import MdbChangeWatcher, DEFAULT_QUIET_SECONDS, DEFAULT_POLL_SECONDS
 
 # Use the specific config file
 CONFIG_FILE = "hybrid_config.json"
 
+# Sync even without a detected change this often, so failed uploads are retried
+DEFAULT_FALLBACK_SYNC_SECONDS = 900
+
 def main():
     print("=" * 60)
     print("HIP Hybrid Sync Service")
@@ -34,23 +37,36 @@ def main():
     else:
         print("Database found! Ready to sync.")
         
+    # Sync only when HIP Premium Time has written to the database
+    watcher = MdbChangeWatcher(
+        db_path,
+        quiet_seconds=config.get("WATCH_QUIET_SECONDS", DEFAULT_QUIET_SECONDS),
+        poll_seconds=config.get("WATCH_POLL_SECONDS", DEFAULT_POLL_SECONDS),
+        logger=manager.log
+    )
+    fallback_seconds = config.get("FALLBACK_SYNC_SECONDS", DEFAULT_FALLBACK_SYNC_SECONDS)
+        
     print("-" * 60)
     print("Service running. Press Ctrl+C to stop.")
     
     try:
         while True:
+            # First call returns at once so anything missed while stopped is synced
+            if watcher.wait_for_change(timeout=fallback_seconds):
+                manager.log("Database change detected.")
+            else:
+                manager.log(f"No changes for {fallback_seconds}s; running fallback sync.")
+
             # Run sync cycle
             manager.run_sync_cycle()
             
-            # Wait for next cycle (default 60 seconds)
-            # We use a short cycle for "near realtime" feel
-            time.sleep(30)
-            
     except KeyboardInterrupt:
         print("\nService stopped by user.")
     except Exception as e:
         print(f"\nCritical Error: {e}")
         input("Press Enter to exit...")
+    finally:
+        watcher.close()
 
 if __name__ == "__main__":
     main()
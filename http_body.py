@@ -0,0 +1,153 @@
+"""
+Incremental reader for HTTP request bodies.
+Reads Content-Length or chunked bodies in fixed-size pieces and splits them into lines.
+"""
+
+import io
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+MAX_BODY_BYTES = 64 * 1024 * 1024
+
+# A "line" longer than this is handed on as is rather than buffered further
+MAX_LINE_BYTES = 64 * 1024
+
+MAX_CHUNK_HEADER_BYTES = 1024
+
+
+class BodyError(Exception):
+    def __init__(self, status, message):
+        Exception.__init__(self, message)
+        self.status = status
+
+
+class BodyReader(object):
+    """Single-pass reader of one request body from a file-like rfile"""
+
+    def __init__(self, rfile, content_length=0, chunked=False, chunk_size=DEFAULT_CHUNK_SIZE,
+                 max_bytes=MAX_BODY_BYTES):
+        self.rfile = rfile
+        self.content_length = max(0, int(content_length or 0))
+        self.chunked = chunked
+        self.chunk_size = max(1, int(chunk_size))
+        self.max_bytes = max_bytes
+        self.bytes_read = 0
+        self._remaining = self.content_length   # Content-Length bytes still on the socket
+        self._chunk_left = 0                    # bytes left in the current transfer chunk
+        self._done = not chunked and not self.content_length
+        self._peeked = b""
+
+    @classmethod
+    def from_headers(cls, rfile, headers, chunk_size=DEFAULT_CHUNK_SIZE, max_bytes=MAX_BODY_BYTES):
+        """Reader for the body described by a request's headers (any mapping with .get)"""
+        encoding = (headers.get('Transfer-Encoding') or "").lower()
+        if "chunked" in encoding:
+            return cls(rfile, chunked=True, chunk_size=chunk_size, max_bytes=max_bytes)
+        try:
+            length = int(headers.get('Content-Length') or 0)
+        except ValueError:
+            raise BodyError(400, "invalid Content-Length")
+        if length < 0:
+            raise BodyError(400, "invalid Content-Length")
+        if max_bytes and length > max_bytes:
+            raise BodyError(413, f"body of {length} bytes exceeds {max_bytes}")
+        return cls(rfile, content_length=length, chunk_size=chunk_size, max_bytes=max_bytes)
+
+    @classmethod
+    def from_bytes(cls, data, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Reader over a body that is already in memory (asyncio server)"""
+        return cls(io.BytesIO(data), content_length=len(data), chunk_size=chunk_size, max_bytes=0)
+
+    def _read_raw(self):
+        """Next piece of body data from the socket, or b"" at the end"""
+        if self._done:
+            return b""
+        if self.chunked:
+            data = self._read_chunked()
+        else:
+            data = self.rfile.read(min(self.chunk_size, self._remaining))
+            if not data:
+                raise BodyError(400, f"connection closed after {self.bytes_read} of "
+                                     f"{self.content_length} body bytes")
+            self._remaining -= len(data)
+            if not self._remaining:
+                self._done = True
+        self.bytes_read += len(data)
+        if self.max_bytes and self.bytes_read > self.max_bytes:
+            raise BodyError(413, f"body exceeds {self.max_bytes} bytes")
+        return data
+
+    def _read_chunked(self):
+        while not self._chunk_left:
+            header = self.rfile.readline(MAX_CHUNK_HEADER_BYTES)
+            if not header:
+                raise BodyError(400, "connection closed inside chunked body")
+            header = header.strip()
+            if not header:
+                # CRLF that ended the previous chunk's data
+                continue
+            try:
+                size = int(header.split(b";", 1)[0], 16)
+            except ValueError:
+                raise BodyError(400, f"malformed chunk size {header[:40]!r}")
+            if size == 0:
+                # Skip trailer headers up to the blank line
+                while True:
+                    trailer = self.rfile.readline(MAX_CHUNK_HEADER_BYTES)
+                    if not trailer or not trailer.strip():
+                        break
+                self._done = True
+                return b""
+            self._chunk_left = size
+        data = self.rfile.read(min(self.chunk_size, self._chunk_left))
+        if not data:
+            raise BodyError(400, "connection closed inside chunked body")
+        self._chunk_left -= len(data)
+        return data
+
+    def chunks(self):
+        """Yield the body in pieces of at most about chunk_size bytes"""
+        if self._peeked:
+            data, self._peeked = self._peeked, b""
+            yield data
+        while True:
+            data = self._read_raw()
+            if not data:
+                if self._done:
+                    return
+                continue
+            yield data
+
+    def peek(self, size):
+        """Up to size bytes from the start of the body, left in place for chunks()/lines()"""
+        while len(self._peeked) < size and not self._done:
+            data = self._read_raw()
+            if not data:
+                break
+            self._peeked += data
+        return self._peeked[:size]
+
+    def lines(self, encoding='utf-8', errors='replace'):
+        """Yield decoded lines (without the newline) as the body arrives"""
+        pending = b""
+        for chunk in self.chunks():
+            if pending:
+                chunk = pending + chunk
+            parts = chunk.split(b"\n")
+            pending = parts.pop()
+            if len(pending) > MAX_LINE_BYTES:
+                parts.append(pending)
+                pending = b""
+            for part in parts:
+                yield part.decode(encoding, errors)
+        if pending:
+            yield pending.decode(encoding, errors)
+
+    def read(self):
+        """The rest of the body as bytes (small bodies only)"""
+        return b"".join(self.chunks())
+
+    def drain(self):
+        """Discard the rest of the body; returns the total body size in bytes"""
+        for _ in self.chunks():
+            pass
+        return self.bytes_read
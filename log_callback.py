@@ -0,0 +1,23 @@
+"""
+Logger callbacks with or without a level argument.
+"""
+
+import inspect
+
+
+def _print_logger(message, level="INFO"):
+    print(f"[{level}] {message}")
+
+
+def level_logger(logger=None):
+    """logger as a (message, level) callable; a one-argument logger gets the message only"""
+    if logger is None:
+        return _print_logger
+    try:
+        inspect.signature(logger).bind("", "INFO")
+    except TypeError:
+        return lambda message, level="INFO": logger(message)
+    except ValueError:
+        # No introspectable signature (a builtin); call it with both
+        pass
+    return logger
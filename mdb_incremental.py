@@ -0,0 +1,178 @@
+"""
+Incremental page-level reader for Jet (.mdb) tables, built on access-parser.
+Only data pages that are new or changed since the last read are decoded.
+"""
+
+import struct
+import zlib
+from collections import defaultdict
+
+from checkinout_filter import parse_checktime
+
+try:
+    from access_parser import AccessParser
+    from access_parser.access_parser import AccessTable, TableObj
+    from access_parser.utils import DATA_PAGE_MAGIC, TABLE_PAGE_MAGIC
+    ACCESS_PARSER_AVAILABLE = True
+except ImportError:
+    ACCESS_PARSER_AVAILABLE = False
+
+# Offset of the owning table-definition page number in a data page header (Jet 3 and 4)
+DATA_PAGE_OWNER_OFFSET = 4
+
+
+class IncrementalTableReader(object):
+    """Decodes only new or changed data pages of one table between calls"""
+
+    def __init__(self, db_path, table_name, key_column="checktime", logger=None):
+        self.db_path = db_path
+        self.table_name = table_name
+        self.key_column = key_column
+        self.logger = logger or (lambda message: None)
+
+        # Cached file metadata from the last full AccessParser pass
+        self._version = None
+        self._page_size = None
+        self._tdef_offset = None
+        self._props = None
+
+        # page offset -> (crc32, newest key value on the page or None)
+        self._pages = {}
+
+        # Stats from the last read()
+        self.pages_total = 0
+        self.pages_decoded = 0
+
+    def reset(self):
+        """Forget everything; the next read() decodes the whole table"""
+        self._version = None
+        self._tdef_offset = None
+        self._pages = {}
+
+    def read(self, rescan_from=None):
+        """
+        Return table[column][row_index] for rows on pages that are new or
+        changed, plus pages whose newest key_column value is >= rescan_from
+        (every page when rescan_from is None).
+        """
+        try:
+            return self._read_incremental(rescan_from)
+        except Exception as e:
+            self.logger(f"Incremental read failed ({e}); falling back to full table parse")
+            self.reset()
+            return self._read_full()
+
+    def _read_full(self):
+        db = AccessParser(self.db_path)
+        actual_name = self._find_table_name(db.catalog)
+        if not actual_name:
+            return None
+        return db.parse_table(actual_name)
+
+    def _find_table_name(self, catalog):
+        for name in catalog.keys():
+            if name.lower() == self.table_name.lower():
+                return name
+        return None
+
+    def _load_metadata(self):
+        """Run the full AccessParser once to locate the table definition page"""
+        db = AccessParser(self.db_path)
+        actual_name = self._find_table_name(db.catalog)
+        if not actual_name:
+            raise LookupError(f"Table '{self.table_name}' not found in database")
+
+        self._version = db.version
+        self._page_size = db.page_size
+        self._tdef_offset = db.catalog[actual_name] * db.page_size
+        self._props = db.extra_props.get(actual_name) if db.extra_props else None
+        self._pages = {}
+
+    def _read_incremental(self, rescan_from):
+        if self._tdef_offset is None:
+            self._load_metadata()
+
+        with open(self.db_path, "rb") as f:
+            db_data = f.read()
+
+        page_size = self._page_size
+        table_defs = {}
+        data_pages = {}
+        owned_pages = {}
+        owner = self._tdef_offset // page_size
+
+        for offset in range(0, len(db_data), page_size):
+            page = db_data[offset:offset + page_size]
+            if page.startswith(DATA_PAGE_MAGIC):
+                data_pages[offset] = page
+                if struct.unpack_from("<I", page, DATA_PAGE_OWNER_OFFSET)[0] == owner:
+                    owned_pages[offset] = page
+            elif page.startswith(TABLE_PAGE_MAGIC):
+                table_defs[offset] = page
+
+        if self._tdef_offset not in table_defs:
+            # Table was recreated or the file replaced; relocate it on the next read
+            raise LookupError("table definition page moved")
+
+        table_obj = TableObj(self._tdef_offset, table_defs[self._tdef_offset])
+        access_table = AccessTable(table_obj, self._version, page_size, data_pages, table_defs, self._props)
+
+        result = defaultdict(list)
+        new_pages = {}
+        decoded = 0
+
+        for offset, page in owned_pages.items():
+            crc = zlib.crc32(page)
+            cached = self._pages.get(offset)
+            if cached and cached[0] == crc:
+                newest = cached[1]
+                # Without a watermark nothing is confirmed uploaded, so rescan everything
+                if newest is None or (rescan_from is not None and newest < rescan_from):
+                    new_pages[offset] = cached
+                    continue
+
+            page_rows = self._decode_page(access_table, table_obj, page)
+            decoded += 1
+            new_pages[offset] = (crc, self._newest_key(page_rows))
+            self._append(result, page_rows)
+
+        # Pages that vanished (compacted or reused by another table) are dropped
+        self._pages = new_pages
+        self.pages_total = len(owned_pages)
+        self.pages_decoded = decoded
+        return result
+
+    @staticmethod
+    def _decode_page(access_table, table_obj, page):
+        table_obj.linked_pages = [page]
+        access_table.parsed_table = defaultdict(list)
+        return access_table.parse()
+
+    @staticmethod
+    def _append(result, page_rows):
+        """Append one page's columns, padding with None so columns stay row-aligned"""
+        existing = max((len(values) for values in result.values()), default=0)
+        added = max((len(values) for values in page_rows.values()), default=0)
+        for column in set(result) | set(page_rows):
+            column_values = result[column]
+            column_values.extend([None] * (existing - len(column_values)))
+            values = page_rows.get(column) or []
+            column_values.extend(values)
+            column_values.extend([None] * (added - len(values)))
+
+    def _newest_key(self, page_rows):
+        values = None
+        for column, column_values in page_rows.items():
+            if column.lower() == self.key_column.lower():
+                values = column_values
+                break
+        if not values:
+            return None
+
+        # Same rounding as the watermark filter, so ties are rescanned
+        newest = None
+        for value in values:
+            value = parse_checktime(value)
+            if value is not None and (newest is None or value > newest):
+                newest = value
+        return newest
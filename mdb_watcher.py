@@ -0,0 +1,243 @@
+"""
+Change detector for the HIP Premium Time Access database.
+Blocks until the .mdb (or its .ldb lock file) has changed and the writer has gone quiet.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+import zlib
+
+# Seconds without further changes before a write burst counts as finished
+DEFAULT_QUIET_SECONDS = 3
+
+# Longest wait between fingerprint checks when the wake source may miss writes
+DEFAULT_POLL_SECONDS = 5
+
+# Never debounce longer than this, even if the writer never goes quiet
+DEFAULT_MAX_DEBOUNCE_SECONDS = 60
+
+# Bytes hashed from the start and the end of the .mdb
+FINGERPRINT_BYTES = 4096
+
+
+def lock_file_path(db_path):
+    """Jet's lock file sits next to the database: Pm2014.mdb -> Pm2014.ldb"""
+    base, ext = os.path.splitext(db_path)
+    return base + (".laccdb" if ext.lower() == ".accdb" else ".ldb")
+
+
+class PollWakeSource(object):
+    """Sleeps; every wake-up is followed by a fingerprint check"""
+
+    reliable = False
+
+    def wait(self, timeout):
+        time.sleep(max(0, timeout))
+        return False
+
+    def close(self):
+        pass
+
+
+class InotifyWakeSource(object):
+    """Linux inotify on the database directory, filtered to the watched file names"""
+
+    reliable = True
+
+    IN_MODIFY = 0x00000002
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+    EVENT_HEADER = struct.Struct("iIII")
+
+    def __init__(self, directory, names):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError("inotify not available")
+        self._fd = libc.inotify_init1(os.O_NONBLOCK | getattr(os, "O_CLOEXEC", 0))
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        wd = libc.inotify_add_watch(self._fd, os.fsencode(directory), self.WATCH_MASK)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(errno, f"inotify_add_watch failed for {directory}")
+        self._names = {name.lower() for name in names}
+
+    def wait(self, timeout):
+        """Return True if a watched file changed within timeout seconds"""
+        deadline = time.monotonic() + max(0, timeout)
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            readable, _, _ = select.select([self._fd], [], [], remaining)
+            if not readable:
+                return False
+            if self._drain():
+                return True
+
+    def _drain(self):
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return False
+        relevant = False
+        offset = 0
+        while offset + self.EVENT_HEADER.size <= len(data):
+            _, _, _, name_len = self.EVENT_HEADER.unpack_from(data, offset)
+            offset += self.EVENT_HEADER.size
+            name = data[offset:offset + name_len].rstrip(b"\0").decode("utf-8", "replace")
+            offset += name_len
+            if name.lower() in self._names:
+                relevant = True
+        return relevant
+
+    def close(self):
+        try:
+            os.close(self._fd)
+        except OSError:
+            pass
+
+
+class WindowsChangeWakeSource(object):
+    """FindFirstChangeNotification on the database directory (wakes for any file in it)"""
+
+    reliable = False
+
+    FILE_NOTIFY_CHANGE_FILE_NAME = 0x00000001
+    FILE_NOTIFY_CHANGE_SIZE = 0x00000008
+    FILE_NOTIFY_CHANGE_LAST_WRITE = 0x00000010
+    WAIT_OBJECT_0 = 0x00000000
+    INVALID_HANDLE_VALUE = ctypes.c_void_p(-1).value
+
+    def __init__(self, directory):
+        self._kernel32 = ctypes.windll.kernel32
+        self._kernel32.FindFirstChangeNotificationW.restype = ctypes.c_void_p
+        self._kernel32.FindNextChangeNotification.argtypes = [ctypes.c_void_p]
+        self._kernel32.FindCloseChangeNotification.argtypes = [ctypes.c_void_p]
+        self._kernel32.WaitForSingleObject.argtypes = [ctypes.c_void_p, ctypes.c_uint32]
+        flags = (self.FILE_NOTIFY_CHANGE_FILE_NAME | self.FILE_NOTIFY_CHANGE_SIZE |
+                 self.FILE_NOTIFY_CHANGE_LAST_WRITE)
+        self._handle = self._kernel32.FindFirstChangeNotificationW(directory, False, flags)
+        if not self._handle or self._handle == self.INVALID_HANDLE_VALUE:
+            raise OSError(f"FindFirstChangeNotification failed for {directory}")
+
+    def wait(self, timeout):
+        result = self._kernel32.WaitForSingleObject(self._handle, int(max(0, timeout) * 1000))
+        if result == self.WAIT_OBJECT_0:
+            self._kernel32.FindNextChangeNotification(self._handle)
+            return True
+        return False
+
+    def close(self):
+        try:
+            self._kernel32.FindCloseChangeNotification(self._handle)
+        except Exception:
+            pass
+
+
+def create_wake_source(db_path, logger=None):
+    """Pick the best wake source for this platform, falling back to polling"""
+    log = logger or (lambda message: None)
+    directory = os.path.dirname(os.path.abspath(db_path))
+    names = [os.path.basename(db_path), os.path.basename(lock_file_path(db_path))]
+    try:
+        if sys.platform.startswith("linux"):
+            return InotifyWakeSource(directory, names)
+        if sys.platform == "win32":
+            return WindowsChangeWakeSource(directory)
+    except Exception as e:
+        log(f"Change notifications unavailable ({e}); polling every {DEFAULT_POLL_SECONDS}s")
+    return PollWakeSource()
+
+
+class MdbChangeWatcher(object):
+    """Waits until the Access database changes and its writer has gone quiet"""
+
+    def __init__(self, db_path, quiet_seconds=DEFAULT_QUIET_SECONDS, poll_seconds=DEFAULT_POLL_SECONDS,
+                 max_debounce_seconds=DEFAULT_MAX_DEBOUNCE_SECONDS, logger=None):
+        self.db_path = db_path
+        self.lock_path = lock_file_path(db_path)
+        self.quiet_seconds = quiet_seconds
+        self.poll_seconds = poll_seconds
+        self.max_debounce_seconds = max_debounce_seconds
+        self.logger = logger or (lambda message: None)
+        self._source = create_wake_source(db_path, self.logger)
+        # None until the first call, so the first wait_for_change() returns at once
+        self._last_fingerprint = None
+
+    def close(self):
+        self._source.close()
+
+    def fingerprint(self):
+        """(mtime, size, header/tail hash) of the .mdb plus (mtime, size) of the .ldb"""
+        return self._file_fingerprint(self.db_path, hash_pages=True) + self._file_fingerprint(self.lock_path)
+
+    @staticmethod
+    def _file_fingerprint(path, hash_pages=False):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return (None, None, None) if hash_pages else (None, None)
+        if not hash_pages:
+            return (st.st_mtime_ns, st.st_size)
+        digest = None
+        try:
+            with open(path, "rb") as f:
+                head = f.read(FINGERPRINT_BYTES)
+                if st.st_size > FINGERPRINT_BYTES:
+                    f.seek(max(FINGERPRINT_BYTES, st.st_size - FINGERPRINT_BYTES))
+                    head += f.read(FINGERPRINT_BYTES)
+            digest = zlib.crc32(head)
+        except OSError:
+            pass
+        return (st.st_mtime_ns, st.st_size, digest)
+
+    def _wait_slice(self, remaining):
+        """How long to block on the wake source before re-checking the fingerprint"""
+        if remaining is None:
+            return self.poll_seconds if not self._source.reliable else 3600
+        if not self._source.reliable:
+            return min(remaining, self.poll_seconds)
+        return remaining
+
+    def wait_for_change(self, timeout=None):
+        """
+        Block until the files changed and stayed unchanged for quiet_seconds.
+        Returns True on a change, False if timeout seconds passed without one.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        current = self.fingerprint()
+        while current == self._last_fingerprint:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return False
+            self._source.wait(self._wait_slice(remaining))
+            current = self.fingerprint()
+
+        self._debounce(current)
+        return True
+
+    def _debounce(self, current):
+        """Wait until a quiet_seconds window passes with no change to the files"""
+        started = time.monotonic()
+        while time.monotonic() - started < self.max_debounce_seconds:
+            woke = self._source.wait(self.quiet_seconds)
+            latest = self.fingerprint()
+            if not woke and latest == current:
+                break
+            current = latest
+        else:
+            self.logger(f"Database still being written after {self.max_debounce_seconds}s; syncing anyway")
+        self._last_fingerprint = current
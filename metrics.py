@@ -0,0 +1,243 @@
+"""
+Prometheus-style counters, histograms and gauges with thread-sharded updates.
+"""
+
+import json
+import os
+import threading
+from bisect import bisect_left
+
+from log_callback import level_logger
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; suits anything from a parse to a slow MySQL commit
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Fold finished threads' shards once this many are registered
+MAX_SHARDS = 256
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels_text(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{value}"' for name, value in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Sharded(object):
+    """Per-thread dicts written without locks, merged on collect()"""
+
+    def __init__(self, merge):
+        self._merge = merge          # merge(total_dict, shard_dict)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = []            # (thread, dict)
+        self._retired = {}
+
+    def shard(self):
+        try:
+            return self._local.values
+        except AttributeError:
+            values = self._local.values = {}
+            with self._lock:
+                self._shards.append((threading.current_thread(), values))
+                if len(self._shards) > MAX_SHARDS:
+                    self._fold_finished()
+            return values
+
+    def _fold_finished(self):
+        # Caller holds self._lock; a finished thread never writes its shard again
+        live = []
+        for thread, values in self._shards:
+            if thread.is_alive():
+                live.append((thread, values))
+            else:
+                self._merge(self._retired, values)
+        self._shards = live
+
+    def collect(self):
+        with self._lock:
+            self._fold_finished()
+            total = {}
+            self._merge(total, self._retired)
+            for _, values in self._shards:
+                # dict() copies in one step under the GIL
+                self._merge(total, dict(values))
+        return total
+
+
+class Counter(object):
+    kind = "counter"
+
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self._values = _Sharded(self._merge)
+
+    @staticmethod
+    def _merge(total, shard):
+        for labels, value in shard.items():
+            total[labels] = total.get(labels, 0) + value
+
+    def inc(self, labels=(), amount=1):
+        values = self._values.shard()
+        values[labels] = values.get(labels, 0) + amount
+
+    def totals(self):
+        return self._values.collect()
+
+    def samples(self, extra=()):
+        values = self._values.collect()
+        for other in extra:
+            self._merge(values, other)
+        if not self.label_names and not values:
+            values = {(): 0}
+        for labels, value in sorted(values.items()):
+            yield self.name, _labels_text(self.label_names, labels), value
+
+
+class Histogram(object):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        self._values = _Sharded(self._merge)
+
+    @staticmethod
+    def _merge(total, shard):
+        # Each value is [count per bucket..., count above the last bucket, sum]
+        for labels, counts in shard.items():
+            counts = list(counts)
+            current = total.get(labels)
+            if current is None:
+                total[labels] = counts
+            else:
+                total[labels] = [a + b for a, b in zip(current, counts)]
+
+    def observe(self, value, labels=()):
+        values = self._values.shard()
+        counts = values.get(labels)
+        if counts is None:
+            counts = values[labels] = [0] * (len(self.buckets) + 2)
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def totals(self):
+        return self._values.collect()
+
+    def samples(self, extra=()):
+        values = self._values.collect()
+        for other in extra:
+            self._merge(values, other)
+        if not self.label_names and not values:
+            values = {(): [0] * (len(self.buckets) + 2)}
+        for labels, counts in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                yield (f"{self.name}_bucket",
+                       _labels_text(self.label_names, labels, (("le", _number(float(bound))),)), cumulative)
+            yield f"{self.name}_sum", _labels_text(self.label_names, labels), counts[-1]
+            yield f"{self.name}_count", _labels_text(self.label_names, labels), cumulative
+
+
+class Gauge(object):
+    """Value read from a callback at scrape time; None leaves the sample out"""
+    kind = "gauge"
+
+    def __init__(self, name, help_text, callback):
+        self.name = name
+        self.help = help_text
+        self.callback = callback
+
+    def samples(self, extra=()):
+        value = self.callback()
+        if value is not None:
+            yield self.name, "", value
+
+
+class MetricsRegistry(object):
+    def __init__(self, logger=None):
+        self.logger = level_logger(logger)
+        self._metrics = []
+        self.snapshot_dir = None
+
+    def log(self, message, level="INFO"):
+        self.logger(message, level)
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, label_names=()):
+        return self._add(Counter(name, help_text, label_names))
+
+    def histogram(self, name, help_text, label_names=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, help_text, label_names, buckets))
+
+    def gauge(self, name, help_text, callback):
+        return self._add(Gauge(name, help_text, callback))
+
+    def snapshot(self):
+        """Counter and histogram totals of this process, keyed by metric name"""
+        return {metric.name: [[list(labels), value] for labels, value in metric.totals().items()]
+                for metric in self._metrics if metric.kind != "gauge"}
+
+    def write_snapshot(self, path):
+        """Atomically write snapshot() as JSON for another process to merge"""
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    def include_snapshots(self, directory):
+        """Add the totals in directory's *.json snapshots to every render()"""
+        self.snapshot_dir = directory
+
+    def _read_snapshots(self):
+        extra = {}
+        if not self.snapshot_dir or not os.path.isdir(self.snapshot_dir):
+            return extra
+        for name in sorted(os.listdir(self.snapshot_dir)):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.snapshot_dir, name), encoding='utf-8') as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError) as e:
+                self.log(f"Skipping metrics snapshot {name}: {e}", "WARNING")
+                continue
+            for metric_name, items in snapshot.items():
+                extra.setdefault(metric_name, []).append({tuple(labels): value for labels, value in items})
+        return extra
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        extra = self._read_snapshots()
+        for metric in self._metrics:
+            try:
+                samples = list(metric.samples(extra.get(metric.name, ())))
+            except Exception as e:
+                self.log(f"Metric {metric.name} failed: {e}", "ERROR")
+                continue
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(f"{name}{labels} {_number(value)}" for name, labels, value in samples)
+        return "\n".join(lines) + "\n"
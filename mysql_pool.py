@@ -0,0 +1,259 @@
+"""
+Connection pool for the cloud MySQL database.
+connect() borrows a pinged connection; close() returns it to the pool.
+"""
+
+import threading
+import time
+
+import pymysql
+
+# Maximum connections (idle + borrowed) per pool
+DEFAULT_MAX_SIZE = 4
+
+# Close connections that have been idle longer than this (seconds)
+DEFAULT_IDLE_TIMEOUT = 300
+
+# Recycle connections older than this (seconds)
+DEFAULT_MAX_LIFETIME = 3600
+
+# Ping idle connections older than this before handing them out (seconds)
+DEFAULT_PING_AFTER = 30
+
+# How long acquire() waits for a free connection before giving up (seconds)
+DEFAULT_ACQUIRE_TIMEOUT = 60
+
+
+class PoolExhaustedError(Exception):
+    """Raised when no connection becomes available within the acquire timeout"""
+
+
+class PooledConnection(object):
+    """
+    Proxy around a PyMySQL connection borrowed from a MySQLConnectionPool.
+    Behaves like the underlying connection; close() hands it back to the pool.
+    """
+
+    def __init__(self, pool, raw_conn, created_at):
+        self._pool = pool
+        self._conn = raw_conn
+        self._created_at = created_at
+        self._dirty = False
+        self._released = False
+
+    def cursor(self, *args, **kwargs):
+        self._dirty = True
+        return self._conn.cursor(*args, **kwargs)
+
+    def commit(self):
+        self._conn.commit()
+        self._dirty = False
+
+    def rollback(self):
+        self._conn.rollback()
+        self._dirty = False
+
+    @property
+    def open(self):
+        return not self._released and self._conn.open
+
+    def close(self):
+        """Return the connection to the pool (safe to call more than once)"""
+        if self._released:
+            return
+        self._released = True
+        self._pool.release(self)
+
+    def discard(self):
+        """Close the underlying connection instead of returning it to the pool"""
+        if self._released:
+            return
+        self._released = True
+        self._pool.release(self, discard=True)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None and self._dirty:
+            try:
+                self.rollback()
+            except Exception:
+                pass
+        self.close()
+        return False
+
+
+class MySQLConnectionPool(object):
+    """Thread-safe pool of PyMySQL connections sharing one set of connect() arguments"""
+
+    def __init__(self, connect_kwargs, max_size=DEFAULT_MAX_SIZE, idle_timeout=DEFAULT_IDLE_TIMEOUT,
+                 max_lifetime=DEFAULT_MAX_LIFETIME, ping_after=DEFAULT_PING_AFTER):
+        self.connect_kwargs = dict(connect_kwargs)
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.max_lifetime = max_lifetime
+        self.ping_after = ping_after
+
+        # Idle connections as [raw_conn, created_at, last_used], most recently used last
+        self._idle = []
+        self._in_use = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, timeout=DEFAULT_ACQUIRE_TIMEOUT):
+        """Borrow a healthy connection, opening a new one if needed"""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+
+        while True:
+            with self._cond:
+                self._evict_idle_locked(time.monotonic())
+
+                if self._idle:
+                    raw_conn, created_at, last_used = self._idle.pop()
+                    self._in_use += 1
+                elif self._in_use < self.max_size:
+                    raw_conn = None
+                    self._in_use += 1
+                else:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise PoolExhaustedError(
+                            f"No MySQL connection available after {timeout}s (max {self.max_size})")
+                    self._cond.wait(remaining)
+                    continue
+
+            # Network I/O happens outside the lock
+            try:
+                if raw_conn is None:
+                    return PooledConnection(self, self._open_connection(), time.monotonic())
+
+                if self._is_healthy(raw_conn, created_at, last_used):
+                    return PooledConnection(self, raw_conn, created_at)
+
+                self._close_quietly(raw_conn)
+                return PooledConnection(self, self._open_connection(), time.monotonic())
+            except Exception:
+                with self._cond:
+                    self._in_use -= 1
+                    self._cond.notify()
+                raise
+
+    def release(self, pooled, discard=False):
+        """Return a borrowed connection to the pool"""
+        raw_conn = pooled._conn
+        now = time.monotonic()
+
+        if not discard and pooled._dirty:
+            # Never hand an open transaction to the next borrower
+            try:
+                raw_conn.rollback()
+            except Exception:
+                discard = True
+
+        if not discard and (not raw_conn.open or now - pooled._created_at > self.max_lifetime):
+            discard = True
+
+        if discard:
+            self._close_quietly(raw_conn)
+
+        with self._cond:
+            self._in_use -= 1
+            if not discard:
+                self._idle.append([raw_conn, pooled._created_at, now])
+            self._evict_idle_locked(now)
+            self._cond.notify()
+
+    def close_all(self):
+        """Close every idle connection (borrowed ones are closed when released)"""
+        with self._cond:
+            idle, self._idle = self._idle, []
+        for raw_conn, _, _ in idle:
+            self._close_quietly(raw_conn)
+
+    def stats(self):
+        """Return (idle, in_use) counts"""
+        with self._cond:
+            return len(self._idle), self._in_use
+
+    def _open_connection(self):
+        return pymysql.connect(**self.connect_kwargs)
+
+    def _is_healthy(self, raw_conn, created_at, last_used):
+        now = time.monotonic()
+        if now - created_at > self.max_lifetime:
+            return False
+        if not raw_conn.open:
+            return False
+        if now - last_used > self.ping_after:
+            try:
+                raw_conn.ping(reconnect=False)
+            except Exception:
+                return False
+        return True
+
+    def _evict_idle_locked(self, now):
+        keep = []
+        for entry in self._idle:
+            raw_conn, created_at, last_used = entry
+            if now - last_used > self.idle_timeout or now - created_at > self.max_lifetime:
+                self._close_quietly(raw_conn)
+            else:
+                keep.append(entry)
+        self._idle = keep
+
+    @staticmethod
+    def _close_quietly(raw_conn):
+        try:
+            raw_conn.close()
+        except Exception:
+            pass
+
+
+# Process-wide pools keyed by connection arguments
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _pool_key(connect_kwargs):
+    return tuple(sorted((k, repr(v)) for k, v in connect_kwargs.items()))
+
+
+def get_pool(connect_kwargs):
+    """Return the shared pool for these connect() arguments, creating it on first use"""
+    key = _pool_key(connect_kwargs)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = MySQLConnectionPool(connect_kwargs)
+            _pools[key] = pool
+        return pool
+
+
+def build_connect_kwargs(credentials, **options):
+    """Translate a DB_CONFIG credentials dict into pymysql.connect() arguments"""
+    kwargs = {
+        'host': credentials.get('host', 'localhost'),
+        'user': credentials.get('user', ''),
+        'password': credentials.get('password', ''),
+        'database': credentials.get('database', ''),
+        'port': credentials.get('port', 3306),
+        'charset': 'utf8mb4',
+    }
+    kwargs.update(options)
+    return kwargs
+
+
+def connect(credentials, **options):
+    """Borrow a connection for these credentials; call close() to return it"""
+    return get_pool(build_connect_kwargs(credentials, **options)).acquire()
+
+
+def close_all_pools():
+    """Close idle connections in every pool (used on shutdown)"""
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.close_all()
@@ -0,0 +1,111 @@
+"""
+Compact on-disk overflow segments for the device outbox.
+One gzipped JSON-lines file per group commit, named <seq>-<count>.jsonl.gz.
+"""
+
+import gzip
+import json
+import os
+import re
+import threading
+
+DEFAULT_SPILL_DIR = "outbox_spill"
+
+SEGMENT_PATTERN = re.compile(r"^(\d{12})-(\d+)\.jsonl\.gz$")
+
+
+class SpillSegments(object):
+    """Ordered, append-only set of spill segment files in one directory"""
+
+    def __init__(self, directory=DEFAULT_SPILL_DIR, shared=False):
+        self.directory = directory
+        self.shared = shared
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        # sequence -> (path, record count)
+        self._segments = {}
+        self._next_seq = 1
+        self.rescan()
+
+    def rescan(self):
+        """Re-read the segment listing from the directory"""
+        segments = {}
+        for name in os.listdir(self.directory):
+            match = SEGMENT_PATTERN.match(name)
+            if match:
+                segments[int(match.group(1))] = (os.path.join(self.directory, name), int(match.group(2)))
+            elif name.endswith(".tmp") and not self.shared:
+                # Left by a crash before the rename; its push was never acknowledged
+                # (when shared it may be another process's write in progress)
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+        with self._lock:
+            self._segments = segments
+            self._next_seq = max(max(segments, default=0) + 1, self._next_seq)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._segments)
+
+    def record_count(self):
+        """Records waiting in all segments"""
+        with self._lock:
+            return sum(count for _, count in self._segments.values())
+
+    def size_bytes(self):
+        """Disk space used by all segments"""
+        with self._lock:
+            paths = [path for path, _ in self._segments.values()]
+        total = 0
+        for path in paths:
+            try:
+                total += os.path.getsize(path)
+            except OSError:
+                pass
+        return total
+
+    def write(self, rows):
+        """Durably store rows (tuples of strings) as a new segment. Returns its path."""
+        rows = list(rows)
+        with self._lock:
+            seq = self._next_seq
+            self._next_seq += 1
+        path = os.path.join(self.directory, f"{seq:012d}-{len(rows)}.jsonl.gz")
+        tmp_path = path + ".tmp"
+        try:
+            with open(tmp_path, 'wb') as raw:
+                with gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=6) as f:
+                    f.write("".join(json.dumps(list(row), ensure_ascii=False, separators=(",", ":")) + "\n"
+                                    for row in rows).encode('utf-8'))
+                raw.flush()
+                os.fsync(raw.fileno())
+            os.replace(tmp_path, path)
+        except Exception:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        with self._lock:
+            self._segments[seq] = (path, len(rows))
+        return path
+
+    def paths(self):
+        """Segment paths, oldest first"""
+        with self._lock:
+            return [self._segments[seq][0] for seq in sorted(self._segments)]
+
+    def read(self, path):
+        """Rows of one segment as tuples"""
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            return [tuple(json.loads(line)) for line in f if line.strip()]
+
+    def remove(self, path):
+        """Forget and delete a drained segment"""
+        with self._lock:
+            for seq, (segment_path, _) in list(self._segments.items()):
+                if segment_path == path:
+                    del self._segments[seq]
+        os.remove(path)
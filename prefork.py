@@ -0,0 +1,114 @@
+"""
+Pre-fork worker processes sharing one listening port.
+Workers use SO_REUSEPORT on Linux and an inherited listening socket elsewhere.
+"""
+
+import multiprocessing
+import os
+import socket
+import sys
+import time
+
+from log_callback import level_logger
+
+DEFAULT_BACKLOG = 1024
+
+# A worker slot is not restarted more often than this
+RESTART_DELAY_SECONDS = 5.0
+
+
+def reuse_port_available():
+    """True where SO_REUSEPORT load-balances connections between sockets (Linux)"""
+    return sys.platform.startswith("linux") and hasattr(socket, "SO_REUSEPORT")
+
+
+def bind_listener(host, port, reuse_port=False, backlog=DEFAULT_BACKLOG):
+    """A listening TCP socket; with reuse_port other processes may bind the same port"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        if os.name != "nt":
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind((host, port))
+        sock.listen(backlog)
+    except Exception:
+        sock.close()
+        raise
+    return sock
+
+
+def default_worker_count():
+    return max(1, os.cpu_count() or 1)
+
+
+class PreforkSupervisor(object):
+    """Starts, watches and stops the worker processes"""
+
+    def __init__(self, target, host, port, workers=0, reuse_port=None, logger=None):
+        self.target = target
+        self.host = host
+        self.port = port
+        self.workers = int(workers) if workers and int(workers) > 0 else default_worker_count()
+        self.reuse_port = reuse_port_available() if reuse_port is None else reuse_port
+        self.logger = level_logger(logger)
+        self._context = multiprocessing.get_context("spawn")
+        self._sock = None
+        self._processes = [None] * self.workers
+        self._started_at = [0.0] * self.workers
+        self._stopping = False
+
+    def log(self, message, level="INFO"):
+        self.logger(message, level)
+
+    def start(self):
+        if not self.reuse_port:
+            # Bound here so a port conflict fails the supervisor, not N workers
+            self._sock = bind_listener(self.host, self.port)
+        mode = "SO_REUSEPORT" if self.reuse_port else "shared listening socket"
+        self.log(f"Starting {self.workers} worker processes on {self.host}:{self.port} ({mode})")
+        for index in range(self.workers):
+            self._spawn(index)
+
+    def _spawn(self, index):
+        process = self._context.Process(
+            target=self.target, args=(self._sock, self.host, self.port, index + 1),
+            name=f"receiver-worker-{index + 1}", daemon=True)
+        process.start()
+        self._processes[index] = process
+        self._started_at[index] = time.monotonic()
+
+    def alive(self):
+        return sum(1 for process in self._processes if process is not None and process.is_alive())
+
+    def monitor(self, poll_interval=1.0):
+        """Restart workers that exit until stop() is called (blocks)"""
+        while not self._stopping:
+            time.sleep(poll_interval)
+            for index, process in enumerate(self._processes):
+                if self._stopping or process is None or process.is_alive():
+                    continue
+                if time.monotonic() - self._started_at[index] < RESTART_DELAY_SECONDS:
+                    continue
+                self.log(f"Worker {index + 1} (pid {process.pid}) exited with code {process.exitcode}; "
+                         f"restarting", "WARNING")
+                self._spawn(index)
+
+    def stop(self, timeout=10.0):
+        """Stop every worker, waiting up to timeout seconds before killing them"""
+        self._stopping = True
+        for process in self._processes:
+            if process is not None and process.is_alive():
+                process.terminate()
+        deadline = time.monotonic() + timeout
+        for process in self._processes:
+            if process is None:
+                continue
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                process.kill()
+                process.join(1.0)
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+        self.log("Worker processes stopped")
@@ -0,0 +1,187 @@
+"""
+Per-day digest reconciliation between the Access checkinout table and the
+cloud access_device_logs table; only days whose digests differ are re-uploaded.
+"""
+
+import hashlib
+from datetime import datetime, timedelta
+
+from access_paging import iter_checkinout, DEFAULT_PAGE_SIZE
+from checkinout_filter import parse_checktime
+
+DEFAULT_DAYS = 31
+DEFAULT_BATCH_SIZE = 1000
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+DEFAULT_DEVICE_SN = 'HIP_ACCESS_DB'
+
+# 15 hex digits (60 bits) per row keeps the SUM exact in MySQL's DECIMAL
+CLOUD_DIGEST_QUERY = """
+    SELECT DATE(check_time) AS day, device_sn, COUNT(*) AS row_count,
+           SUM(CAST(CONV(SUBSTRING(MD5(CONCAT_WS('|', COALESCE(badge_number, ''),
+                DATE_FORMAT(check_time, '%%Y-%%m-%%d %%H:%%i:%%s'), COALESCE(device_sn, ''))), 1, 15), 16, 10)
+                AS UNSIGNED)) AS digest
+    FROM access_device_logs
+    WHERE check_time >= %s AND check_time < %s
+    GROUP BY DATE(check_time), device_sn
+"""
+
+
+def record_key(record):
+    """
+    (badge_number, check_time, device_sn) of an Access record as the uploader
+    stores it, or None for a row without a usable check time.
+    """
+    checktime = parse_checktime(record[1])
+    if checktime is None:
+        return None
+    badgenumber, sn = record[0], record[6]
+    return (
+        str(badgenumber) if badgenumber else '',
+        checktime.strftime(TIMESTAMP_FORMAT),
+        str(sn) if sn else DEFAULT_DEVICE_SN,
+    )
+
+
+def row_hash(badge_number, check_time, device_sn):
+    text = '|'.join((badge_number, check_time, device_sn))
+    return int(hashlib.md5(text.encode('utf-8')).hexdigest()[:15], 16)
+
+
+def access_digests(records):
+    """{(day, device_sn): (count, digest)} for an iterable of Access records"""
+    digests = {}
+    for record in records:
+        key = record_key(record)
+        if key is None:
+            continue
+        group = (key[1][:10], key[2])
+        count, digest = digests.get(group, (0, 0))
+        digests[group] = (count + 1, digest + row_hash(*key))
+    return digests
+
+
+def cloud_digests(mysql_conn, since, until):
+    """{(day, device_sn): (count, digest)} for cloud rows with since <= check_time < until"""
+    cursor = mysql_conn.cursor()
+    try:
+        cursor.execute(CLOUD_DIGEST_QUERY, (since.strftime(TIMESTAMP_FORMAT), until.strftime(TIMESTAMP_FORMAT)))
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+
+    digests = {}
+    for row in rows:
+        if isinstance(row, dict):
+            day, device_sn, count, digest = row['day'], row['device_sn'], row['row_count'], row['digest']
+        else:
+            day, device_sn, count, digest = row
+        if day is None:
+            continue
+        digests[(str(day), device_sn or '')] = (int(count), int(digest or 0))
+    return digests
+
+
+def mismatched_days(access, cloud):
+    """Sorted days on which any device's (count, digest) differs between the sides"""
+    return sorted({group[0] for group in set(access) | set(cloud) if access.get(group) != cloud.get(group)})
+
+
+def _day_range(day):
+    start = datetime.strptime(day, "%Y-%m-%d")
+    return start, start + timedelta(days=1)
+
+
+class Reconciler(object):
+    """
+    Compares and repairs a date range.
+
+    access_connect_fn()  - opens an Access (pyodbc) connection
+    mysql_connect_fn()   - borrows a MySQL connection (closed after use)
+    upload_fn(records)   - uploads and commits a batch, raising on failure
+    """
+
+    def __init__(self, access_connect_fn, mysql_connect_fn, upload_fn, batch_size=DEFAULT_BATCH_SIZE,
+                 page_size=DEFAULT_PAGE_SIZE, logger=None):
+        self.access_connect_fn = access_connect_fn
+        self.mysql_connect_fn = mysql_connect_fn
+        self.upload_fn = upload_fn
+        self.batch_size = max(1, int(batch_size))
+        self.page_size = page_size
+        self.logger = logger or print
+
+    def log(self, message):
+        self.logger(message)
+
+    def _access_rows(self, access_conn, since, until):
+        return iter_checkinout(access_conn, page_size=self.page_size, since=since, until=until)
+
+    def _cloud_digests(self, since, until):
+        mysql_conn = self.mysql_connect_fn()
+        if not mysql_conn:
+            raise ConnectionError("Could not connect to MySQL database")
+        try:
+            return cloud_digests(mysql_conn, since, until)
+        finally:
+            mysql_conn.close()
+
+    def _reupload_day(self, access_conn, day):
+        since, until = _day_range(day)
+        uploaded, batch = 0, []
+        for row in self._access_rows(access_conn, since, until):
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                uploaded += self.upload_fn(batch)
+                batch = []
+        if batch:
+            uploaded += self.upload_fn(batch)
+        return uploaded
+
+    def run(self, since, until, repair=True):
+        """
+        Reconcile since <= checktime < until. Returns the list of days that
+        still differ afterwards (empty when both sides agree).
+        """
+        access_conn = self.access_connect_fn()
+        if not access_conn:
+            raise ConnectionError("Could not connect to Access database")
+
+        try:
+            access = access_digests(self._access_rows(access_conn, since, until))
+            cloud = self._cloud_digests(since, until)
+            days = mismatched_days(access, cloud)
+            self.log(f"Reconciled {since:%Y-%m-%d}..{until:%Y-%m-%d}: "
+                     f"{len({group[0] for group in access})} days in Access, {len(days)} differ")
+            if not days or not repair:
+                for day in days:
+                    self._log_day(day, access, cloud)
+                return days
+
+            remaining = []
+            for day in days:
+                uploaded = self._reupload_day(access_conn, day)
+                day_since, day_until = _day_range(day)
+                after = self._cloud_digests(day_since, day_until)
+                day_access = {group: value for group, value in access.items() if group[0] == day}
+                if mismatched_days(day_access, after):
+                    remaining.append(day)
+                    self._log_day(day, day_access, after)
+                else:
+                    self.log(f"{day}: re-uploaded {uploaded} records, digests now match")
+            return remaining
+        finally:
+            access_conn.close()
+
+    def _log_day(self, day, access, cloud):
+        for group in sorted(set(access) | set(cloud)):
+            if group[0] != day or access.get(group) == cloud.get(group):
+                continue
+            access_count = access.get(group, (0, 0))[0]
+            cloud_count = cloud.get(group, (0, 0))[0]
+            if cloud_count > access_count:
+                hint = "cloud has extra or duplicate rows"
+            elif cloud_count < access_count:
+                hint = "cloud is missing rows"
+            else:
+                hint = "same count, different rows"
+            self.log(f"{day} device {group[1]}: Access {access_count} rows, cloud {cloud_count} rows ({hint})")
@@ -1,10 +1,48 @@
 -- Script to remove duplicate records from access_device_logs table
 -- This identifies duplicates based on badge_number, check_time, and device_sn
 -- and keeps only the record with the lowest ID for each group of duplicates
+--
+-- Prefer `python access_to_cloud.py --dedup`, which does the same walk with
+-- progress reporting and resumes after an interruption. This procedure is the
+-- plain-SQL equivalent: it walks the table in id ranges, finds each range's
+-- duplicate groups with GROUP BY / MIN(id) through idx_badge_time, and deletes
+-- in small transactions so live uploaders are never blocked for long.
+-- Re-running it is safe; it only deletes rows that still have a lower-id twin.
 
-DELETE t1 FROM access_device_logs t1
-INNER JOIN access_device_logs t2
-WHERE t1.id > t2.id
-AND t1.badge_number = t2.badge_number
-AND t1.check_time = t2.check_time
-AND t1.device_sn = t2.device_sn;
\ No newline at end of file
+DROP PROCEDURE IF EXISTS remove_access_log_duplicates;
+
+DELIMITER //
+CREATE PROCEDURE remove_access_log_duplicates(IN chunk_size INT)
+BEGIN
+    DECLARE next_id INT;
+    DECLARE max_id INT;
+
+    SELECT MIN(id), MAX(id) INTO next_id, max_id FROM access_device_logs;
+
+    WHILE next_id IS NOT NULL AND next_id <= max_id DO
+        DELETE t FROM access_device_logs t
+        JOIN (
+            SELECT a.badge_number, a.check_time, a.device_sn, MIN(a.id) AS keep_id
+            FROM access_device_logs a
+            JOIN (
+                SELECT DISTINCT badge_number, check_time, device_sn
+                FROM access_device_logs
+                WHERE id >= next_id AND id < next_id + chunk_size
+            ) c ON a.badge_number = c.badge_number AND a.check_time = c.check_time AND a.device_sn = c.device_sn
+            GROUP BY a.badge_number, a.check_time, a.device_sn
+            HAVING COUNT(*) > 1
+        ) g ON t.badge_number = g.badge_number AND t.check_time = g.check_time AND t.device_sn = g.device_sn
+        WHERE t.id >= next_id AND t.id < next_id + chunk_size AND t.id > g.keep_id;
+        COMMIT;
+
+        SELECT CONCAT('Processed ids up to ', LEAST(next_id + chunk_size - 1, max_id), ' of ', max_id) AS progress;
+        SET next_id = next_id + chunk_size;
+        DO SLEEP(0.2);
+    END WHILE;
+END //
+DELIMITER ;
+
+CALL remove_access_log_duplicates(20000);
+DROP PROCEDURE remove_access_log_duplicates;
+
+-- Then add the constraint (see add_unique_constraint.sql)
@@ -0,0 +1,279 @@
+"""
+Cached verification (and light migration) of the cloud MySQL tables.
+Tables are checked once per TTL, or again after an insert fails with a schema error.
+"""
+
+import threading
+import time
+
+from cloud_dedup import Deduplicator
+
+DEFAULT_TTL = 3600
+
+# ER_NO_SUCH_TABLE, ER_BAD_FIELD_ERROR
+SCHEMA_ERROR_CODES = (1146, 1054)
+
+TABLES = {
+    "access_device_logs": {
+        "create": """
+            CREATE TABLE IF NOT EXISTS access_device_logs (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                badge_number VARCHAR(50),
+                check_time DATETIME,
+                check_type VARCHAR(10),
+                verify_code VARCHAR(10),
+                sensor_id VARCHAR(50),
+                work_code VARCHAR(50),
+                device_sn VARCHAR(50),
+                raw_data TEXT,
+                server_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                INDEX idx_badge_time (badge_number, check_time),
+                INDEX idx_check_time (check_time),
+                INDEX idx_device_sn (device_sn),
+                CONSTRAINT unique_badge_time_sn UNIQUE (badge_number, check_time, device_sn)
+            )
+        """,
+        "columns": ("badge_number", "check_time", "check_type", "verify_code", "sensor_id",
+                    "work_code", "device_sn", "raw_data"),
+        "unique": ("unique_badge_time_sn", ("badge_number", "check_time", "device_sn")),
+    },
+    "device_push_logs": {
+        "create": """
+            CREATE TABLE IF NOT EXISTS device_push_logs (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                device_sn VARCHAR(50),
+                user_id VARCHAR(50),
+                check_time DATETIME,
+                check_type VARCHAR(10),
+                verify_type VARCHAR(10),
+                work_code VARCHAR(20),
+                raw_data TEXT,
+                received_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                synced_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                INDEX idx_device_sn (device_sn),
+                INDEX idx_user_id (user_id),
+                INDEX idx_check_time (check_time),
+                UNIQUE KEY unique_record (device_sn, user_id, check_time)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """,
+        "columns": ("device_sn", "user_id", "check_time", "check_type", "verify_type", "work_code",
+                    "raw_data", "received_at"),
+        "unique": ("unique_record", ("device_sn", "user_id", "check_time")),
+    },
+    "device_pull_logs": {
+        "create": """
+            CREATE TABLE IF NOT EXISTS device_pull_logs (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                device_sn VARCHAR(50),
+                user_id VARCHAR(50),
+                check_time DATETIME,
+                check_type VARCHAR(10),
+                verify_type VARCHAR(10),
+                work_code VARCHAR(20),
+                raw_data TEXT,
+                pulled_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                INDEX idx_device_sn (device_sn),
+                INDEX idx_user_id (user_id),
+                INDEX idx_check_time (check_time),
+                UNIQUE KEY unique_record (device_sn, user_id, check_time)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """,
+        "columns": ("device_sn", "user_id", "check_time", "check_type", "verify_type", "work_code", "raw_data"),
+        "unique": ("unique_record", ("device_sn", "user_id", "check_time")),
+    },
+    "device_logs": {
+        "create": """
+            CREATE TABLE IF NOT EXISTS device_logs (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                device_sn VARCHAR(50),
+                user_id VARCHAR(50),
+                check_time DATETIME,
+                status INT,
+                verify_type INT,
+                raw_data TEXT,
+                INDEX idx_check_time (check_time),
+                UNIQUE KEY unique_record (device_sn, user_id, check_time)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """,
+        "columns": ("device_sn", "user_id", "check_time", "status", "verify_type", "raw_data"),
+        # Existing device_logs tables predate this module; never re-key them
+        "unique": None,
+    },
+}
+
+
+def is_schema_error(error):
+    """True if a MySQL error means the table or one of its columns is missing"""
+    args = getattr(error, "args", ())
+    return bool(args) and args[0] in SCHEMA_ERROR_CODES
+
+
+def _value(row, key, index):
+    return row[key] if isinstance(row, dict) else row[index]
+
+
+class SchemaManager(object):
+    """
+    Verifies a set of cloud tables and caches the result.
+
+    connect_fn()  - borrows a MySQL connection (closed after use), or None
+    """
+
+    def __init__(self, connect_fn, tables=None, ttl=DEFAULT_TTL, create_missing=True, dedup_options=None,
+                 logger=None):
+        self.connect_fn = connect_fn
+        self.tables = list(tables or TABLES)
+        self.ttl = ttl
+        self.create_missing = create_missing
+        # Deduplicator keyword arguments (chunk_size, delete_batch, pause_seconds)
+        self.dedup_options = dict(dedup_options or {})
+        self.logger = logger or print
+        # Guards the cache only; MySQL round-trips run without it
+        self._lock = threading.Lock()
+        self._verified = {}
+        # Tables being re-checked right now
+        self._checking = set()
+        # table -> background dedup thread adding its unique key
+        self._dedup_lock = threading.Lock()
+        self._dedup_threads = {}
+
+    def log(self, message):
+        self.logger(message)
+
+    def ensure(self, table):
+        """True if `table` is usable; only touches MySQL when the cache has expired"""
+        with self._lock:
+            verified_at = self._verified.get(table)
+            if verified_at is not None:
+                if time.monotonic() - verified_at < self.ttl:
+                    return True
+                if table in self._checking:
+                    # Another thread is refreshing a table that was fine until now
+                    return True
+            owner = table not in self._checking
+            self._checking.add(table)
+        try:
+            return self._verify([table])
+        finally:
+            if owner:
+                with self._lock:
+                    self._checking.discard(table)
+
+    def verify_all(self):
+        """Check every managed table in one pass; True if all are usable"""
+        return self._verify(self.tables)
+
+    def invalidate(self, table=None):
+        """Forget cached results so the next ensure() checks MySQL again"""
+        with self._lock:
+            if table is None:
+                self._verified.clear()
+            else:
+                self._verified.pop(table, None)
+
+    def handle_error(self, table, error):
+        """Invalidate `table` if `error` is a schema error; returns True if it was"""
+        if is_schema_error(error):
+            self.log(f"Schema error on {table} ({error}); re-verifying before the next batch")
+            self.invalidate(table)
+            return True
+        return False
+
+    def _verify(self, tables):
+        try:
+            conn = self.connect_fn()
+        except Exception as e:
+            self.log(f"Error connecting to verify schema: {e}")
+            conn = None
+        if not conn:
+            return False
+
+        try:
+            started = time.monotonic()
+            cursor = conn.cursor()
+            columns, indexes = self._describe(cursor, tables)
+            results = {table: self._verify_table(cursor, table, columns.get(table), indexes.get(table, set()))
+                       for table in tables}
+            conn.commit()
+            with self._lock:
+                for table, usable in results.items():
+                    if usable:
+                        self._verified[table] = started
+                    else:
+                        self._verified.pop(table, None)
+            return all(results.values())
+        except Exception as e:
+            self.log(f"Error verifying schema of {', '.join(tables)}: {e}")
+            return False
+        finally:
+            conn.close()
+
+    def _describe(self, cursor, tables):
+        """Existing columns and index names per table, in two information_schema queries"""
+        placeholders = ", ".join(["%s"] * len(tables))
+        cursor.execute(f"""
+            SELECT TABLE_NAME AS table_name, COLUMN_NAME AS column_name
+            FROM information_schema.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME IN ({placeholders})
+        """, tuple(tables))
+        columns = {}
+        for row in cursor.fetchall():
+            columns.setdefault(_value(row, "table_name", 0), set()).add(_value(row, "column_name", 1).lower())
+
+        cursor.execute(f"""
+            SELECT DISTINCT TABLE_NAME AS table_name, INDEX_NAME AS index_name
+            FROM information_schema.STATISTICS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME IN ({placeholders})
+        """, tuple(tables))
+        indexes = {}
+        for row in cursor.fetchall():
+            indexes.setdefault(_value(row, "table_name", 0), set()).add(_value(row, "index_name", 1))
+        return columns, indexes
+
+    def _verify_table(self, cursor, table, columns, indexes):
+        spec = TABLES[table]
+        if columns is None:
+            if not self.create_missing:
+                self.log(f"ERROR: {table} table does not exist in MySQL database!")
+                return False
+            cursor.execute(spec["create"])
+            self.log(f"Created missing table {table}")
+            return True
+
+        missing = [name for name in spec["columns"] if name not in columns]
+        if missing:
+            self.log(f"ERROR: {table} is missing columns: {', '.join(missing)}")
+            return False
+
+        unique = spec["unique"]
+        if unique and unique[0] not in indexes:
+            self._add_unique(cursor, table, *unique)
+        return True
+
+    def _add_unique(self, cursor, table, name, key_columns):
+        """
+        Start removing duplicate rows and adding the unique key in a
+        background thread. The table stays usable meanwhile: inserts work
+        without the key, they just cannot skip duplicates yet.
+        """
+        with self._dedup_lock:
+            thread = self._dedup_threads.get(table)
+            if thread is not None and thread.is_alive():
+                return
+            thread = threading.Thread(target=self._dedup, args=(table, name, key_columns),
+                                      name=f"dedup-{table}", daemon=True)
+            self._dedup_threads[table] = thread
+            thread.start()
+        self.log(f"Unique constraint {name} missing on {table}; removing duplicates in the background")
+
+    def _dedup(self, table, name, key_columns):
+        try:
+            if Deduplicator(self.connect_fn, table, key_columns, name, logger=self.logger,
+                            **self.dedup_options).run():
+                self.log(f"Unique constraint {name} added to {table}")
+            else:
+                self.log(f"Unique constraint {name} not added yet; the next check resumes the dedup")
+        except Exception as e:
+            self.log(f"Error ensuring unique constraint on {table}: {e}")
+        # Next ensure() looks at the table again (and restarts an unfinished dedup)
+        self.invalidate(table)
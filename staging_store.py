@@ -0,0 +1,146 @@
+"""
+Local SQLite staging mirror of the Access checkinout table.
+The Access reader stages new punches and the uploader drains rows not yet uploaded.
+"""
+
+import sqlite3
+import threading
+from datetime import datetime
+
+DEFAULT_STAGING_DB = "checkinout_staging.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkinout (
+    id          INTEGER PRIMARY KEY,
+    badgenumber TEXT,
+    checktime   TEXT NOT NULL,
+    checktype   TEXT,
+    verifycode  TEXT,
+    sensorid    TEXT,
+    workcode    TEXT,
+    sn          TEXT,
+    uploaded    INTEGER NOT NULL DEFAULT 0,
+    staged_at   TEXT NOT NULL
+);
+-- NULLs are distinct in SQLite UNIQUE constraints, so key on IFNULL()
+CREATE UNIQUE INDEX IF NOT EXISTS idx_checkinout_unique
+    ON checkinout (IFNULL(badgenumber, ''), checktime, IFNULL(sn, ''));
+CREATE INDEX IF NOT EXISTS idx_checkinout_checktime_sn ON checkinout (checktime, sn);
+CREATE INDEX IF NOT EXISTS idx_checkinout_pending ON checkinout (id) WHERE uploaded = 0;
+"""
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def _text(value):
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.strftime(TIMESTAMP_FORMAT)
+    return str(value)
+
+
+class StagingStore(object):
+    """Thread-safe wrapper around the staging database (one connection, one lock)"""
+
+    def __init__(self, path=DEFAULT_STAGING_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def stage(self, records):
+        """
+        Copy (Badgenumber, checktime, checktype, verifycode, sensorid, workcode, sn)
+        tuples into the store in one transaction. Rows already staged are
+        ignored. Returns the number of new rows.
+        """
+        now = datetime.now().strftime(TIMESTAMP_FORMAT)
+        rows = [tuple(_text(value) for value in record[:7]) + (now,) for record in records]
+        if not rows:
+            return 0
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO checkinout "
+                    "(badgenumber, checktime, checktype, verifycode, sensorid, workcode, sn, staged_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            return self._conn.total_changes - before
+
+    def iter_pending(self, batch_size=500):
+        """
+        Yield batches of rows not yet uploaded, in staging order, as
+        (id, Badgenumber, checktime, checktype, verifycode, sensorid, workcode, sn).
+        """
+        last_id = 0
+        while True:
+            with self._lock:
+                batch = self._conn.execute(
+                    "SELECT id, badgenumber, checktime, checktype, verifycode, sensorid, workcode, sn "
+                    "FROM checkinout WHERE uploaded = 0 AND id > ? ORDER BY id LIMIT ?",
+                    (last_id, batch_size)).fetchall()
+            if not batch:
+                return
+            last_id = batch[-1][0]
+            yield batch
+
+    def mark_uploaded(self, ids):
+        """Flag rows as committed to the cloud database"""
+        ids = list(ids)
+        if not ids:
+            return
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany("UPDATE checkinout SET uploaded = 1 WHERE id = ?", [(i,) for i in ids])
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def requeue(self, since=None, until=None, sn=None):
+        """
+        Clear the uploaded flag for rows with since <= checktime < until
+        (optionally one device), so the next drain re-uploads them.
+        Returns the number of rows requeued.
+        """
+        clauses, params = ["uploaded = 1"], []
+        if since is not None:
+            clauses.append("checktime >= ?")
+            params.append(_text(since))
+        if until is not None:
+            clauses.append("checktime < ?")
+            params.append(_text(until))
+        if sn is not None:
+            clauses.append("sn = ?")
+            params.append(_text(sn))
+        with self._lock:
+            cursor = self._conn.execute(f"UPDATE checkinout SET uploaded = 0 WHERE {' AND '.join(clauses)}", params)
+            return cursor.rowcount
+
+    def rows_between(self, since, until):
+        """Staged rows with since <= checktime < until in (checktime, sn) order"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT badgenumber, checktime, checktype, verifycode, sensorid, workcode, sn "
+                "FROM checkinout WHERE checktime >= ? AND checktime < ? ORDER BY checktime, sn",
+                (_text(since), _text(until))).fetchall()
+
+    def counts(self):
+        """Return (total, pending) row counts"""
+        with self._lock:
+            total = self._conn.execute("SELECT COUNT(*) FROM checkinout").fetchone()[0]
+            pending = self._conn.execute("SELECT COUNT(*) FROM checkinout WHERE uploaded = 0").fetchone()[0]
+        return total, pending
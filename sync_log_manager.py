@@ -1,12 +1,17 @@
 import os
 import glob
 import shutil
-import json
-import time
 import sys
 from datetime import datetime
 import pymysql
-from cryptography.fernet import Fernet
+import mysql_pool
+from config_service import get_config_service
+from credential_provider import get_credential_provider
+from schema_manager import SchemaManager, DEFAULT_TTL as DEFAULT_SCHEMA_TTL
+from cloud_bulk_writer import bulk_insert
+
+# Column order for device_logs inserts
+DEVICE_LOG_COLUMNS = ("device_sn", "user_id", "check_time", "status", "verify_type", "raw_data")
 
 class SyncLogManager:
     """
@@ -21,7 +26,13 @@ class SyncLogManager:
         self.config_file = config_file
         self.cred_file = cred_file
         self.logger_callback = logger_callback if logger_callback else self._default_logger
+        # Parsed once and re-read only when the file changes (see config_service)
+        self.config = get_config_service(config_file, defaults=self._get_default_config(), logger=self.log)
+        # Decrypted once and kept in memory (see credential_provider)
+        self.credentials = get_credential_provider(cred_file, key=self.ENCRYPTION_KEY, logger=self.log)
         self.paused = False
+        # Cached table verification (see get_schema)
+        self._schema = None
 
     def _default_logger(self, message):
         """Default logger prints to stdout"""
@@ -33,16 +44,8 @@ class SyncLogManager:
         self.logger_callback(message)
 
     def load_config(self):
-        """Load public configuration from JSON file"""
-        try:
-            with open(self.config_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except FileNotFoundError:
-            self.log(f"Config file {self.config_file} not found. Using defaults.")
-            return self._get_default_config()
-        except Exception as e:
-            self.log(f"Error loading config: {e}")
-            return self._get_default_config()
+        """Current configuration as an editable dict (served from the shared cache, no disk read)"""
+        return self.config.as_dict()
 
     def _get_default_config(self):
         return {
@@ -52,52 +55,36 @@ class SyncLogManager:
 
     def save_config(self, config):
         """Save public configuration to JSON file"""
-        try:
-            with open(self.config_file, 'w', encoding='utf-8') as f:
-                json.dump(config, f, indent=4, ensure_ascii=False)
-            return True
-        except Exception as e:
-            self.log(f"Error saving config: {e}")
-            return False
+        return self.config.save(config)
 
     def load_encrypted_credentials(self):
-        """Load and decrypt credentials"""
-        try:
-            with open(self.cred_file, 'rb') as f:
-                encrypted_data = f.read()
-            
-            fernet = Fernet(self.ENCRYPTION_KEY)
-            decrypted_data = fernet.decrypt(encrypted_data)
-            credentials = json.loads(decrypted_data.decode())
-            return credentials.get("DB_CONFIG", {})
-        except FileNotFoundError:
-            self.log(f"Encrypted credentials file {self.cred_file} not found!")
-            return {}
-        except Exception as e:
-            self.log(f"Error decrypting credentials: {e}")
-            return {}
+        """Decrypted credentials (cached in memory until the file changes)"""
+        return self.credentials.get()
+
+    def refresh_credentials(self):
+        """Decrypt the credentials file again (e.g. after replacing it); returns True if usable"""
+        return self.credentials.refresh()
 
     def connect_to_mysql_db(self):
         """Connect to the MySQL cloud database"""
         credentials = self.load_encrypted_credentials()
         try:
-            conn = pymysql.connect(
-                host=credentials.get('host', 'localhost'),
-                user=credentials.get('user', ''),
-                password=credentials.get('password', ''),
-                database=credentials.get('database', ''),
-                port=credentials.get('port', 3306),
-                charset='utf8mb4',
-                cursorclass=pymysql.cursors.DictCursor
-            )
+            conn = mysql_pool.connect(credentials, cursorclass=pymysql.cursors.DictCursor)
             return conn
         except Exception as e:
             self.log(f"Error connecting to MySQL database: {e}")
             return None
 
+    def get_schema(self):
+        """Schema manager shared by every run of this manager (created on first use)"""
+        if self._schema is None:
+            ttl = self.config.get().get("SCHEMA_CACHE_TTL", DEFAULT_SCHEMA_TTL)
+            self._schema = SchemaManager(self.connect_to_mysql_db, ["device_logs"], ttl=ttl, logger=self.log)
+        return self._schema
+
     def process_logs(self):
         """Main logic to find, parse, upload, and move log files."""
-        config = self.load_config()
+        config = self.config.get()
         defaults = self._get_default_config()
         
         log_dir = config.get("LOG_DIR", defaults["LOG_DIR"])
@@ -118,16 +105,15 @@ class SyncLogManager:
 
         self.log(f"Found {len(files)} log files. Connecting to database...")
 
+        if not self.get_schema().ensure("device_logs"):
+            self.log("device_logs table is not available; skipping this run.")
+            return
+
         conn = self.connect_to_mysql_db()
         if not conn:
             return
 
         try:
-            cursor = conn.cursor()
-            add_log = ("INSERT IGNORE INTO device_logs "
-                       "(device_sn, user_id, check_time, status, verify_type, raw_data) "
-                       "VALUES (%s, %s, %s, %s, %s, %s)")
-
             for file_path in files:
                 if self.paused:
                     self.log("Sync paused by user.")
@@ -143,7 +129,7 @@ class SyncLogManager:
                     self.log(f"Error reading file {filename}: {e}")
                     continue
 
-                count = 0
+                rows = []
                 for line in lines:
                     line = line.strip()
                     if not line or "---" in line or "Date Export" in line:
@@ -160,15 +146,15 @@ class SyncLogManager:
                             mysql_time = dt.strftime("%Y-%m-%d %H:%M:%S")
 
                             # Hardcoded SN as per original logic, can be improved later
-                            data = ('HIP_DEVICE_1', user_id, mysql_time, 0, 1, line)
-                            cursor.execute(add_log, data)
-                            count += 1
+                            rows.append(('HIP_DEVICE_1', user_id, mysql_time, 0, 1, line))
                         except ValueError:
                             # Skip lines with invalid date formats
                             pass
                 
+                result = bulk_insert(conn, "device_logs", DEVICE_LOG_COLUMNS, rows)
                 conn.commit()
-                self.log(f"-> Uploaded {count} records from {filename}.")
+                self.log(f"-> Uploaded {result.submitted} records from {filename} "
+                         f"({result.inserted} new, {result.ignored} already present).")
 
                 # Move to processed folder
                 try:
@@ -179,6 +165,7 @@ class SyncLogManager:
 
         except Exception as e:
             self.log(f"Database/Sync Error: {e}")
+            self.get_schema().handle_error("device_logs", e)
         finally:
             if conn:
                 conn.close()
@@ -0,0 +1,186 @@
+"""
+Pipelined Access -> Cloud sync engine.
+A reader feeds a bounded batch queue to upload workers; the watermark advances in order.
+"""
+
+import queue
+import threading
+import time
+
+# Number of upload workers
+DEFAULT_WORKERS = 2
+
+# Batches allowed to wait in the queue between reader and uploaders
+DEFAULT_QUEUE_BATCHES = 4
+
+# How often blocked stages re-check the stop flag (seconds)
+POLL_INTERVAL = 0.5
+
+
+class SyncPipeline(object):
+    """
+    Runs one sync pass.
+
+    upload_fn(batch)       - uploads a list of rows; returns the row count or
+                             raises on failure
+    checkpoint_fn(record)  - persists the watermark for the last record of a
+                             fully committed prefix of batches
+    should_stop()          - optional; returning True ends the pass early
+    controller             - optional BatchSizeController; when given it
+                             picks each batch's size and the pause after it
+                             from measured upload latency
+    """
+
+    def __init__(self, upload_fn, checkpoint_fn, batch_size=100, workers=DEFAULT_WORKERS,
+                 queue_batches=DEFAULT_QUEUE_BATCHES, should_stop=None, controller=None, logger=None):
+        self.upload_fn = upload_fn
+        self.checkpoint_fn = checkpoint_fn
+        self.batch_size = max(1, int(batch_size))
+        self.workers = max(1, int(workers))
+        self.queue_batches = max(1, int(queue_batches))
+        self.should_stop = should_stop or (lambda: False)
+        self.controller = controller
+        self.logger = logger or print
+
+        self.total_uploaded = 0
+        self.batches_read = 0
+        self.batches_committed = 0
+        self.failed = False
+        self.stopped = False
+
+        self._batch_queue = queue.Queue(maxsize=self.queue_batches)
+        self._result_queue = queue.Queue()
+        self._stop_event = threading.Event()
+
+    def log(self, message):
+        self.logger(message)
+
+    def _stopping(self):
+        if self._stop_event.is_set():
+            return True
+        if self.should_stop():
+            self.stopped = True
+            self._stop_event.set()
+            return True
+        return False
+
+    def run(self, rows):
+        """Upload every row from the rows iterable. Returns total rows uploaded."""
+        started = time.monotonic()
+
+        workers = [
+            threading.Thread(target=self._upload_worker, name=f"sync-upload-{i + 1}", daemon=True)
+            for i in range(self.workers)
+        ]
+        checkpointer = threading.Thread(target=self._checkpoint_stage, name="sync-checkpoint", daemon=True)
+        for thread in workers:
+            thread.start()
+        checkpointer.start()
+
+        try:
+            self._read_stage(rows)
+        except Exception as e:
+            self.log(f"Error reading records: {e}")
+            self.failed = True
+            self._stop_event.set()
+        finally:
+            # One sentinel per worker, then wait for them to drain
+            for _ in workers:
+                self._put_batch(None, force=True)
+            for thread in workers:
+                thread.join()
+            self._result_queue.put(None)
+            checkpointer.join()
+
+        elapsed = time.monotonic() - started
+        self.log(f"Pipeline finished: {self.batches_committed}/{self.batches_read} batches committed, "
+                 f"{self.total_uploaded} records uploaded in {elapsed:.1f}s")
+        return self.total_uploaded
+
+    def _put_batch(self, item, force=False):
+        """Put into the bounded queue, giving up if the pipeline is stopping"""
+        while True:
+            try:
+                self._batch_queue.put(item, timeout=POLL_INTERVAL)
+                return True
+            except queue.Full:
+                if not force and self._stopping():
+                    return False
+
+    def _current_batch_size(self):
+        return self.controller.batch_size if self.controller else self.batch_size
+
+    def _read_stage(self, rows):
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= self._current_batch_size():
+                if self._stopping() or not self._put_batch((self.batches_read, batch)):
+                    return
+                self.batches_read += 1
+                batch = []
+        if batch and not self._stopping() and self._put_batch((self.batches_read, batch)):
+            self.batches_read += 1
+
+    def _upload_worker(self):
+        while True:
+            item = self._batch_queue.get()
+            if item is None:
+                return
+            seq, batch = item
+            if self._stop_event.is_set():
+                # Drain without uploading; the watermark will not move past this batch
+                continue
+            started = time.monotonic()
+            try:
+                count = self.upload_fn(batch)
+                if count is None:
+                    raise RuntimeError("upload returned no result")
+                self._result_queue.put((seq, True, count, batch[-1]))
+                ok = True
+            except Exception as e:
+                self.log(f"Batch {seq + 1} failed: {e}")
+                self._result_queue.put((seq, False, 0, None))
+                ok = False
+
+            if self.controller:
+                self.controller.record(len(batch), time.monotonic() - started, ok)
+                if self.controller.delay:
+                    self._stop_event.wait(self.controller.delay)
+
+    def _checkpoint_stage(self):
+        next_seq = 0
+        completed = {}
+        while True:
+            item = self._result_queue.get()
+            if item is None:
+                return
+            seq, ok, count, last_record = item
+            if not ok:
+                # Stop the pipeline; nothing from this batch onward is checkpointed
+                self.failed = True
+                self._stop_event.set()
+                completed[seq] = None
+            else:
+                self.total_uploaded += count
+                completed[seq] = (count, last_record)
+
+            while next_seq in completed:
+                entry = completed.pop(next_seq)
+                if entry is None:
+                    # Keep remaining results out of the watermark
+                    completed.clear()
+                    next_seq = float('inf')
+                    break
+                count, last_record = entry
+                try:
+                    self.checkpoint_fn(last_record)
+                except Exception as e:
+                    self.log(f"Error saving checkpoint: {e}")
+                    self.failed = True
+                    self._stop_event.set()
+                    next_seq = float('inf')
+                    break
+                self.batches_committed += 1
+                self.log(f"Batch {next_seq + 1}: {count} records uploaded and checkpointed")
+                next_seq += 1
@@ -7,6 +7,12 @@ import sys
 from datetime import datetime, timedelta
 import json
 from cryptography.fernet import Fernet
+import mysql_pool
+from schema_manager import SchemaManager
+from cloud_bulk_writer import bulk_insert
+
+# Column order for device_logs inserts
+DEVICE_LOG_COLUMNS = ("device_sn", "user_id", "check_time", "status", "verify_type", "raw_data")
 
 # Configuration files
 CONFIG_FILE = "config.json"
@@ -82,28 +88,28 @@ def log_msg(message):
     print(f"[{datetime.now()}] {message}")
     sys.stdout.flush()
 
+def connect_to_mysql_db():
+    try:
+        return mysql_pool.connect(credentials, cursorclass=pymysql.cursors.DictCursor)
+    except Exception as e:
+        log_msg(f"Connection Error: {e}")
+        return None
+
+# device_logs is verified once per TTL instead of on every run
+schema = SchemaManager(connect_to_mysql_db, ["device_logs"], logger=log_msg)
+
 def sync_logs():
     files = glob.glob(os.path.join(LOG_DIR, "*.txt"))
     if not files:
         return
 
+    if not schema.ensure("device_logs"):
+        log_msg("device_logs table is not available; will retry at the next scheduled time")
+        return
+
     conn = None
     try:
-        conn = pymysql.connect(
-            host=credentials.get('host', 'localhost'),
-            user=credentials.get('user', ''),
-            password=credentials.get('password', ''),
-            database=credentials.get('database', ''),
-            port=credentials.get('port', 3306),
-            charset='utf8mb4',
-            cursorclass=pymysql.cursors.DictCursor
-        )
-        cursor = conn.cursor()
-
-        add_log = ("INSERT IGNORE INTO device_logs "
-                   "(device_sn, user_id, check_time, status, verify_type, raw_data) "
-                   "VALUES (%s, %s, %s, %s, %s, %s)")
-
+        conn = mysql_pool.connect(credentials, cursorclass=pymysql.cursors.DictCursor)
         for file_path in files:
             filename = os.path.basename(file_path)
 
@@ -112,7 +118,7 @@ def sync_logs():
             with open(file_path, 'r') as f:
                 lines = f.readlines()
 
-            count = 0
+            rows = []
             for line in lines:
                 line = line.strip()
                 if not line or "---" in line or "Date Export" in line:
@@ -126,13 +132,12 @@ def sync_logs():
                         dt = datetime.strptime(date_str, "%d/%m/%Y %I:%M:%S %p")
                         mysql_time = dt.strftime("%Y-%m-%d %H:%M:%S")
 
-                        data = ('HIP_DEVICE_1', user_id, mysql_time, 0, 1, line)
-                        cursor.execute(add_log, data)
-                        count += 1
+                        rows.append(('HIP_DEVICE_1', user_id, mysql_time, 0, 1, line))
                     except ValueError: pass
 
+            result = bulk_insert(conn, "device_logs", DEVICE_LOG_COLUMNS, rows)
             conn.commit()
-            log_msg(f"-> Uploaded {count} records.")
+            log_msg(f"-> Uploaded {result.submitted} records ({result.inserted} new).")
 
             try:
                 shutil.move(file_path, os.path.join(PROCESSED_DIR, filename))
@@ -141,6 +146,7 @@ def sync_logs():
 
     except Exception as e:
         log_msg(f"Connection Error: {e}")
+        schema.handle_error("device_logs", e)
     finally:
         if conn:
             conn.close()
@@ -0,0 +1,76 @@
+"""
+Wake-up condition for the receiver's cloud sync worker.
+Fires on a record count, the age of the oldest arrival, or the sync interval.
+"""
+
+import threading
+import time
+
+DEFAULT_TRIGGER_RECORDS = 1000
+DEFAULT_MAX_AGE_SECONDS = 5.0
+
+
+class SyncTrigger(object):
+    """Thread-safe counter of unsynced arrivals that the sync worker waits on"""
+
+    def __init__(self, threshold=DEFAULT_TRIGGER_RECORDS, max_age=DEFAULT_MAX_AGE_SECONDS):
+        self.threshold = max(0, int(threshold))
+        self.max_age = max(0.0, float(max_age))
+        self._cond = threading.Condition()
+        self._count = 0
+        self._oldest = None
+
+    @classmethod
+    def from_config(cls, config):
+        """Build from the SYNC_TRIGGER_RECORDS / SYNC_MAX_AGE_SECONDS keys of a config dict"""
+        trigger = cls()
+        trigger.apply_config(config)
+        return trigger
+
+    def apply_config(self, config):
+        """Take edited trigger settings; a waiting worker re-evaluates them"""
+        with self._cond:
+            self.threshold = max(0, int(config.get("SYNC_TRIGGER_RECORDS", self.threshold)))
+            self.max_age = max(0.0, float(config.get("SYNC_MAX_AGE_SECONDS", self.max_age)))
+            self._cond.notify_all()
+
+    def notify(self, records):
+        """Report records that were just queued for the cloud"""
+        if records <= 0:
+            return
+        with self._cond:
+            self._count += records
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            self._cond.notify_all()
+
+    def pending(self):
+        """Records reported since the last wake-up"""
+        with self._cond:
+            return self._count
+
+    def wait(self, interval, hold_off=False):
+        """
+        Block until a trigger fires or interval seconds pass; returns the
+        reason and starts counting afresh for the next wait.
+        """
+        deadline = time.monotonic() + max(0.0, float(interval))
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                if not hold_off:
+                    if self.threshold and self._count >= self.threshold:
+                        reason = "size"
+                        break
+                    if self._oldest is not None and now - self._oldest >= self.max_age:
+                        reason = "age"
+                        break
+                if now >= deadline:
+                    reason = "interval"
+                    break
+                timeout = deadline - now
+                if not hold_off and self._oldest is not None:
+                    timeout = min(timeout, self._oldest + self.max_age - now)
+                self._cond.wait(max(0.0, timeout))
+            self._count, self._oldest = 0, None
+            return reason
@@ -0,0 +1,85 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from metrics import MetricsRegistry
+
+
+def build_registry(messages=None):
+    registry = MetricsRegistry(logger=(messages.append if messages is not None else lambda message: None))
+    requests = registry.counter("adms_requests_total", "ADMS requests", ("endpoint",))
+    latency = registry.histogram("adms_request_seconds", "Handling time", buckets=(0.1, 1.0))
+    registry.gauge("outbox_pending_records", "Unsynced records", lambda: 7)
+    return registry, requests, latency
+
+
+class SnapshotTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.directory = self._tmp.name
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_snapshot_holds_counters_and_histograms_only(self):
+        registry, requests, latency = build_registry()
+        requests.inc(("/iclock/cdata",), 3)
+        latency.observe(0.5)
+        snapshot = registry.snapshot()
+        self.assertEqual(snapshot["adms_requests_total"], [[["/iclock/cdata"], 3]])
+        self.assertEqual(snapshot["adms_request_seconds"], [[[], [0, 1, 0, 0.5]]])
+        self.assertNotIn("outbox_pending_records", snapshot)
+
+    def test_worker_snapshots_are_summed(self):
+        for count in (2, 5):
+            worker, requests, latency = build_registry()
+            requests.inc(("/iclock/cdata",), count)
+            latency.observe(2.0)
+            worker.write_snapshot(os.path.join(self.directory, f"worker-{count}.json"))
+        main, requests, _ = build_registry()
+        requests.inc(("/iclock/cdata",))
+        main.include_snapshots(self.directory)
+        text = main.render()
+        self.assertIn('adms_requests_total{endpoint="/iclock/cdata"} 8', text)
+        self.assertIn('adms_request_seconds_bucket{le="+Inf"} 2', text)
+        self.assertIn("adms_request_seconds_sum 4", text)
+        self.assertIn("outbox_pending_records 7", text)
+
+    def test_dead_worker_totals_are_kept(self):
+        worker, requests, _ = build_registry()
+        requests.inc(("/iclock/cdata",), 4)
+        worker.write_snapshot(os.path.join(self.directory, "worker-1-100.json"))
+        # Its replacement starts from zero under a new pid
+        replacement, requests, _ = build_registry()
+        requests.inc(("/iclock/cdata",), 1)
+        replacement.write_snapshot(os.path.join(self.directory, "worker-1-101.json"))
+        main, _, _ = build_registry()
+        main.include_snapshots(self.directory)
+        self.assertIn('adms_requests_total{endpoint="/iclock/cdata"} 5', main.render())
+
+    def test_partial_and_temporary_files_are_skipped(self):
+        worker, requests, _ = build_registry()
+        requests.inc(("/iclock/cdata",), 2)
+        worker.write_snapshot(os.path.join(self.directory, "worker-1-100.json"))
+        with open(os.path.join(self.directory, "worker-2-200.json"), "w") as f:
+            f.write('{"adms_requests_total": [[["/iclock/cd')
+        with open(os.path.join(self.directory, "worker-3-300.json.tmp"), "w") as f:
+            f.write('{"adms_requests_total": [[["/iclock/cdata"], 50]]}')
+        messages = []
+        main, _, _ = build_registry(messages)
+        main.include_snapshots(self.directory)
+        self.assertIn('adms_requests_total{endpoint="/iclock/cdata"} 2', main.render())
+        self.assertTrue(any("worker-2-200.json" in message for message in messages))
+
+    def test_missing_directory_renders_own_values(self):
+        main, requests, _ = build_registry()
+        requests.inc(("/iclock/cdata",))
+        main.include_snapshots(os.path.join(self.directory, "absent"))
+        self.assertIn('adms_requests_total{endpoint="/iclock/cdata"} 1', main.render())
+
+
+if __name__ == "__main__":
+    unittest.main()